@@ -0,0 +1,161 @@
+import glob
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+# 录制的 API 页面目录：每个文件是一页原始 JSON（含 collection / next_href）
+FIXTURE_DIR = os.getenv("BENCH_FIXTURE_DIR", os.path.join(os.path.dirname(__file__), "recorded"))
+
+_BASE_TIME = datetime(2015, 1, 1)
+
+
+def _iso(rng, days=3650):
+    return (_BASE_TIME + timedelta(seconds=rng.randint(0, days * 86400))).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def make_track(rng, track_id, user_id):
+    return {
+        "artwork_url": f"https://i1.sndcdn.com/artworks-{track_id}-large.jpg",
+        "caption": None,
+        "commentable": True,
+        "comment_count": rng.randint(0, 500),
+        "created_at": _iso(rng),
+        "description": "generated with AI " * rng.randint(0, 5),
+        "downloadable": rng.random() < 0.1,
+        "download_count": rng.randint(0, 50),
+        "duration": rng.randint(30000, 400000),
+        "full_duration": rng.randint(30000, 400000),
+        "embeddable_by": "all",
+        "genre": rng.choice(["Electronic", "Hip-hop & Rap", "Ambient", None]),
+        "has_downloads_left": True,
+        "id": track_id,
+        "kind": "track",
+        "label_name": None,
+        "last_modified": _iso(rng),
+        "license": "all-rights-reserved",
+        "likes_count": rng.randint(0, 100000),
+        "permalink": f"track-{track_id}",
+        "permalink_url": f"https://soundcloud.com/user-{user_id}/track-{track_id}",
+        "playback_count": rng.randint(0, 10000000),
+        "public": True,
+        "publisher_metadata": {
+            "id": track_id,
+            "urn": f"soundcloud:tracks:{track_id}",
+            "artist": f"artist {user_id}",
+            "contains_music": True,
+            "isrc": None,
+            "explicit": False,
+        } if rng.random() < 0.7 else None,
+        "purchase_title": None,
+        "purchase_url": None,
+        "release_date": rng.choice([None, _iso(rng)]),
+        "reposts_count": rng.randint(0, 5000),
+        "secret_token": None,
+        "sharing": "public",
+        "state": "finished",
+        "streamable": True,
+        "tag_list": "ai music \"lo fi\"",
+        "title": f"Track {track_id}",
+        "uri": f"https://api.soundcloud.com/tracks/{track_id}",
+        "urn": f"soundcloud:tracks:{track_id}",
+        "user_id": user_id,
+        "visuals": {"urn": f"soundcloud:users:{user_id}", "enabled": True, "visuals": []}
+        if rng.random() < 0.2 else None,
+        "waveform_url": f"https://wave.sndcdn.com/{track_id}_m.json",
+        "display_date": _iso(rng),
+        # 真实页面里每条 track 都带完整的 media / user 对象，解码开销主要在这里
+        "media": {"transcodings": [
+            {"url": f"https://api-v2.soundcloud.com/media/soundcloud:tracks:{track_id}/{preset}",
+             "preset": preset, "duration": 30000, "snipped": False,
+             "format": {"protocol": protocol, "mime_type": "audio/mpeg"}, "quality": "sq"}
+            for preset, protocol in (("mp3_1_0", "hls"), ("mp3_1_0", "progressive"),
+                                     ("opus_0_0", "hls"), ("aac_160k", "hls"))
+        ]},
+        "user": make_user(rng, user_id),
+        "station_urn": f"soundcloud:system-playlists:track-stations:{track_id}",
+        "station_permalink": f"track-stations:{track_id}",
+        "track_authorization": "x" * 300,
+        "monetization_model": "NOT_APPLICABLE",
+        "policy": "ALLOW",
+    }
+
+
+def make_user(rng, user_id):
+    return {
+        "avatar_url": f"https://i1.sndcdn.com/avatars-{user_id}-large.jpg",
+        "city": rng.choice(["Berlin", "", None, "Shanghai"]),
+        "comments_count": rng.randint(0, 100),
+        "country_code": rng.choice(["DE", "US", None]),
+        "created_at": _iso(rng),
+        "creator_subscriptions": [{"product": {"id": "free"}}],
+        "creator_subscription": {"product": {"id": "free"}},
+        "description": "AI music producer " * rng.randint(0, 4),
+        "followers_count": rng.randint(0, 1000000),
+        "followings_count": rng.randint(0, 2000),
+        "first_name": "",
+        "full_name": f"User {user_id}",
+        "groups_count": 0,
+        "id": user_id,
+        "kind": "user",
+        "last_modified": _iso(rng),
+        "last_name": "",
+        "likes_count": rng.randint(0, 5000),
+        "playlist_likes_count": rng.randint(0, 100),
+        "permalink": f"user-{user_id}",
+        "permalink_url": f"https://soundcloud.com/user-{user_id}",
+        "playlist_count": rng.randint(0, 20),
+        "reposts_count": None,
+        "track_count": rng.randint(0, 300),
+        "uri": f"https://api.soundcloud.com/users/{user_id}",
+        "urn": f"soundcloud:users:{user_id}",
+        "username": f"user{user_id}",
+        "verified": rng.random() < 0.01,
+        "visuals": {"urn": f"soundcloud:users:{user_id}", "enabled": True,
+                    "visuals": [{"urn": "v", "entry_time": 0, "visual_url": "https://i1.sndcdn.com/v.jpg"}]},
+        "badges": {"pro": False, "creator_mid_tier": False, "pro_unlimited": False, "verified": False},
+        "station_urn": f"soundcloud:system-playlists:artist-stations:{user_id}",
+        "station_permalink": f"artist-stations:{user_id}",
+    }
+
+
+def synthetic_pages(kind="tracks", pages=50, page_size=100, seed=42):
+    """Pages shaped like the API's paginated collections, for when no recording is available."""
+    rng = random.Random(seed)
+    out = []
+    next_id = 100000
+    for i in range(pages):
+        if kind == "tracks":
+            collection = [make_track(rng, next_id + j, rng.randint(1, 10 ** 9)) for j in range(page_size)]
+        else:
+            collection = [make_user(rng, next_id + j) for j in range(page_size)]
+        next_id += page_size
+        next_href = None
+        if i < pages - 1:
+            next_href = f"https://api-v2.soundcloud.com/{kind}?offset={(i + 1) * page_size}&limit={page_size}"
+        out.append({"collection": collection, "next_href": next_href})
+    return out
+
+
+def load_pages(kind="tracks", pages=50, page_size=100):
+    """Recorded pages from ``FIXTURE_DIR/<kind>/*.json`` if present, synthetic ones otherwise."""
+    files = sorted(glob.glob(os.path.join(FIXTURE_DIR, kind, "*.json")))
+    if not files:
+        return synthetic_pages(kind, pages, page_size)
+    out = []
+    for path in files:
+        with open(path, "rb") as f:
+            out.append(json.loads(f.read()))
+    return out
+
+
+def load_raw_pages(kind="tracks", pages=50, page_size=100):
+    """Like ``load_pages`` but returns each page as the raw response bytes."""
+    files = sorted(glob.glob(os.path.join(FIXTURE_DIR, kind, "*.json")))
+    if not files:
+        return [json.dumps(p, ensure_ascii=False).encode() for p in synthetic_pages(kind, pages, page_size)]
+    out = []
+    for path in files:
+        with open(path, "rb") as f:
+            out.append(f.read())
+    return out
@@ -0,0 +1,80 @@
+import json
+import time
+
+from src.bench.fixtures import load_raw_pages
+from src.util import fastjson
+from src.util.fastjson import RAW, TRACKS, decode_page
+
+ROUNDS = 5
+# 用户记录里每个字段都会被序列化进 _raw；track 只序列化 visuals
+TRACK_NESTED = ("visuals",)
+
+
+def stdlib_tracks(raw):
+    page = json.loads(raw)
+    for t in page["collection"]:
+        for k in TRACK_NESTED:
+            json.dumps(t.get(k), ensure_ascii=False)
+    return page
+
+
+def fast_tracks(raw):
+    page = decode_page(raw, TRACKS)
+    for t in page["collection"]:
+        for k in TRACK_NESTED:
+            fastjson.dumps(t.get(k))
+    return page
+
+
+def stdlib_users(raw):
+    page = json.loads(raw)
+    for u in page["collection"]:
+        for v in u.values():
+            json.dumps(v, ensure_ascii=False)
+    return page
+
+
+def fast_users(raw):
+    page = decode_page(raw, RAW)
+    for u in page["collection"]:
+        for v in u.values():
+            fastjson.dumps(v)
+    return page
+
+
+def bench(fn, pages):
+    """Best-of-ROUNDS microseconds per 100-record page."""
+    best = None
+    records = sum(len(json.loads(p)["collection"]) for p in pages)
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        for raw in pages:
+            fn(raw)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / records * 100 * 1e6
+
+
+def check_parity(pages, schema):
+    for raw in pages:
+        expected = json.loads(raw)
+        got = decode_page(raw, schema)
+        assert got["next_href"] == expected.get("next_href")
+        for e, g in zip(expected["collection"], got["collection"]):
+            assert all(e.get(k) == v for k, v in g.items()), "typed decode changed a field value"
+
+
+def main():
+    print(f"fastjson backend: {fastjson.BACKEND}")
+    for kind, schema, before_fn, after_fn in (("tracks", TRACKS, stdlib_tracks, fast_tracks),
+                                              ("users", RAW, stdlib_users, fast_users)):
+        pages = load_raw_pages(kind)
+        check_parity(pages, schema)
+        before = bench(before_fn, pages)
+        after = bench(after_fn, pages)
+        print(f"{kind}: stdlib {before:,.0f} us/page, fast {after:,.0f} us/page "
+              f"(saves {before - after:,.0f} us per 100 records, {before / after:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import logging
+import queue
+import time
+
+from src.util.logger import LOG_FORMAT, DroppingQueueHandler, RepeatFilter, TextFormatter
+
+CALLS = 20000
+# 模拟被阻塞的 stderr（管道另一端读得慢）：每次写入耗时
+SLOW_WRITE = 0.0005
+
+
+class SlowStream:
+    def write(self, text):
+        time.sleep(SLOW_WRITE)
+
+    def flush(self):
+        pass
+
+
+def per_call(log, calls=CALLS):
+    started = time.perf_counter()
+    for i in range(calls):
+        log(i)
+    return (time.perf_counter() - started) / calls
+
+
+def bench_logger(name, handler):
+    log = logging.getLogger(f"bench.{name}")
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    log.handlers = [handler]
+    return log
+
+
+def main():
+    user = {"id": 1, "username": "x" * 40}
+    log = bench_logger("filtered", logging.NullHandler())
+    eager = per_call(lambda i: log.debug(f"worker {i} {user}"))
+    lazy = per_call(lambda i: log.debug("worker %s %s", i, user))
+    print(f"filtered debug line: f-string {eager * 1e6:.2f} us, lazy {lazy * 1e6:.2f} us")
+
+    stream = logging.StreamHandler(SlowStream())
+    stream.setFormatter(TextFormatter(LOG_FORMAT))
+    calls = 200
+    blocking = per_call(lambda i: bench_logger("sync", stream).warning("HTTP %s for user %s", 429, i), calls)
+    queued_handler = DroppingQueueHandler(queue.Queue(calls * 2))
+    queued = per_call(lambda i: bench_logger("queued", queued_handler).warning("HTTP %s for user %s", 429, i), calls)
+    print(f"warning with a blocked stream: direct {blocking * 1e6:.0f} us, queued {queued * 1e6:.1f} us")
+
+    repeat = logging.NullHandler()
+    repeat.addFilter(RepeatFilter(interval=60))
+    log = bench_logger("repeat", repeat)
+    suppressed = per_call(lambda i: log.warning("HTTP %s via %s", 429, "proxy", extra={"log_key": ("http", 429)}))
+    print(f"repeated warning suppressed by log_key: {suppressed * 1e6:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import importlib
+import multiprocessing
+import os
+import resource
+import socket
+import time
+import traceback
+
+HOST = "127.0.0.1"
+PORT = 18080
+CRAWLERS = ("track", "snowball", "followers", "user_query")
+# 种子用户 id：连续区间，stub 为每个 id 生成固定的数据
+SEED_START = 1000
+USERS = 200
+SNOWBALL_DEPTH = 1
+FOLLOWER_TARGET = 193
+STUB_START_TIMEOUT = 10
+# WorkQueue 等待其他主机租约时的轮询间隔，单进程回放时不需要等 5 秒
+QUEUE_IDLE_SLEEP = 0.1
+# 每隔多久记录一次并发窗口大小
+WINDOW_SAMPLE_INTERVAL = 0.5
+
+# 子进程在导入爬虫之前设置的环境：所有请求指向 stub，不走代理，不限速
+BENCH_ENV = {
+    "SOUNDCLOUD_CLIENT_ID": "bench",
+    "SOUNDCLOUD_CLIENT_IDS": "bench",
+    "CLICKHOUSE_DATABASE": "bench",
+    "PROXY_POOL": "",
+    "PROXY_URL": "",
+    "PROXY_TUNNEL": "",
+    "RATE_LIMIT_RPS": "100000",
+    "RATE_LIMIT_PROXY_RPS": "100000",
+    "RATE_LIMIT_REDIS": "0",
+    # 种子就是 stub 的用户区间，不用旧版的位置区间
+    "TRACK_SEED_ID_START": "0",
+    "METRICS_PORT": "0",
+    "METRICS_SUMMARY_INTERVAL": "0",
+}
+
+
+def run_stub(port, latency, error_rate, throttle_rate, retry_after, capacity):
+    from src.bench.stub_server import serve
+    serve(port, HOST, latency=latency, error_rate=error_rate, throttle_rate=throttle_rate, retry_after=retry_after,
+          capacity=capacity)
+
+
+def wait_for_port(port, timeout=STUB_START_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((HOST, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"API stub did not start on {HOST}:{port}")
+
+
+def crawler_entry(name, options):
+    """Coroutine running one crawler entry point the way its ``__main__`` does."""
+    from src.util.shard import Shard
+    if name == "track":
+        module = importlib.import_module("src.crawler.soundcloud_track_crawler")
+        return module.crawl_batch(Shard(), incremental=False)
+    if name == "snowball":
+        module = importlib.import_module("src.crawler.soundcloud_user_snowball")
+        module.MAX_DEPTH = options["depth"]
+        return module.main(Shard())
+    if name == "followers":
+        module = importlib.import_module("src.crawler.soundcloud_follower")
+        module.create_table()
+        return module.fetch_and_store(FOLLOWER_TARGET, module.RANGES)
+    module = importlib.import_module("src.crawler.soundcloud_user_query")
+    return module.main(module.KEYWORDS)
+
+
+def run_crawler(name, port, options, results):
+    """Child process: stand-ins first, then the crawler, then report what it did."""
+    os.environ.update(BENCH_ENV, SOUNDCLOUD_API_BASE=f"http://{HOST}:{port}", LOG_LEVEL=options["log_level"])
+    if options["cache"]:
+        os.environ.update(RESPONSE_CACHE_PATH=options["cache"], RESPONSE_CACHE_MODE=options["cache_mode"])
+    from src.bench import standins
+    recorder = standins.install(range(SEED_START, SEED_START + options["users"]))
+    from src.util import work_queue
+    from src.util.metrics import CACHE_REQUESTS, CONCURRENCY, HTTP_REQUESTS
+    work_queue.IDLE_SLEEP = QUEUE_IDLE_SLEEP
+
+    coro = crawler_entry(name, options)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    error = None
+    windows = []
+
+    async def crawl():
+        async def sample_window():
+            while True:
+                windows.extend(v for k, v in CONCURRENCY.current().items() if k[1] == "limit")
+                await asyncio.sleep(WINDOW_SAMPLE_INTERVAL)
+        sampler = asyncio.create_task(sample_window())
+        try:
+            await coro
+        finally:
+            sampler.cancel()
+    try:
+        asyncio.run(crawl())
+    except Exception:
+        error = traceback.format_exc()
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    rows = recorder.total_rows()
+    pages = sum(v for k, v in HTTP_REQUESTS.values.items() if k[0] == "200")
+    results.put({
+        "crawler": name,
+        "seconds": wall,
+        "pages": pages,
+        "requests": HTTP_REQUESTS.total(),
+        "cache": {k[0]: v for k, v in CACHE_REQUESTS.values.items()},
+        "rows": rows,
+        "tables": dict(recorder.rows),
+        "cpu_us_per_row": cpu / rows * 1e6 if rows else None,
+        # Linux 上 ru_maxrss 的单位是 KB
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "window": (min(windows), sum(windows) / len(windows), max(windows)) if windows else None,
+        "error": error,
+    })
+
+
+def run(name, port, options):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=run_crawler, args=(name, port, options, results), name=f"bench-{name}")
+    proc.start()
+    result = results.get()
+    proc.join()
+    return result
+
+
+def report(result):
+    seconds = max(result["seconds"], 1e-9)
+    cpu = result["cpu_us_per_row"]
+    print(f"{result['crawler']:<11} {result['pages']:>7} pages {result['pages'] / seconds:>8.1f}/s  "
+          f"{result['rows']:>8} rows {result['rows'] / seconds:>9.0f}/s  "
+          f"cpu {'-' if cpu is None else f'{cpu:.1f}'} us/row  peak rss {result['peak_rss_mb']:.0f} MB  "
+          f"({result['requests']} requests, {seconds:.1f}s)")
+    print(f"{'':<11} rows by table: {result['tables']}")
+    if result["cache"]:
+        print(f"{'':<11} response cache: {result['cache']}")
+    if result["window"]:
+        print(f"{'':<11} concurrency window min/mean/max: {result['window'][0]}/{result['window'][1]:.1f}/"
+              f"{result['window'][2]}")
+    if result["error"]:
+        print(f"{'':<11} FAILED:\n{result['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the crawlers against a local replay of the SoundCloud API.")
+    parser.add_argument("crawler", nargs="?", default="all", choices=CRAWLERS + ("all",))
+    parser.add_argument("--users", type=int, default=USERS, help="seed users for the track and snowball crawlers")
+    parser.add_argument("--depth", type=int, default=SNOWBALL_DEPTH, help="snowball expansion depth")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--latency", type=float, default=0.05, help="mean API response delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=None, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--capacity", type=int, default=0,
+                        help="requests the stub serves at once, the rest queue (0 = unlimited)")
+    parser.add_argument("--cache", default="", help="response cache file (SQLite); empty = no cache")
+    parser.add_argument("--cache-mode", default="readwrite", choices=("readwrite", "offline"))
+    parser.add_argument("--log-level", default="ERROR", help="crawler log level")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    stub = ctx.Process(target=run_stub, args=(args.port, args.latency, args.error_rate, args.throttle_rate,
+                                              args.retry_after, args.capacity), name="api-stub", daemon=True)
+    stub.start()
+    try:
+        wait_for_port(args.port)
+        options = {"users": args.users, "depth": args.depth, "log_level": args.log_level, "cache": args.cache,
+                   "cache_mode": args.cache_mode}
+        print(f"latency {args.latency}s, 503 rate {args.error_rate}, 429 rate {args.throttle_rate}, "
+              f"{args.users} seed users")
+        for name in (CRAWLERS if args.crawler == "all" else (args.crawler,)):
+            report(run(name, args.port, options))
+    finally:
+        stub.terminate()
+        stub.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import re
+import sys
+import threading
+import types
+from contextlib import contextmanager
+
+try:
+    import fakeredis
+except ImportError:  # 可选依赖，只有回放基准需要
+    fakeredis = None
+
+# query_row_block_stream 每个 block 的行数
+BLOCK_ROWS = 10000
+
+_AFTER = re.compile(r"\bid > (\d+)")
+_UNTIL = re.compile(r"\bid <= (\d+)")
+_SHARD = re.compile(r"\bid % (\d+) = (\d+)")
+_LIMIT = re.compile(r"\bLIMIT (\d+)")
+
+
+class _Result:
+    result_rows = []
+
+
+class RecordingClickHouse:
+    """
+    ClickHouse stand-in for the replay benchmark: DDL is kept, inserts are
+    counted per table instead of stored, and seed queries
+    (``SELECT DISTINCT id ... WHERE id > N ... LIMIT W``) are answered from
+    ``seed_ids``. Other queries return no rows.
+    """
+
+    def __init__(self, seed_ids):
+        self.seed_ids = sorted(set(seed_ids))
+        self.commands = []
+        self.rows = {}
+        self.inserts = 0
+        self.lock = threading.Lock()
+
+    def command(self, sql, *args, **kwargs):
+        self.commands.append(sql)
+
+    def insert(self, table, data, column_names=None, column_oriented=False, **kwargs):
+        n = len(data[0]) if column_oriented and data else len(data)
+        # AsyncBatchWriter 在线程池里调用 insert
+        with self.lock:
+            self.rows[table] = self.rows.get(table, 0) + n
+            self.inserts += 1
+
+    def query(self, sql, *args, **kwargs):
+        return _Result()
+
+    def _seeds(self, sql):
+        after = _AFTER.search(sql)
+        until = _UNTIL.search(sql)
+        shard = _SHARD.search(sql)
+        limit = _LIMIT.search(sql)
+        ids = [i for i in self.seed_ids
+               if (not after or i > int(after.group(1)))
+               and (not until or i <= int(until.group(1)))
+               and (not shard or i % int(shard.group(1)) == int(shard.group(2)))]
+        return ids[:int(limit.group(1))] if limit else ids
+
+    @contextmanager
+    def query_row_block_stream(self, sql, *args, **kwargs):
+        ids = self._seeds(sql)
+        yield ([(i,) for i in ids[start:start + BLOCK_ROWS]] for start in range(0, len(ids), BLOCK_ROWS))
+
+    def total_rows(self):
+        with self.lock:
+            return sum(self.rows.values())
+
+    def disconnect(self):
+        pass
+
+
+def create_redis():
+    """In-process Redis with Lua support (the work queue runs scripts)."""
+    if fakeredis is None:
+        raise RuntimeError("The replay benchmark needs fakeredis and lupa: pip install 'fakeredis[lua]'")
+    return fakeredis.FakeRedis()
+
+
+def install(seed_ids):
+    """
+    Register a ``src.util.db`` backed by the stand-ins, before any crawler
+    module is imported; returns the ClickHouse recorder.
+    """
+    clickhouse_client = RecordingClickHouse(seed_ids)
+    redis_client = create_redis()
+    module = types.ModuleType("src.util.db")
+    module.clickhouse_client = clickhouse_client
+    module.redis_client = redis_client
+    module.close_connections = lambda: None
+
+    def migrate_table(table_name, create_table_fn):
+        create_table_fn(f"{table_name}_old")
+    module.migrate_table = migrate_table
+    sys.modules["src.util.db"] = module
+    return clickhouse_client
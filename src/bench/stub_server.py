@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import random
+import zlib
+from datetime import datetime, timedelta
+from functools import lru_cache
+from urllib.parse import quote
+
+from aiohttp import web
+
+from src.bench.fixtures import load_pages
+from src.util import fastjson
+
+DEFAULT_PORT = 18080
+# 每个用户的 track 数 / 粉丝数在 [0, 上限] 之间，由用户 id 决定，多次运行结果一致
+MAX_TRACKS = 250
+MAX_FOLLOWERS = 8
+# follower 爬虫的目标账号有一个很长的粉丝列表
+BIG_ACCOUNTS = {193: 20000}
+SEARCH_RESULTS = 1000
+ID_SPACE = 10 ** 9
+PAGE_CACHE = 4096
+# 最新一条 track 的创建时间，往后每条早一天（列表按时间倒序）
+NEWEST_TRACK = datetime(2025, 1, 1)
+
+
+class Replay:
+    """
+    Deterministic SoundCloud API: every user id maps to a fixed profile,
+    track list and follower list, so each run serves the same pages and
+    ``next_href`` chains. Records are copied from the recorded fixtures
+    (``BENCH_FIXTURE_DIR``, synthetic pages when none are recorded) with
+    their ids rewritten.
+    """
+
+    def __init__(self, max_tracks=MAX_TRACKS, max_followers=MAX_FOLLOWERS, search_results=SEARCH_RESULTS,
+                 big_accounts=None, base_url=""):
+        self.max_tracks = max_tracks
+        self.max_followers = max_followers
+        self.search_results = search_results
+        self.big_accounts = BIG_ACCOUNTS if big_accounts is None else big_accounts
+        self.base_url = base_url
+        self.track_templates = [t for p in load_pages("tracks") for t in p["collection"]]
+        self.user_templates = [u for p in load_pages("users") for u in p["collection"]]
+        self.page = lru_cache(maxsize=PAGE_CACHE)(self._page)
+
+    # --- deterministic data ---
+    def track_total(self, uid):
+        return random.Random(uid * 31 + 1).randint(0, self.max_tracks)
+
+    def follower_total(self, uid):
+        if uid in self.big_accounts:
+            return self.big_accounts[uid]
+        return random.Random(uid * 31 + 2).randint(0, self.max_followers)
+
+    def profile(self, uid):
+        user = dict(self.user_templates[uid % len(self.user_templates)])
+        user.update(id=uid, username=f"user{uid}", permalink=f"user-{uid}", urn=f"soundcloud:users:{uid}",
+                    track_count=self.track_total(uid), followers_count=self.follower_total(uid))
+        return user
+
+    def track(self, uid, index):
+        track = dict(self.track_templates[(uid + index) % len(self.track_templates)])
+        track_id = uid * 1000 + index
+        track.update(id=track_id, user_id=uid, urn=f"soundcloud:tracks:{track_id}",
+                     created_at=(NEWEST_TRACK - timedelta(days=index)).strftime("%Y-%m-%dT%H:%M:%SZ"))
+        return track
+
+    def follower_id(self, uid, index):
+        return (uid * 7919 + index * 104729) % ID_SPACE + 1
+
+    def search_id(self, query, index):
+        # 关键词变体之间部分重叠，和真实搜索一样
+        return (zlib.crc32(query.lower().replace(" ", "").encode()) % 1000 * 50 + index) % ID_SPACE + 1
+
+    # --- pages ---
+    def _page(self, kind, key, offset, limit):
+        if kind == "tracks":
+            total = self.track_total(key)
+            items = [self.track(key, i) for i in range(offset, min(offset + limit, total))]
+            path = f"/users/{key}/tracks"
+        elif kind == "followers":
+            total = self.follower_total(key)
+            items = [self.profile(self.follower_id(key, i)) for i in range(offset, min(offset + limit, total))]
+            path = f"/users/{key}/followers"
+        else:
+            total = self.search_results
+            items = [self.profile(self.search_id(key, i)) for i in range(offset, min(offset + limit, total))]
+            path = f"/search/users?q={quote(key)}"
+        next_href = None
+        if offset + limit < total:
+            sep = "&" if "?" in path else "?"
+            next_href = f"{self.base_url}{path}{sep}offset={offset + limit}&limit={limit}"
+        return fastjson.dumps({"collection": items, "next_href": next_href}).encode()
+
+
+def _int(request, name, default):
+    try:
+        return int(request.query.get(name, default))
+    except ValueError:
+        return default
+
+
+def create_app(replay, latency=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=None, seed=0, capacity=0):
+    """
+    aiohttp app serving ``replay``. Every request waits ``latency`` seconds
+    (+-50% jitter); ``throttle_rate`` of them get a 429 (with
+    ``Retry-After`` if set) and ``error_rate`` a 503. With ``capacity``,
+    at most that many requests are served at once and the rest queue, so
+    latency grows with concurrency like on an overloaded proxy.
+    """
+    rng = random.Random(seed)
+    slots = asyncio.Semaphore(capacity) if capacity else None
+    stats = {"requests": 0, "throttled": 0, "errors": 0}
+
+    @web.middleware
+    async def faults(request, handler):
+        stats["requests"] += 1
+        if latency:
+            delay = latency * rng.uniform(0.5, 1.5)
+            if slots is None:
+                await asyncio.sleep(delay)
+            else:
+                async with slots:
+                    await asyncio.sleep(delay)
+        roll = rng.random()
+        if roll < throttle_rate:
+            stats["throttled"] += 1
+            headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+            return web.Response(status=429, text="rate limited", headers=headers)
+        if roll < throttle_rate + error_rate:
+            stats["errors"] += 1
+            return web.Response(status=503, text="unavailable")
+        return await handler(request)
+
+    def page(kind, key, request, default_limit):
+        body = replay.page(kind, key, _int(request, "offset", 0), _int(request, "limit", default_limit))
+        return web.Response(body=body, content_type="application/json")
+
+    async def tracks(request):
+        return page("tracks", int(request.match_info["uid"]), request, 50)
+
+    async def followers(request):
+        return page("followers", int(request.match_info["uid"]), request, 50)
+
+    async def search(request):
+        return page("search", request.query.get("q", ""), request, 50)
+
+    async def user(request):
+        return web.Response(body=fastjson.dumps(replay.profile(int(request.match_info["uid"]))).encode(),
+                            content_type="application/json")
+
+    async def users(request):
+        ids = [int(x) for x in request.query.get("ids", "").split(",") if x.strip().isdigit()]
+        return web.Response(body=fastjson.dumps([replay.profile(uid) for uid in ids]).encode(),
+                            content_type="application/json")
+
+    async def stats_view(request):
+        return web.json_response(stats)
+
+    app = web.Application(middlewares=[faults])
+    app.router.add_get("/users/{uid:\\d+}/tracks", tracks)
+    app.router.add_get("/users/{uid:\\d+}/followers", followers)
+    app.router.add_get("/users/{uid:\\d+}", user)
+    app.router.add_get("/users", users)
+    app.router.add_get("/search/users", search)
+    app.router.add_get("/_stats", stats_view)
+    return app
+
+
+def serve(port=DEFAULT_PORT, host="127.0.0.1", latency=0.0, error_rate=0.0, throttle_rate=0.0,
+          retry_after=None, capacity=0, **replay_options):
+    """Run the stub in the foreground (the replay benchmark starts it in its own process)."""
+    replay = Replay(base_url=f"http://{host}:{port}", **replay_options)
+    app = create_app(replay, latency, error_rate, throttle_rate, retry_after, capacity=capacity)
+    web.run_app(app, host=host, port=port, print=None, access_log=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local replay of the SoundCloud API pages the crawlers use.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean response delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=None, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--capacity", type=int, default=0, help="requests served at once (0 = unlimited)")
+    args = parser.parse_args()
+    serve(args.port, latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+          retry_after=args.retry_after, capacity=args.capacity)
+
+
+if __name__ == "__main__":
+    main()
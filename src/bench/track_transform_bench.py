@@ -0,0 +1,45 @@
+import copy
+import time
+
+from src.bench.fixtures import load_pages
+from src.util.track_rows import transform_track_to_ck, transform_tracks_columnar
+
+ROUNDS = 5
+
+
+def bench(fn, pages):
+    best = None
+    rows = sum(len(p["collection"]) for p in pages)
+    for _ in range(ROUNDS):
+        # 旧的逐行转换会改写输入，每轮都用新副本
+        data = [copy.deepcopy(p["collection"]) for p in pages]
+        started = time.perf_counter()
+        for collection in data:
+            fn(collection)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return rows / best
+
+
+def row_path(collection):
+    return [transform_track_to_ck(t) for t in collection]
+
+
+def check_parity(pages):
+    for page in pages:
+        rows = row_path(copy.deepcopy(page["collection"]))
+        columns = transform_tracks_columnar(page["collection"])
+        assert [list(r) for r in zip(*columns)] == rows, "columnar transform differs from per-row transform"
+
+
+def main():
+    pages = load_pages("tracks")
+    check_parity(pages)
+    before = bench(row_path, pages)
+    after = bench(transform_tracks_columnar, pages)
+    print(f"per-row transform:  {before:,.0f} rows/s")
+    print(f"columnar transform: {after:,.0f} rows/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
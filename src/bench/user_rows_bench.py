@@ -0,0 +1,168 @@
+import json
+import time
+from datetime import datetime
+
+from dateutil import parser as date_parser
+
+from src.bench.fixtures import load_pages
+from src.util.user_rows import RAW_COLUMNS, RAW_FULL, RAW_MODES, UserRowEncoder
+
+ROUNDS = 5
+
+
+# --- 旧实现（三个爬虫里复制的 insert_records 逐行版本），只用于对照 ---
+def _flatten_json(y):
+    out = {}
+    def flatten(x, name=''):
+        if type(x) is dict:
+            for a in x:
+                flatten(x[a], f'{name}{a}_')
+        elif type(x) is list:
+            out[name[:-1]] = json.dumps(x, ensure_ascii=False)
+        else:
+            out[name[:-1]] = x
+    flatten(y)
+    return out
+
+def _none_to_empty(val):
+    if val is None:
+        return ""
+    if isinstance(val, str):
+        return val
+    return str(val)
+
+def _none_to_zero(val):
+    if val is None:
+        return 0
+    try:
+        return int(val)
+    except Exception:
+        return 0
+
+def _safe_json(obj):
+    try:
+        return json.dumps(obj, ensure_ascii=False)
+    except Exception:
+        return ""
+
+def _parse_dt(val):
+    if not val:
+        return datetime(1970, 1, 1, 0, 0, 0)
+    try:
+        return datetime.fromisoformat(val.replace("Z", "+00:00"))
+    except Exception:
+        try:
+            return date_parser.parse(val)
+        except Exception:
+            return datetime(1970, 1, 1, 0, 0, 0)
+
+def legacy_row(rec):
+    flat = _flatten_json(rec)
+    row = [
+        _none_to_zero(flat.get('id', 0)), _none_to_empty(flat.get('avatar_url')),
+        _none_to_empty(flat.get('city')), _none_to_zero(flat.get('comments_count')),
+        _none_to_empty(flat.get('country_code')),
+        _parse_dt(flat.get('created_at') or '1970-01-01 00:00:00'),
+        [_safe_json(rec.get('creator_subscriptions', []))], _safe_json(rec.get('creator_subscription', {})),
+        _none_to_empty(flat.get('description')), _none_to_zero(flat.get('followers_count')),
+        _none_to_zero(flat.get('followings_count')), _none_to_empty(flat.get('first_name')),
+        _none_to_empty(flat.get('full_name')), _none_to_zero(flat.get('groups_count')),
+        _none_to_empty(flat.get('kind')),
+        _parse_dt(flat.get('last_modified') or '1970-01-01 00:00:00'),
+        _none_to_empty(flat.get('last_name')), _none_to_zero(flat.get('likes_count')),
+        _none_to_zero(flat.get('playlist_likes_count')), _none_to_empty(flat.get('permalink')),
+        _none_to_empty(flat.get('permalink_url')), _none_to_zero(flat.get('playlist_count')),
+        rec.get('reposts_count', 0), _none_to_zero(flat.get('track_count')),
+        _none_to_empty(flat.get('uri')), _none_to_empty(flat.get('urn')),
+        _none_to_empty(flat.get('username')), int(flat.get('verified', False)),
+        _safe_json(rec.get('visuals', {})), _safe_json(rec.get('badges', {})),
+        _none_to_empty(flat.get('station_urn')), _none_to_empty(flat.get('station_permalink')),
+        [_none_to_empty(k) for k in rec], [_safe_json(v) for v in rec.values()],
+    ]
+    return row
+
+
+def legacy_path(collection):
+    return [legacy_row(r) for r in collection]
+
+
+def _normalize(value):
+    # 新编码器输出紧凑 JSON，比较前统一格式
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    if isinstance(value, str) and value[:1] in ("{", "[", '"'):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+# 合成数据覆盖不到的取值：缺字段、None、字符串数字、嵌套对象出现在字符串列
+EDGE_CASES = [
+    {"id": 1},
+    {"id": "2", "city": None, "followers_count": "15", "likes_count": None, "verified": 0,
+     "created_at": "2020-02-30T00:00:00Z", "last_modified": "2021-03-04 05:06:07"},
+    {"id": 3, "description": {"a": 1}, "username": ["x", "y"], "track_count": 4.0,
+     "reposts_count": None, "visuals": None, "badges": {"pro": True}, "created_at": "",
+     "full_name": "Ünïcode 名字", "urn": 12345},
+]
+
+
+def check_parity(pages, encoder):
+    for page in pages + [{"collection": EDGE_CASES}]:
+        expected = legacy_path(page["collection"])
+        got = [list(r) for r in zip(*encoder.encode(page["collection"]))]
+        assert len(got) == len(expected)
+        for e, g in zip(expected, got):
+            for col, a, b in zip(encoder.column_names, e, g):
+                assert _normalize(a) == _normalize(b), f"column {col}: {a!r} != {b!r}"
+
+
+def bench(fn, pages):
+    best = None
+    rows = sum(len(p["collection"]) for p in pages)
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        for page in pages:
+            fn(page["collection"])
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return rows / best
+
+
+def _payload_size(value):
+    if isinstance(value, list):
+        return sum(_payload_size(v) for v in value)
+    if isinstance(value, str):
+        return len(value.encode())
+    return 8
+
+
+def raw_bytes_per_row(encoder, pages):
+    """Uncompressed bytes of the _raw column(s) per row, as sent to ClickHouse."""
+    n_raw = len(RAW_COLUMNS[encoder.raw_mode])
+    total = rows = 0
+    for page in pages:
+        columns = encoder.encode(page["collection"])
+        total += sum(_payload_size(c) for c in columns[len(columns) - n_raw:]) if n_raw else 0
+        rows += len(page["collection"])
+    return total / rows
+
+
+def main():
+    pages = load_pages("users")
+    encoder = UserRowEncoder(raw_mode=RAW_FULL)
+    check_parity(pages, encoder)
+    before = bench(legacy_path, pages)
+    after = bench(encoder.encode, pages)
+    print(f"legacy per-row insert_records: {before:,.0f} rows/s")
+    print(f"UserRowEncoder (columnar):     {after:,.0f} rows/s ({after / before:.2f}x)")
+    for mode in RAW_MODES:
+        enc = UserRowEncoder(raw_mode=mode)
+        print(f"  _raw={mode:<9} {bench(enc.encode, pages):>10,.0f} rows/s, "
+              f"{raw_bytes_per_row(enc, pages):>6,.0f} _raw bytes/row")
+
+
+if __name__ == "__main__":
+    main()
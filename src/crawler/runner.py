@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import importlib
+import multiprocessing
+import os
+import time
+import traceback
+
+from src.util.logger import logger
+from src.util.shard import Shard
+
+# 可运行的爬虫：名称 -> (模块, 协程入口)，入口接受 shard 参数
+TARGETS = {
+    "track": ("src.crawler.soundcloud_track_crawler", "crawl_batch"),
+    "snowball": ("src.crawler.soundcloud_user_snowball", "main"),
+}
+# 子进程异常退出后最多重启几次
+MAX_RESTARTS = 3
+RESTART_DELAY = 10
+POLL_INTERVAL = 1.0
+STOP_TIMEOUT = 30
+
+
+def run_shard(target, index, count):
+    """
+    Child process entry point. The crawler module is imported here, so each
+    process opens its own ClickHouse/Redis clients and runs its own loop.
+    """
+    module_name, entry = TARGETS[target]
+    module = importlib.import_module(module_name)
+    from src.util.db import close_connections
+    shard = Shard(index, count)
+    logger.info(f"{target} {shard.label} starting (pid {os.getpid()})")
+    try:
+        asyncio.run(getattr(module, entry)(shard))
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        logger.error(f"{target} {shard.label} failed: {traceback.format_exc()}")
+        raise SystemExit(1)
+    finally:
+        close_connections()
+
+
+def _start(ctx, target, index, count):
+    proc = ctx.Process(target=run_shard, args=(target, index, count),
+                       name=f"{target}-{Shard(index, count).label}")
+    proc.start()
+    return proc
+
+
+def run(target, processes, max_restarts=MAX_RESTARTS):
+    """
+    Run ``processes`` shards of ``target`` (``id % processes == i``) and wait
+    for all of them; a shard that crashes is restarted up to
+    ``max_restarts`` times and resumes from its own checkpoints.
+    """
+    # spawn：子进程不继承父进程里已经建立的连接
+    ctx = multiprocessing.get_context("spawn")
+    procs = {i: _start(ctx, target, i, processes) for i in range(processes)}
+    restarts = {i: 0 for i in range(processes)}
+    try:
+        while procs:
+            time.sleep(POLL_INTERVAL)
+            for i, proc in list(procs.items()):
+                if proc.is_alive():
+                    continue
+                proc.join()
+                if proc.exitcode == 0:
+                    logger.info(f"{proc.name} finished")
+                    del procs[i]
+                elif restarts[i] < max_restarts:
+                    restarts[i] += 1
+                    logger.warning(f"{proc.name} exited with {proc.exitcode}, "
+                                   f"restart {restarts[i]}/{max_restarts} in {RESTART_DELAY}s")
+                    time.sleep(RESTART_DELAY)
+                    procs[i] = _start(ctx, target, i, processes)
+                else:
+                    logger.error(f"{proc.name} exited with {proc.exitcode}, giving up on this shard")
+                    del procs[i]
+    except KeyboardInterrupt:
+        # Ctrl-C 同时发给了子进程，先给它们时间刷写断点
+        logger.info("Stopping shards")
+        for proc in procs.values():
+            proc.join(timeout=STOP_TIMEOUT)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a crawler as K sharded worker processes.")
+    parser.add_argument("target", choices=sorted(TARGETS))
+    parser.add_argument("-k", "--processes", type=int, default=os.cpu_count() or 1,
+                        help="number of shards / worker processes (default: CPU count)")
+    parser.add_argument("--max-restarts", type=int, default=MAX_RESTARTS)
+    args = parser.parse_args()
+    run(args.target, args.processes, args.max_restarts)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,42 @@
+import argparse
+import asyncio
 import json
-import random
-import time
-
-import httpx  # pip install httpx
+import traceback
+from datetime import datetime
+from urllib.parse import parse_qs, urlparse
 
-from src.util.config import SOUNDCLOUD_CLIENT_ID
-from src.util.db import close_connections, redis_client, clickhouse_client
+from src.util.ck_writer import AsyncBatchWriter
+from src.util.config import SOUNDCLOUD_API_BASE, SOUNDCLOUD_CLIENT_ID
+from src.util.db import close_connections, migrate_table, redis_client, clickhouse_client
+from src.util.dedup import RecentWrites
+from src.util.http_session import ConnectionStats, create_session
 from src.util.logger import logger
+from src.util.metrics import start_metrics
+from src.util.soundcloud_api import FetchError, fetch_json
+from src.util.user_rows import UserRowEncoder
 
 TABLE_NAME = "followers"
-REDIS_KEY = "soundcloud:last_url"
+# 每个目标用户一组区间断点：hash，field 为区间序号
+REDIS_KEY_PREFIX = "soundcloud:followers"
 
-LIMIT=100
-OFFSET=0
-API_URL = f"https://api-v2.soundcloud.com/users/193/followers?client_id={SOUNDCLOUD_CLIENT_ID}&limit={LIMIT}&offset={OFFSET}"
+recent_writes = RecentWrites()
+user_rows = UserRowEncoder()
 
+BASE_URL = SOUNDCLOUD_API_BASE
+TARGET_USER_ID = 193
+LIMIT = 100
+# 大账号的关注者列表切成多少个区间并发抓取
+RANGES = 8
+# 每翻多少页确认一次写入并保存该区间的断点
+RESUME_EVERY_PAGES = 10
+# 大于这个值的 offset 视为毫秒时间戳游标（按关注时间倒序），否则是位置偏移
+TIMESTAMP_CURSOR_MIN = 10 ** 11
+SOUNDCLOUD_EPOCH_MS = int(datetime(2007, 1, 1).timestamp() * 1000)
 
-def create_table():
+
+def create_table(table_name=TABLE_NAME):
     ddl = f"""
-    CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+    CREATE TABLE IF NOT EXISTS {table_name} (
         id UInt64,
         avatar_url String,
         city String,
@@ -50,160 +68,205 @@ def create_table():
         visuals String,
         badges String,
         station_urn String,
-        station_permalink String,
-        _raw Nested (
-            key String,
-            value String
-        )
+        station_permalink String{user_rows.raw_ddl}
     )
-    ENGINE = MergeTree
+    ENGINE = ReplacingMergeTree(last_modified)
     PARTITION BY toYYYYMM(created_at)
-    PRIMARY KEY id
-    ORDER BY (id, username, created_at)
+    ORDER BY id
     SETTINGS index_granularity = 8192;
     """
-    clickhouse_client.execute(ddl)
-
-def flatten_json(y):
-    out = {}
-    def flatten(x, name=''):
-        if type(x) is dict:
-            for a in x:
-                flatten(x[a], f'{name}{a}_')
-        elif type(x) is list:
-            out[name[:-1]] = json.dumps(x, ensure_ascii=False)
-        else:
-            out[name[:-1]] = x
-    flatten(y)
-    return out
+    clickhouse_client.command(ddl)
 
-def none_to_empty(val):
-    """Convert None to empty string, else return val."""
-    return "" if val is None else val
+def followers_url(user_id, offset=None):
+    url = f"{BASE_URL}/users/{user_id}/followers?client_id={SOUNDCLOUD_CLIENT_ID}&limit={LIMIT}&linked_partitioning=1"
+    return url if offset is None else f"{url}&offset={offset}"
 
-def none_to_zero(val):
-    """Convert None to zero, else return val."""
-    return 0 if val is None else val
 
-def safe_json(obj):
+def cursor_of(url):
+    """Numeric ``offset`` cursor of a followers url, or None if absent/opaque."""
+    if not url:
+        return None
+    values = parse_qs(urlparse(url).query).get("offset")
     try:
-        return json.dumps(obj, ensure_ascii=False)
-    except Exception:
-        return ""
+        return int(values[0]) if values else None
+    except ValueError:
+        return None
 
-from datetime import datetime
 
-def parse_dt(val):
-    # Accepts ISO string or returns default datetime
-    if not val:
-        return datetime(1970, 1, 1, 0, 0, 0)
-    try:
-        # Remove Z if present, parse
-        return datetime.fromisoformat(val.replace("Z", "+00:00"))
-    except Exception:
-        return datetime(1970, 1, 1, 0, 0, 0)
-
-def insert_records(records):
-    rows = []
-    for rec in records:
-        flat = flatten_json(rec)
-        row = {
-            'id': flat.get('id', 0) or 0,
-            'avatar_url': none_to_empty(flat.get('avatar_url')),
-            'city': none_to_empty(flat.get('city')),
-            'comments_count': none_to_zero(flat.get('comments_count')),
-            'country_code': none_to_empty(flat.get('country_code')),
-            'created_at': parse_dt(flat.get('created_at') or '1970-01-01 00:00:00'),
-            'creator_subscriptions': [safe_json(rec.get('creator_subscriptions', []))],
-            'creator_subscription': safe_json(rec.get('creator_subscription', {})),
-            'description': none_to_empty(flat.get('description')),
-            'followers_count': none_to_zero(flat.get('followers_count')),
-            'followings_count': none_to_zero(flat.get('followings_count')),
-            'first_name': none_to_empty(flat.get('first_name')),
-            'full_name': none_to_empty(flat.get('full_name')),
-            'groups_count': none_to_zero(flat.get('groups_count')),
-            'kind': none_to_empty(flat.get('kind')),
-            'last_modified': parse_dt(flat.get('last_modified') or '1970-01-01 00:00:00'),
-            'last_name': none_to_empty(flat.get('last_name')),
-            'likes_count': none_to_zero(flat.get('likes_count')),
-            'playlist_likes_count': none_to_zero(flat.get('playlist_likes_count')),
-            'permalink': none_to_empty(flat.get('permalink')),
-            'permalink_url': none_to_empty(flat.get('permalink_url')),
-            'playlist_count': none_to_zero(flat.get('playlist_count')),
-            'reposts_count': rec.get('reposts_count', 0),  # Nullable, so leave as is
-            'track_count': none_to_zero(flat.get('track_count')),
-            'uri': none_to_empty(flat.get('uri')),
-            'urn': none_to_empty(flat.get('urn')),
-            'username': none_to_empty(flat.get('username')),
-            'verified': int(flat.get('verified', False)),
-            'visuals': safe_json(rec.get('visuals', {})),
-            'badges': safe_json(rec.get('badges', {})),
-            'station_urn': none_to_empty(flat.get('station_urn')),
-            'station_permalink': none_to_empty(flat.get('station_permalink')),
-            '_raw.key': [],
-            '_raw.value': []
-        }
-        for k, v in rec.items():
-            row['_raw.key'].append(none_to_empty(k))
-            row['_raw.value'].append(safe_json(v))
-        rows.append(tuple(row.values()))
-
-    # Insert remaining rows
-    if rows:
+def with_client(next_href):
+    if next_href and "client_id=" not in next_href:
+        next_href += ('&' if '?' in next_href else '?') + f'client_id={SOUNDCLOUD_CLIENT_ID}'
+    return next_href
+
+
+def plan_ranges(user_id, first_cursor, profile, ranges):
+    """
+    Split the cursor space after the first page into ``ranges`` windows.
+    Returns a list of ``{"url", "stop", "descending"}`` states; the window
+    ends once the next cursor reaches ``stop``.
+    """
+    if first_cursor >= TIMESTAMP_CURSOR_MIN:
+        # 时间戳游标：从第一页之后的时间点倒推到账号创建时间
+        created = profile.get("created_at")
         try:
-            clickhouse_client.execute(
-                f"INSERT INTO {TABLE_NAME} VALUES",
-                rows
-            )
-        except Exception as e:
-            logger.error(f"Final batch insert failed: {e}")
+            low = int(datetime.fromisoformat(created.replace("Z", "+00:00")).timestamp() * 1000)
+        except Exception:
+            low = SOUNDCLOUD_EPOCH_MS
+        high, descending = first_cursor, True
+        bounds = [high - (high - low) * i // ranges for i in range(ranges + 1)]
+    else:
+        # 位置偏移：按关注者总数均分
+        total = max(int(profile.get("followers_count") or 0), first_cursor + 1)
+        descending = False
+        bounds = [first_cursor + (total - first_cursor) * i // ranges for i in range(ranges + 1)]
+    states = []
+    for start, stop in zip(bounds, bounds[1:]):
+        if start != stop:
+            states.append({"url": followers_url(user_id, start), "stop": stop, "descending": descending})
+    # 最后一个区间不设终点，一直翻到 next_href 为空
+    if states:
+        states[-1]["stop"] = None
+    return states
+
+
+def range_finished(state, next_url):
+    if not next_url:
+        return True
+    stop = state.get("stop")
+    cursor = cursor_of(next_url)
+    if stop is None or cursor is None:
+        return False
+    return cursor <= stop if state["descending"] else cursor >= stop
+
+
+def create_writer():
+    return AsyncBatchWriter(clickhouse_client, TABLE_NAME, user_rows.column_names,
+                            flush_rows=10000, flush_interval=5.0, column_oriented=True)
 
 
-def fetch_and_store(load_from_redis=False):
-    last_url = redis_client.get(REDIS_KEY)
-    url = last_url.decode() if (load_from_redis and last_url) else API_URL
+class FollowerCrawl:
+    """
+    Crawl the followers of one account, optionally split into cursor ranges
+    fetched concurrently. Range progress lives in the Redis hash
+    ``{REDIS_KEY_PREFIX}:{user_id}:ranges`` (one JSON state per range), so a
+    restart resumes every range where it stopped. Ranges overlap by at most
+    a page at their boundaries; repeated rows are dropped by ``recent_writes``
+    before writing.
+    """
+
+    def __init__(self, session, writer, user_id, ranges=RANGES):
+        self.session = session
+        self.writer = writer
+        self.user_id = user_id
+        self.ranges = ranges
+        self.key = f"{REDIS_KEY_PREFIX}:{user_id}:ranges"
+        self.pages = 0
+        self.written = 0
+
+    async def fetch(self, url, label):
+        return await fetch_json(self.session, url, label, schema=user_rows.page_schema)
+
+    async def store(self, collection):
+        fresh = recent_writes.filter(collection)
+        if fresh:
+            await self.writer.put(user_rows.encode(fresh))
+        self.written += len(fresh)
+
+    async def save(self, index, state):
+        # 行写入成功后才推进断点
+        if await self.writer.sync():
+            redis_client.hset(self.key, index, json.dumps(state))
+
+    def load(self):
+        saved = redis_client.hgetall(self.key)
+        return {int(k): json.loads(v) for k, v in saved.items()}
 
-    with httpx.Client(timeout=30) as client:
-        while url:
-            logger.info(f"Fetching: {url}")
+    async def plan(self):
+        """Fetch the first page and the profile, store the page and split the rest."""
+        data = await self.fetch(followers_url(self.user_id), f"Followers of {self.user_id} (probe)")
+        await self.store(data.get('collection', []))
+        next_url = with_client(data.get('next_href'))
+        first_cursor = cursor_of(next_url)
+        if not next_url:
+            return {}
+        if first_cursor is None or self.ranges <= 1:
+            logger.info(f"Followers of {self.user_id}: crawling sequentially")
+            states = [{"url": next_url, "stop": None, "descending": False}]
+        else:
+            profile = await fetch_json(self.session, f"{BASE_URL}/users/{self.user_id}?client_id={SOUNDCLOUD_CLIENT_ID}",
+                                       f"Profile {self.user_id}")
+            states = plan_ranges(self.user_id, first_cursor, profile, self.ranges)
+            logger.info(f"Followers of {self.user_id} (~{profile.get('followers_count')}): "
+                        f"{len(states)} ranges from cursor {first_cursor}")
+        states = dict(enumerate(states))
+        if states:
+            redis_client.hset(self.key, mapping={i: json.dumps(st) for i, st in states.items()})
+        return states
+
+    async def crawl_range(self, index, state):
+        url = state["url"]
+        pages = 0
+        while url and not state.get("done"):
             try:
-                resp = client.get(url)
-                resp.raise_for_status()
-                data = resp.json()
-            except Exception as e:
-                logger.error(f"Error fetching or decoding JSON from {url}: {e}")
+                data = await self.fetch(url, f"Followers of {self.user_id} range {index}")
+            except FetchError as e:
+                logger.error(f"Range {index}: giving up at {url}: {e}")
                 break
+            await self.store(data.get('collection', []))
+            next_url = with_client(data.get('next_href'))
+            pages += 1
+            self.pages += 1
+            if range_finished(state, next_url):
+                state["done"] = True
+            url = state["url"] = next_url
+            if state.get("done") or pages % RESUME_EVERY_PAGES == 0:
+                await self.save(index, state)
+        logger.info(f"Followers of {self.user_id} range {index}: {pages} pages")
 
-            collection = data.get('collection', [])
-            logger.info(f"Fetched {len(collection)} records from {url}")
-            if collection:
-                insert_records(collection)
-
-            next_href = data.get('next_href')
-            if next_href:
-                # Append client_id only if it's not already in the URL
-                if "client_id=" not in next_href:
-                    if "?" in next_href:
-                        next_href += '&client_id=sobAMMic36lHKNZEwXsaEj5feRIAW9Yx'
-                    else:
-                        next_href += '?client_id=sobAMMic36lHKNZEwXsaEj5feRIAW9Yx'
-                url = next_href
-            else:
-                url = None
-            # Save current url to redis after each fetch
-            redis_client.set(REDIS_KEY, url if url else "")
-            time.sleep(random.random())
-    logger.info("Done fetching all data.")
+    async def run(self):
+        states = self.load()
+        if states:
+            logger.info(f"Followers of {self.user_id}: resuming {len(states)} ranges")
+        else:
+            states = await self.plan()
+        pending = {i: st for i, st in states.items() if not st.get("done")}
+        await asyncio.gather(*(self.crawl_range(i, st) for i, st in pending.items()))
+        if all(st.get("done") for st in states.values()):
+            # 全部完成后清掉断点，下次重新全量抓取
+            redis_client.delete(self.key)
+        logger.info(f"Followers of {self.user_id}: {self.pages} pages, {self.written} distinct users written")
+
+
+async def fetch_and_store(user_id=TARGET_USER_ID, ranges=RANGES):
+    start_metrics(f"followers of {user_id}")
+    stats = ConnectionStats()
+    writer = create_writer().start()
+    try:
+        async with create_session(stats, limit=ranges * 2, limit_per_host=ranges) as session:
+            await FollowerCrawl(session, writer, user_id, ranges).run()
+    finally:
+        await writer.close()
+    stats.log("Followers")
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Crawl the followers of a SoundCloud account.")
+    parser.add_argument("--user-id", type=int, default=TARGET_USER_ID)
+    parser.add_argument("--ranges", type=int, default=RANGES,
+                        help="cursor ranges fetched concurrently (1 = sequential)")
+    parser.add_argument("--migrate", action="store_true",
+                        help="rebuild an existing table with the current DDL first (old rows kept in <table>_old)")
+    args = parser.parse_args()
+    if args.migrate:
+        migrate_table(TABLE_NAME, create_table)
     create_table()
-    fetch_and_store(load_from_redis=True)
+    asyncio.run(fetch_and_store(args.user_id, args.ranges))
 
 if __name__ == "__main__":
     try:
         main()
     except Exception as e:
+        logger.error(traceback.format_exc())
         close_connections()
     except KeyboardInterrupt:
-        close_connections()
\ No newline at end of file
+        close_connections()
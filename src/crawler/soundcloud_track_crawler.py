@@ -1,68 +1,74 @@
+import argparse
 import asyncio
-import json
-import traceback
-from datetime import datetime
+import calendar
 
 import aiohttp
-from aiohttp import ClientError
 
 from src.crawler.soundcloud_follower import clickhouse_client, redis_client
-from src.util.config import PROXY_TUNNEL, PROXY_USER_NAME, PROXY_PWD, SOUNDCLOUD_CLIENT_ID, PROXY_URL
-from src.util.db import close_connections
+from src.util.checkpoint import CheckpointStore
+from src.util.ck_writer import AsyncBatchWriter
+from src.util.concurrency import create_limit
+from src.util.config import PROXY_TUNNEL, PROXY_USER_NAME, PROXY_PWD, SOUNDCLOUD_API_BASE, SOUNDCLOUD_CLIENT_ID, \
+    TRACK_REFRESH_MODE, TRACK_SEED_ID_START, TRACK_SEED_ID_END
+from src.util.db import close_connections, migrate_table
+from src.util.dedup import RecentWrites
+from src.util.fastjson import TRACKS
 from src.util.logger import logger
+from src.util.metric_snapshots import TRACK_METRICS, TRACK_METRICS_TABLE, MetricSnapshots, metrics_table_ddl
+from src.util.metrics import PAGES_PER_USER, start_metrics
+from src.util.pipeline import LeasePipeline
+from src.util.retry import RetryPolicy
+from src.util.seed_iterator import SeedIterator
+from src.util.shard import Shard, report_shard_metrics
+from src.util.soundcloud_api import FetchError, fetch_json
+from src.util.track_rows import TRACK_COLS, parse_datetime, transform_tracks_columnar
+from src.util.work_queue import WorkQueue
 
 CLICKHOUSE_TABLE = "tracks"
 REDIS_KEY_IDENTIFIER = "lionel_2M"
-REDIS_KEY = f"soundcloud:track:{REDIS_KEY_IDENTIFIER}:offset"
+REDIS_KEY_PREFIX = f"soundcloud:track:{REDIS_KEY_IDENTIFIER}"
+REDIS_KEY = f"{REDIS_KEY_PREFIX}:cursor"
+# 批次内逐用户的断点：已完成用户位图 + 未翻完用户的 next_href
+CHECKPOINT_PREFIX = f"{REDIS_KEY_PREFIX}:checkpoint"
+# 多台机器共享的批次队列；REDIS_KEY 游标记录的是已入队的位置
+QUEUE_NAME = f"{REDIS_KEY_PREFIX}:queue"
+# 增量刷新用独立的游标/队列/断点，每轮刷新从头遍历一次种子用户
+REFRESH_KEY_PREFIX = f"{REDIS_KEY_PREFIX}:refresh"
+# 本进程负责的 users.id 区间 (SEED_ID_START, SEED_ID_END]，显式配置时优先，见 seed_id_range()
+SEED_ID_START = TRACK_SEED_ID_START
+SEED_ID_END = TRACK_SEED_ID_END
+# 旧版按 "SELECT id FROM users LIMIT 1000 OFFSET n" 分到的位置区间 [2000000, 3001000)
+# （循环跑到 offset 3000000 那一批为止）；没有配置 id 区间时按 id 顺序换算成 id 边界
+LEGACY_OFFSET_START = 2000000
+LEGACY_OFFSET_END = 3001000
+# 旧版的位置游标，首次运行时换算成 id 游标
+LEGACY_OFFSET_KEY = f"{REDIS_KEY_PREFIX}:offset"
+# 换算出的 id 区间只算一次，之后表继续增长区间也不会漂移
+RANGE_KEY = f"{REDIS_KEY_PREFIX}:range"
 
 BATCH_SIZE = 1000
+# 并发抓取的用户数：初始值和上下限，实际窗口随 API 延迟和错误率调整（ADAPTIVE_CONCURRENCY=0 时固定为初始值）
 CONCURRENT_USERS = 8
+MIN_CONCURRENT_USERS = 2
+MAX_CONCURRENT_USERS = 64
+# 预取队列里排着的用户数 = CONCURRENT_USERS * PREFETCH_FACTOR
+PREFETCH_FACTOR = 8
 TRACKS_LIMIT_PER_REQUEST = 100
-RETRY_LIMIT = 10
+RETRY_LIMIT = 6
 RETRY_BACKOFF = 1.2
+RETRY_POLICY = RetryPolicy(max_attempts=RETRY_LIMIT, base_delay=RETRY_BACKOFF)
+# ClickHouse 后台写入：按行数或时间刷写
+INSERT_FLUSH_ROWS = 20000
+INSERT_FLUSH_INTERVAL = 5.0
+# 增量模式：一次批量探测多少个用户资料（/users?ids=）
+PROFILE_BATCH = 50
+USERS_TABLE = "users"
 
 # 隧道域名:端口号
 PROXY_TUNNEL = PROXY_TUNNEL
 PROXY_USER_NAME = PROXY_USER_NAME
 PROXY_PWD = PROXY_PWD
 
-# --- SCHEMA INFO ---
-TRACK_COLS = [
-    "id","artwork_url","caption","commentable","comment_count","created_at","description",
-    "downloadable","download_count","duration","full_duration","embeddable_by","genre",
-    "has_downloads_left","kind","label_name","last_modified","license","likes_count",
-    "permalink","permalink_url","playback_count","public","purchase_title","purchase_url",
-    "release_date","reposts_count","secret_token","sharing","state","streamable","tag_list",
-    "title","uri","urn","user_id","visuals","waveform_url","display_date","station_urn",
-    "station_permalink","track_authorization","monetization_model","policy",
-    "publisher_metadata_id","publisher_metadata_urn","publisher_metadata_artist",
-    "publisher_metadata_album_title","publisher_metadata_contains_music",
-    "publisher_metadata_upc_or_ean","publisher_metadata_isrc","publisher_metadata_explicit",
-    "publisher_metadata_p_line","publisher_metadata_p_line_for_display",
-    "publisher_metadata_c_line","publisher_metadata_c_line_for_display",
-    "publisher_metadata_release_title"
-]
-NON_NULLABLE_UINT32 = [
-    'id', 'comment_count', 'download_count', 'duration', 'full_duration',
-    'likes_count', 'playback_count', 'reposts_count', 'user_id'
-]
-NON_NULLABLE_BOOL = [
-    'commentable', 'downloadable', 'has_downloads_left', 'public', 'streamable'
-]
-NON_NULLABLE_STRING = [
-    "artwork_url","embeddable_by","kind","license","permalink","permalink_url","sharing",
-    "state","tag_list","title","uri","urn","waveform_url","station_urn","station_permalink",
-    "track_authorization","monetization_model","policy"
-]
-NULLABLE_STRING_SPECIAL = ["visuals"]
-DATETIME_FIELDS = [
-    "created_at", "last_modified", "release_date", "display_date"
-]
-PM_FIELDS = [
-    "id", "urn", "artist", "album_title", "contains_music", "upc_or_ean", "isrc",
-    "explicit", "p_line", "p_line_for_display", "c_line", "c_line_for_display", "release_title"
-]
-
 HEADERS = {
     'Host': 'api-v2.soundcloud.com',
     'Origin': 'https://soundcloud.com',
@@ -75,153 +81,200 @@ HEADERS = {
 # --- CLIENTS ---
 ch_client = clickhouse_client
 redis_client = redis_client
+# 重启后重复抓到的、未变化的 track 在写入前丢弃；计数变化不改 last_modified，要算进版本里
+TRACK_COUNTERS = ["playback_count", "likes_count", "reposts_count", "comment_count", "download_count"]
+recent_writes = RecentWrites(counter_keys=TRACK_COUNTERS)
+# 播放/点赞等计数变化时写一行到窄表，用于增长曲线
+track_snapshots = MetricSnapshots(redis_client, f"{REDIS_KEY_PREFIX}:snapshot", TRACK_METRICS, "track_id")
 
-# --- TYPE HELPERS ---
-def parse_datetime(val):
-    if val is None:
-        return None
-    if isinstance(val, datetime):
-        return val
-    if isinstance(val, str):
-        v = val.replace("Z", "")
-        for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S"):
-            try:
-                return datetime.strptime(v, fmt)
-            except Exception:
-                continue
-        try:
-            return datetime.fromisoformat(v)
-        except Exception:
-            return None
-    return None
+def create_table(table_name=CLICKHOUSE_TABLE):
+    ddl = f"""
+    CREATE TABLE IF NOT EXISTS {table_name} (
+        id UInt64,
+        artwork_url String,
+        caption Nullable(String),
+        commentable Bool,
+        comment_count UInt32,
+        created_at DateTime,
+        description Nullable(String),
+        downloadable Bool,
+        download_count UInt32,
+        duration UInt32,
+        full_duration UInt32,
+        embeddable_by String,
+        genre Nullable(String),
+        has_downloads_left Bool,
+        kind String,
+        label_name Nullable(String),
+        last_modified DateTime,
+        license String,
+        likes_count UInt32,
+        permalink String,
+        permalink_url String,
+        playback_count UInt32,
+        public Bool,
+        purchase_title Nullable(String),
+        purchase_url Nullable(String),
+        release_date Nullable(DateTime),
+        reposts_count UInt32,
+        secret_token Nullable(String),
+        sharing String,
+        state String,
+        streamable Bool,
+        tag_list String,
+        title String,
+        uri String,
+        urn String,
+        user_id UInt64,
+        visuals Nullable(String),
+        waveform_url String,
+        display_date Nullable(DateTime),
+        station_urn String,
+        station_permalink String,
+        track_authorization String,
+        monetization_model String,
+        policy String,
+        publisher_metadata_id Nullable(UInt64),
+        publisher_metadata_urn Nullable(String),
+        publisher_metadata_artist Nullable(String),
+        publisher_metadata_album_title Nullable(String),
+        publisher_metadata_contains_music Nullable(Bool),
+        publisher_metadata_upc_or_ean Nullable(String),
+        publisher_metadata_isrc Nullable(String),
+        publisher_metadata_explicit Nullable(Bool),
+        publisher_metadata_p_line Nullable(String),
+        publisher_metadata_p_line_for_display Nullable(String),
+        publisher_metadata_c_line Nullable(String),
+        publisher_metadata_c_line_for_display Nullable(String),
+        publisher_metadata_release_title Nullable(String)
+    )
+    ENGINE = ReplacingMergeTree(last_modified)
+    PARTITION BY toYYYYMM(created_at)
+    ORDER BY id
+    SETTINGS index_granularity = 8192;
+    """
+    ch_client.command(ddl)
 
-def safe_release_date(val):
-    dt = parse_datetime(val)
-    if not dt or dt.year < 1970:
-        return None
-    return dt
+def create_metrics_table(table_name=TRACK_METRICS_TABLE):
+    ch_client.command(metrics_table_ddl(table_name, "track_id", TRACK_METRICS))
 
-def safe_int(val):
-    try:
-        return int(val)
-    except Exception:
-        return 0
-
-def safe_bool(val):
-    if isinstance(val, bool):
-        return val
-    if isinstance(val, str):
-        return val.lower() in ("1", "true", "yes")
-    if isinstance(val, int):
-        return val != 0
-    return False
+# --- STORAGE ---
+def create_track_writer():
+    return AsyncBatchWriter(ch_client, CLICKHOUSE_TABLE, TRACK_COLS,
+                            flush_rows=INSERT_FLUSH_ROWS, flush_interval=INSERT_FLUSH_INTERVAL,
+                            column_oriented=True)
 
-def safe_str(val):
-    return str(val) if val is not None else ""
-
-def safe_nullable_string(val):
-    if val is None:
-        return None
-    if isinstance(val, (dict, list)):
-        return json.dumps(val, ensure_ascii=False)
-    return str(val)
-
-# --- MAIN TRACK TRANSFORM ---
-def transform_track_to_ck(track: dict) -> list:
-    # Flatten publisher_metadata
-    pm = track.pop("publisher_metadata", {}) or {}
-    for pm_field in PM_FIELDS:
-        track[f"publisher_metadata_{pm_field}"] = pm.get(pm_field, None)
-
-    # Fix datetimes
-    for k in ["created_at", "last_modified", "display_date"]:
-        track[k] = parse_datetime(track.get(k))
-    track["release_date"] = safe_release_date(track.get("release_date"))
-
-    # Non-nullable ints/bools/strings
-    for k in NON_NULLABLE_UINT32:
-        track[k] = safe_int(track.get(k, 0))
-    for k in NON_NULLABLE_BOOL:
-        track[k] = safe_bool(track.get(k, False))
-    for k in NON_NULLABLE_STRING:
-        track[k] = safe_str(track.get(k, ""))
-
-    # Nullable string fields that may be dicts
-    for k in NULLABLE_STRING_SPECIAL:
-        track[k] = safe_nullable_string(track.get(k, None))
-
-    # Output as ordered list
-    return [track.get(col, None) for col in TRACK_COLS]
+def create_metrics_writer():
+    return AsyncBatchWriter(ch_client, TRACK_METRICS_TABLE, track_snapshots.column_names,
+                            flush_rows=INSERT_FLUSH_ROWS, flush_interval=INSERT_FLUSH_INTERVAL,
+                            column_oriented=True)
 
-# --- STORAGE ---
-def store_tracks(tracks):
+async def store_tracks(writer, tracks, metrics_writer=None):
+    # 计数变化不一定会改 last_modified，快照要在去重之前取
+    if metrics_writer is not None:
+        await metrics_writer.put(track_snapshots.changed(tracks))
+    tracks = recent_writes.filter(tracks)
     if tracks:
-        rows = [transform_track_to_ck(track) for track in tracks]
-        try:
-            ch_client.insert(CLICKHOUSE_TABLE, rows, column_names=TRACK_COLS)
-            logger.info(f"Inserted {len(rows)} tracks to ClickHouse")
-        except Exception as e:
-            logger.error(f"ClickHouse insert error: {traceback.format_exc()}")
+        await writer.put(transform_tracks_columnar(tracks))
 
-# --- REDIS OFFSET ---
-def get_next_batch_offset():
-    try:
-        val = redis_client.get(REDIS_KEY)
-        return int(val or 2000000)
-    except Exception as e:
-        logger.error(f"Redis get offset error: {e}")
-        return 0
+# --- SEED USERS ---
+# 多进程运行时，每个分片有自己的游标、队列和断点（见 src/crawler/runner.py）
+def _keys(incremental):
+    if incremental:
+        return f"{REFRESH_KEY_PREFIX}:cursor", f"{REFRESH_KEY_PREFIX}:queue", f"{REFRESH_KEY_PREFIX}:checkpoint"
+    return REDIS_KEY, QUEUE_NAME, CHECKPOINT_PREFIX
 
-def set_next_batch_offset(offset):
-    try:
-        redis_client.set(REDIS_KEY, str(offset))
-    except Exception as e:
-        logger.error(f"Redis set offset error: {e}")
+def id_at_position(position):
+    """users.id at 0-based ``position`` in id order, or None past the end of the table."""
+    rows = ch_client.query(f"SELECT id FROM (SELECT DISTINCT id FROM {USERS_TABLE}) "
+                           f"ORDER BY id LIMIT 1 OFFSET {int(position)}").result_rows
+    return int(rows[0][0]) if rows else None
 
-def fetch_user_ids(offset, limit):
-    try:
-        query = f"SELECT id FROM users LIMIT {limit} OFFSET {offset}"
-        return [row[0] for row in ch_client.query(query).result_rows]
-    except Exception as e:
-        logger.error(f"ClickHouse fetch_user_ids error: {e}")
-        return []
+def seed_id_range():
+    """
+    ``(start_after, stop_at)`` of the seed ids: SEED_ID_START / SEED_ID_END
+    when configured, otherwise the legacy position range translated into
+    ids once and kept under RANGE_KEY.
+    """
+    if SEED_ID_START is not None or SEED_ID_END is not None:
+        return SEED_ID_START or 0, SEED_ID_END
+    if not redis_client.exists(RANGE_KEY):
+        start_after = id_at_position(LEGACY_OFFSET_START - 1) if LEGACY_OFFSET_START else 0
+        stop_at = id_at_position(LEGACY_OFFSET_END - 1)
+        if start_after is None or stop_at is None:
+            raise ValueError(f"{USERS_TABLE} has fewer than {LEGACY_OFFSET_END} ids, cannot translate the legacy "
+                             f"range; set TRACK_SEED_ID_START / TRACK_SEED_ID_END")
+        # 多个分片同时启动时以先写入的为准
+        if redis_client.set(RANGE_KEY, f"{start_after}:{stop_at}", nx=True):
+            logger.info(f"Legacy seed positions [{LEGACY_OFFSET_START}, {LEGACY_OFFSET_END}) "
+                        f"translated to ids ({start_after}, {stop_at}]")
+    stored = redis_client.get(RANGE_KEY)
+    if isinstance(stored, bytes):
+        stored = stored.decode()
+    start_after, stop_at = stored.split(":")
+    return int(start_after), int(stop_at)
 
-async def fetch_json_with_retry(session, url, user_id, max_attempts=RETRY_LIMIT):
-    delay = RETRY_BACKOFF
-    last_exception = None
-    for attempt in range(max_attempts):
-        try:
-            headers = HEADERS.copy()
-            async with session.get(url, headers=headers, proxy=PROXY_URL) as resp:
-                if resp.status == 200:
-                    return await resp.json()
-                text = await resp.text()
-                logger.warning(f"User {user_id}: HTTP {resp.status} for {url} - {text}")
-        except (ClientError, asyncio.TimeoutError) as e:
-            last_exception = e
-            logger.warning(
-                f"User {user_id}: Attempt {attempt+1}/{max_attempts} - {e} on {url} - traceback: {traceback.format_exc()}"
-            )
-        delay = delay * 2
-        await asyncio.sleep(delay)
-        delay *= 2
-
-    logger.error(f"User {user_id}: Failed after {max_attempts} attempts for {url}")
-    if last_exception:
-        raise last_exception
-    raise Exception(f"User {user_id}: Unspecified download failure for {url}")
-
-async def fetch_and_store_tracks_for_user(session, user_id):
-    url = (f"https://api-v2.soundcloud.com/users/{user_id}/tracks"
-           f"?client_id={SOUNDCLOUD_CLIENT_ID}&limit={TRACKS_LIMIT_PER_REQUEST}")
+def migrate_legacy_cursor(seeds):
+    """Carry the old position cursor (LEGACY_OFFSET_KEY) over to ``seeds``' id cursor if it has none yet."""
+    legacy = redis_client.get(LEGACY_OFFSET_KEY)
+    if not legacy or redis_client.exists(seeds.redis_key):
+        return
+    offset = int(legacy)
+    # 旧游标是下一批的起始位置，之前的位置都已抓完
+    last_done = id_at_position(offset - 1) if offset > LEGACY_OFFSET_START else None
+    if last_done is not None and last_done > seeds.start_after:
+        seeds.commit(last_done)
+        logger.info(f"Migrated legacy offset {offset} to id cursor {last_done} ({seeds.redis_key})")
+
+def create_seed_iterator(shard=Shard(), incremental=False):
+    start_after, stop_at = seed_id_range()
+    return SeedIterator(ch_client, redis_client, _keys(incremental)[0] + shard.suffix, batch_size=BATCH_SIZE,
+                        start_after=start_after, stop_at=stop_at, where=shard.where())
+
+def create_work_queue(shard=Shard(), incremental=False):
+    return WorkQueue(redis_client, _keys(incremental)[1] + shard.suffix)
+
+def create_checkpoint(shard=Shard(), incremental=False):
+    return CheckpointStore(redis_client, _keys(incremental)[2] + shard.suffix)
+
+def start_refresh_cycle(shard=Shard()):
+    """Reset the incremental cursor, queue and checkpoints so the next run walks every seed user again."""
+    seeds = create_seed_iterator(shard, incremental=True)
+    seeds.commit(seeds.start_after)
+    create_work_queue(shard, incremental=True).clear()
+    create_checkpoint(shard, incremental=True).clear()
+    logger.info(f"Started a new track refresh cycle for {shard}")
+
+async def fetch_json_with_retry(session, url, user_id):
+    return await fetch_json(session, url, f"User {user_id}", headers=HEADERS, policy=RETRY_POLICY, schema=TRACKS)
+
+async def fetch_and_store_tracks_for_user(session, writer, user_id, checkpoint, stop_before=None,
+                                          metrics_writer=None):
+    state = checkpoint.resume(user_id)
+    if state and state.get("next_href"):
+        url = state["next_href"]
+        logger.info("User %s: resuming from checkpoint", user_id)
+    else:
+        url = (f"{SOUNDCLOUD_API_BASE}/users/{user_id}/tracks"
+               f"?client_id={SOUNDCLOUD_CLIENT_ID}&limit={TRACKS_LIMIT_PER_REQUEST}")
+    pages = 0
     while url:
         try:
             data = await fetch_json_with_retry(session, url, user_id)
         except Exception as e:
-            logger.error(f"User {user_id}: Skipping due to repeated errors: {e}")
-            break
+            if isinstance(e, FetchError) and e.permanent:
+                # 账号被删除或设为私密：重试也没用，记为完成，不让整个批次失败
+                logger.warning("User %s: giving up, %s", user_id, e)
+                break
+            # 不标记完成、保留这一页的断点：批次租约被退回，重新租到时从这一页接着抓
+            checkpoint.save_page(user_id, url)
+            raise
+        pages += 1
         tracks = data.get("collection", [])
-        store_tracks(tracks)
+        await store_tracks(writer, tracks, metrics_writer)
+        if stop_before is not None and reached_watermark(tracks, stop_before):
+            # 列表按创建时间倒序，后面的 track 上一轮都已经抓过
+            break
         next_href = data.get("next_href")
         if next_href:
             if 'client_id=' not in next_href:
@@ -231,34 +284,173 @@ async def fetch_and_store_tracks_for_user(session, user_id):
                 sep = '&' if '?' in next_href else '?'
                 next_href += f'{sep}limit={TRACKS_LIMIT_PER_REQUEST}'
             url = next_href
-            await asyncio.sleep(0.2)
+            checkpoint.save_page(user_id, url)
         else:
             break
+    PAGES_PER_USER.observe(pages, "tracks")
+    checkpoint.mark_done(user_id)
+    if checkpoint.should_flush():
+        await checkpoint.flush_after(writer)
+
+
+# --- INCREMENTAL REFRESH ---
+def to_unix(val):
+    dt = parse_datetime(val)
+    return calendar.timegm(dt.timetuple()) if dt else None
+
+def reached_watermark(tracks, stop_before):
+    """True once the page holds a track created at or before ``stop_before`` (unix seconds)."""
+    for t in tracks:
+        ts = to_unix(t.get("created_at"))
+        if ts is not None and ts <= stop_before:
+            return True
+    return False
+
+def load_crawl_state(user_ids):
+    """
+    What the tables already know about ``user_ids``:
+    uid -> {"tracks": stored track count, "newest": newest created_at, "last_modified": users.last_modified}
+    (times as unix seconds; ``last_modified`` is None if the user row is missing).
+    """
+    ids = ",".join(str(int(uid)) for uid in user_ids)
+    state = {}
+    rows = ch_client.query(
+        f"SELECT user_id, uniqExact(id), toUnixTimestamp(max(created_at)) FROM {CLICKHOUSE_TABLE} "
+        f"WHERE user_id IN ({ids}) GROUP BY user_id").result_rows
+    for uid, count, newest in rows:
+        state[int(uid)] = {"tracks": int(count), "newest": int(newest), "last_modified": None}
+    rows = ch_client.query(
+        f"SELECT id, toUnixTimestamp(max(last_modified)) FROM {USERS_TABLE} "
+        f"WHERE id IN ({ids}) GROUP BY id").result_rows
+    for uid, last_modified in rows:
+        if int(uid) in state:
+            state[int(uid)]["last_modified"] = int(last_modified)
+    return state
+
+async def probe_profiles(session, user_ids):
+    """
+    Current profiles of ``user_ids`` via /users?ids=, PROFILE_BATCH per
+    request. Never served from the response cache: a cached profile would
+    hide the changes the refresh is looking for.
+    """
+    async def probe(chunk):
+        url = (f"{SOUNDCLOUD_API_BASE}/users?ids={','.join(str(uid) for uid in chunk)}"
+               f"&client_id={SOUNDCLOUD_CLIENT_ID}")
+        try:
+            data = await fetch_json(session, url, f"Profiles {chunk[0]}-{chunk[-1]}", headers=HEADERS,
+                                    policy=RETRY_POLICY, cache=False)
+        except FetchError as e:
+            logger.error(f"Profile probe failed for {chunk[0]}-{chunk[-1]}, crawling them without it: {e}")
+            return []
+        return data if isinstance(data, list) else data.get("collection", [])
+    chunks = [user_ids[i:i + PROFILE_BATCH] for i in range(0, len(user_ids), PROFILE_BATCH)]
+    profiles = {}
+    for result in await asyncio.gather(*(probe(c) for c in chunks)):
+        for p in result:
+            if p.get("id") is not None:
+                profiles[int(p["id"])] = p
+    return profiles
+
+def plan_refresh(user_ids, profiles, stored):
+    """
+    Decide which users to re-crawl: uid -> ``stop_before`` (unix seconds of the
+    newest stored track, or None to read the whole listing). Users whose
+    track_count and last_modified are unchanged, or who have no tracks, are
+    left out; a user without a stored profile row counts as changed.
+    """
+    plan = {}
+    for uid in user_ids:
+        profile = profiles.get(uid)
+        known = stored.get(uid)
+        if profile is None:
+            plan[uid] = known["newest"] if known else None
+            continue
+        count = profile.get("track_count") or 0
+        if count == 0:
+            continue
+        if known is None:
+            plan[uid] = None
+            continue
+        modified = to_unix(profile.get("last_modified"))
+        # users 表里没有这一行时无从比较，按有变化处理
+        unchanged_profile = (known["last_modified"] is not None and modified is not None
+                             and modified <= known["last_modified"])
+        if count == known["tracks"] and unchanged_profile:
+            continue
+        plan[uid] = known["newest"]
+    return plan
+
+
+async def plan_users(session, user_ids, checkpoint, incremental=False):
+    """Users of a leased batch that still need crawling: ``{user_id: stop_before}``."""
+    # 上次在本批次中途退出时，已完成的用户直接跳过
+    user_ids = checkpoint.pending(user_ids)
+    if not user_ids or not incremental:
+        return dict.fromkeys(user_ids)
+    plan = plan_refresh(user_ids, await probe_profiles(session, user_ids), load_crawl_state(user_ids))
+    logger.info(f"Refresh {user_ids[0]} - {user_ids[-1]}: {len(plan)} of {len(user_ids)} users changed")
+    return plan
 
 
-async def crawl_batch():
-    offset = get_next_batch_offset()
-    # 1000000 - 2000000 is my limit
-    while offset <= 3000000:
-        logger.info(f"Crawling offset ({offset}) tracks, size ({BATCH_SIZE})")
-        user_ids = fetch_user_ids(offset, BATCH_SIZE)
-        if not user_ids:
-            logger.error("No user IDs fetched from ClickHouse. Exiting.")
-            return
+async def crawl_batch(shard=Shard(), incremental=TRACK_REFRESH_MODE == "incremental"):
+    start_metrics(f"tracks {shard.label}", shard.index)
+    create_table()
+    create_metrics_table()
+    seeds = create_seed_iterator(shard, incremental)
+    if not incremental:
+        migrate_legacy_cursor(seeds)
+    queue = create_work_queue(shard, incremental)
+    checkpoint = create_checkpoint(shard, incremental)
+    writer = create_track_writer().start()
+    metrics_writer = create_metrics_writer().start()
+    limit = create_limit("tracks", CONCURRENT_USERS, MIN_CONCURRENT_USERS, MAX_CONCURRENT_USERS).start()
+    try:
         async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=600)) as session:
-            sem = asyncio.Semaphore(CONCURRENT_USERS)
-            async def sem_task(user_id):
-                async with sem:
-                    await fetch_and_store_tracks_for_user(session, user_id)
-            tasks = [sem_task(uid) for uid in user_ids]
-            await asyncio.gather(*tasks)
-        set_next_batch_offset(offset + BATCH_SIZE)
-        logger.info(f"Batch complete: users {offset} - {offset + BATCH_SIZE - 1}")
-        offset += BATCH_SIZE
+            async def prepare(lease):
+                return await plan_users(session, lease.user_ids, checkpoint, incremental)
+
+            async def on_complete(batch):
+                # 行先落盘，再写断点，最后确认租约
+                await checkpoint.flush_after(writer)
+                report_shard_metrics(redis_client, REDIS_KEY_PREFIX, shard, batches=pipeline.batches_done + 1,
+                                     users=pipeline.users_done, rows_flushed=writer.rows_flushed,
+                                     rows_lost=writer.rows_lost, duplicates_skipped=recent_writes.skipped,
+                                     snapshots=track_snapshots.written,
+                                     utilization=round(limit.utilization(), 3), concurrency=limit.window)
+
+            async def crawl_user(user_id, stop_before):
+                await fetch_and_store_tracks_for_user(session, writer, user_id, checkpoint, stop_before,
+                                                      metrics_writer)
+
+            # 下一批在当前批次还没抓完时就已经租好、排进队列，慢用户不会让其他并发位空等
+            pipeline = LeasePipeline(queue, seeds, prepare=prepare, on_complete=on_complete,
+                                     maxsize=CONCURRENT_USERS * PREFETCH_FACTOR)
+            await pipeline.run(crawl_user, MAX_CONCURRENT_USERS, limit)
+        logger.info(f"No more user IDs from ClickHouse. Exiting. Queue {queue.stats()}, "
+                    f"slot utilization {limit.utilization():.0%}, final window {limit.window}")
+    finally:
+        limit.stop()
+        await writer.close()
+        await metrics_writer.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl the tracks of the seed users.")
+    parser.add_argument("--incremental", action="store_true", default=TRACK_REFRESH_MODE == "incremental",
+                        help="only re-crawl users whose profile changed, and only their new tracks")
+    parser.add_argument("--new-cycle", action="store_true",
+                        help="with --incremental: start a new refresh pass over all seed users")
+    parser.add_argument("--migrate", action="store_true",
+                        help="rebuild an existing table with the current DDL first (old rows kept in <table>_old)")
+    args = parser.parse_args()
+    if args.migrate:
+        migrate_table(CLICKHOUSE_TABLE, create_table)
+    if args.incremental and args.new_cycle:
+        start_refresh_cycle()
+    asyncio.run(crawl_batch(incremental=args.incremental))
 
 if __name__ == "__main__":
     try:
-        asyncio.run(crawl_batch())
+        main()
     except Exception as e:
         close_connections()
     except KeyboardInterrupt:
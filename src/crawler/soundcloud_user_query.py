@@ -1,22 +1,38 @@
-import json
-import random
-import time
-import httpx  # pip install httpx
-
-from src.crawler.soundcloud_track_crawler import logger
-from src.util.config import SOUNDCLOUD_CLIENT_ID
-from src.util.db import clickhouse_client, redis_client, close_connections
+import argparse
+import asyncio
+from urllib.parse import quote
+
+from src.util.ck_writer import AsyncBatchWriter
+from src.util.config import SOUNDCLOUD_API_BASE, SOUNDCLOUD_CLIENT_ID
+from src.util.db import clickhouse_client, redis_client, close_connections, migrate_table
+from src.util.http_session import ConnectionStats, create_session
+from src.util.logger import logger
+from src.util.metrics import start_metrics
+from src.util.soundcloud_api import FetchError, fetch_json
+from src.util.user_rows import UserRowEncoder
 
 # CONFIGURATION
-API_URL = f"https://api-v2.soundcloud.com/search/users?client_id={SOUNDCLOUD_CLIENT_ID}&offset=0&limit=100"
+API_URL = f"{SOUNDCLOUD_API_BASE}/search/users?client_id={SOUNDCLOUD_CLIENT_ID}&offset=0&limit=100"
 
 TABLE_NAME = "user_query"
 REDIS_KEY_PREFIX = "soundcloud:user_query:"
 
+KEYWORDS = ['AIcreated', 'AIgenerated', 'AI create',
+            'AI generated', 'AI created', 'AI Gen',
+            'AIGen', 'AIGEN', 'AIGC', 'AI', 'AI Music',
+            'ai', 'Artificial Intelligence',
+            'ai created', 'ai create', 'ai generated']
+# 同时翻页的关键词数；请求速率由 soundcloud_api 里共享的限速器控制
+KEYWORD_CONCURRENCY = 4
+# 每翻多少页确认一次写入并保存断点
+RESUME_EVERY_PAGES = 10
+
+user_rows = UserRowEncoder(extra_cols=['query_keyword'])
+
 
-def create_table():
+def create_table(table_name=TABLE_NAME):
     ddl = f"""
-    CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+    CREATE TABLE IF NOT EXISTS {table_name} (
         id UInt64,
         avatar_url String,
         city String,
@@ -49,160 +65,99 @@ def create_table():
         badges String,
         station_urn String,
         station_permalink String,
-        query_keyword String,
-        _raw Nested (
-            key String,
-            value String
-        )
+        query_keyword String{user_rows.raw_ddl}
     )
-    ENGINE = MergeTree
+    ENGINE = ReplacingMergeTree(last_modified)
     PARTITION BY toYYYYMM(created_at)
-    PRIMARY KEY id
-    ORDER BY (id, username, created_at)
+    ORDER BY id
     SETTINGS index_granularity = 8192;
     """
-    clickhouse_client.execute(ddl)
-
-def flatten_json(y):
-    out = {}
-    def flatten(x, name=''):
-        if type(x) is dict:
-            for a in x:
-                flatten(x[a], f'{name}{a}_')
-        elif type(x) is list:
-            out[name[:-1]] = json.dumps(x, ensure_ascii=False)
-        else:
-            out[name[:-1]] = x
-    flatten(y)
-    return out
+    clickhouse_client.command(ddl)
 
-def none_to_empty(val):
-    """Convert None to empty string, else return val."""
-    return "" if val is None else val
+def create_writer():
+    return AsyncBatchWriter(clickhouse_client, TABLE_NAME, user_rows.column_names,
+                            flush_rows=5000, flush_interval=5.0, column_oriented=True)
 
-def none_to_zero(val):
-    """Convert None to zero, else return val."""
-    return 0 if val is None else val
 
-def safe_json(obj):
-    try:
-        return json.dumps(obj, ensure_ascii=False)
-    except Exception:
-        return ""
+async def save_resume(writer, key, url):
+    # 行写入成功后才推进断点；写入失败时下次从上一个断点重抓
+    if await writer.sync():
+        redis_client.set(key, url if url else "")
 
-from datetime import datetime
 
-def parse_dt(val):
-    # Accepts ISO string or returns default datetime
-    if not val:
-        return datetime(1970, 1, 1, 0, 0, 0)
-    try:
-        # Remove Z if present, parse
-        return datetime.fromisoformat(val.replace("Z", "+00:00"))
-    except Exception:
-        return datetime(1970, 1, 1, 0, 0, 0)
-
-def insert_records(records, query_keyword):
-    rows = []
-    for rec in records:
-        flat = flatten_json(rec)
-        row = {
-            'id': flat.get('id', 0) or 0,
-            'avatar_url': none_to_empty(flat.get('avatar_url')),
-            'city': none_to_empty(flat.get('city')),
-            'comments_count': none_to_zero(flat.get('comments_count')),
-            'country_code': none_to_empty(flat.get('country_code')),
-            'created_at': parse_dt(flat.get('created_at') or '1970-01-01 00:00:00'),
-            'creator_subscriptions': [safe_json(rec.get('creator_subscriptions', []))],
-            'creator_subscription': safe_json(rec.get('creator_subscription', {})),
-            'description': none_to_empty(flat.get('description')),
-            'followers_count': none_to_zero(flat.get('followers_count')),
-            'followings_count': none_to_zero(flat.get('followings_count')),
-            'first_name': none_to_empty(flat.get('first_name')),
-            'full_name': none_to_empty(flat.get('full_name')),
-            'groups_count': none_to_zero(flat.get('groups_count')),
-            'kind': none_to_empty(flat.get('kind')),
-            'last_modified': parse_dt(flat.get('last_modified') or '1970-01-01 00:00:00'),
-            'last_name': none_to_empty(flat.get('last_name')),
-            'likes_count': none_to_zero(flat.get('likes_count')),
-            'playlist_likes_count': none_to_zero(flat.get('playlist_likes_count')),
-            'permalink': none_to_empty(flat.get('permalink')),
-            'permalink_url': none_to_empty(flat.get('permalink_url')),
-            'playlist_count': none_to_zero(flat.get('playlist_count')),
-            'reposts_count': rec.get('reposts_count', 0),  # Nullable, so leave as is
-            'track_count': none_to_zero(flat.get('track_count')),
-            'uri': none_to_empty(flat.get('uri')),
-            'urn': none_to_empty(flat.get('urn')),
-            'username': none_to_empty(flat.get('username')),
-            'verified': int(flat.get('verified', False)),
-            'visuals': safe_json(rec.get('visuals', {})),
-            'badges': safe_json(rec.get('badges', {})),
-            'station_urn': none_to_empty(flat.get('station_urn')),
-            'station_permalink': none_to_empty(flat.get('station_permalink')),
-            'query_keyword': query_keyword,
-            '_raw.key': [],
-            '_raw.value': []
-        }
-        for k, v in rec.items():
-            row['_raw.key'].append(none_to_empty(k))
-            row['_raw.value'].append(safe_json(v))
-        rows.append(tuple(row.values()))
-
-    # Insert remaining rows
-    if rows:
+async def fetch_and_store(session, writer, query_keyword, seen, load_from_redis=True):
+    """
+    Page through the search results of one keyword. ``seen`` holds the ids
+    already stored by any keyword in this run; overlapping variants only
+    write users that are new to the run.
+    """
+    key = REDIS_KEY_PREFIX + query_keyword
+    last_url = redis_client.get(key)
+    url = last_url.decode() if (load_from_redis and last_url) else API_URL + "&q=" + quote(query_keyword)
+    pages = fetched = written = 0
+    while url:
         try:
-            clickhouse_client.execute(
-                f"INSERT INTO {TABLE_NAME} VALUES",
-                rows
-            )
-        except Exception as e:
-            logger.error(f"Final batch insert failed: {e}")
+            data = await fetch_json(session, url, f"Query {query_keyword}", schema=user_rows.page_schema)
+        except FetchError as e:
+            logger.error(f"Error fetching or decoding JSON from {url}: {e}")
+            break
+
+        collection = data.get('collection', [])
+        fresh = [u for u in collection if u.get('id') not in seen]
+        seen.update(u.get('id') for u in fresh)
+        if fresh:
+            await writer.put(user_rows.encode(fresh, query_keyword=query_keyword))
+        pages += 1
+        fetched += len(collection)
+        written += len(fresh)
+        next_href = data.get('next_href')
+        if next_href:
+            if "client_id=" not in next_href:
+                next_href += f'&client_id={SOUNDCLOUD_CLIENT_ID}'
+            url = next_href
+        else:
+            url = None
+        if not url or pages % RESUME_EVERY_PAGES == 0:
+            await save_resume(writer, key, url)
+    logger.info(f"Keyword '{query_keyword}' done: {pages} pages, {fetched} users, {written} new")
 
 
-def fetch_and_store(query_keyword, load_from_redis=True):
-    key = REDIS_KEY_PREFIX + query_keyword
-    last_url = redis_client.get(key)
-    url = last_url.decode() if (load_from_redis and last_url) else API_URL + "&q=" + query_keyword
-    with httpx.Client(timeout=30) as client:
-        while url:
-            logger.info(f"Fetching: {url}")
-            try:
-                resp = client.get(url, timeout=10)
-                resp.raise_for_status()
-                data = resp.json()
-            except Exception as e:
-                logger.error(f"Error fetching or decoding JSON from {url}: {e}")
-                break
-
-            collection = data.get('collection', [])
-            logger.info(f"Fetched {len(collection)} records from {url}")
-            if collection:
-                insert_records(collection, query_keyword)
-            next_href = data.get('next_href')
-            if next_href:
-                if "client_id=" not in next_href:
-                    next_href += f'&client_id={SOUNDCLOUD_CLIENT_ID}'
-                url = next_href
-            else:
-                url = None
-            redis_client.set(key, url if url else "")
-            time.sleep(random.random())
-    logger.info("Done fetching all data.")
-
-def main():
+async def main(keywords=KEYWORDS):
+    start_metrics("user query")
     create_table()
-    keywords = ['AIcreated', 'AIgenerated', 'AI create',
-                'AI generated', 'AI created', 'AI Gen',
-                'AIGen', 'AIGEN', 'AIGC', 'AI', 'AI Music',
-                'ai', 'Artificial Intelligence',
-                'ai created', 'ai create', 'ai generated']
-    for query_keyword in keywords:
-        fetch_and_store(query_keyword)
+    seen = set()
+    stats = ConnectionStats()
+    writer = create_writer().start()
+    sem = asyncio.Semaphore(KEYWORD_CONCURRENCY)
+
+    async def crawl(session, query_keyword):
+        async with sem:
+            try:
+                await fetch_and_store(session, writer, query_keyword, seen)
+            except Exception:
+                logger.error("Keyword '%s' failed", query_keyword, exc_info=True)
+
+    try:
+        async with create_session(stats, limit=KEYWORD_CONCURRENCY * 2, limit_per_host=KEYWORD_CONCURRENCY) as session:
+            await asyncio.gather(*(crawl(session, kw) for kw in keywords))
+    finally:
+        await writer.close()
+    stats.log("User query")
+    logger.info(f"Done fetching all data: {len(seen)} distinct users.")
+
+def cli():
+    parser = argparse.ArgumentParser(description="Search users by keyword.")
+    parser.add_argument("--migrate", action="store_true",
+                        help="rebuild an existing table with the current DDL first (old rows kept in <table>_old)")
+    args = parser.parse_args()
+    if args.migrate:
+        migrate_table(TABLE_NAME, create_table)
+    asyncio.run(main())
 
 if __name__ == "__main__":
     try:
-        main()
+        cli()
     except Exception as e:
         close_connections()
     except KeyboardInterrupt:
-        close_connections()
\ No newline at end of file
+        close_connections()
@@ -1,262 +1,309 @@
+import argparse
 import asyncio
-import json
 import traceback
-from datetime import datetime
-from typing import List
 
-import aiohttp
-from dateutil import parser as date_parser
-
-from src.util.config import SOUNDCLOUD_CLIENT_ID, SOUNDCLOUD_APP_VERSION, CLICKHOUSE_DATABASE
-from src.util.db import close_connections, redis_client, clickhouse_client
+from src.util.checkpoint import CheckpointStore
+from src.util.ck_writer import AsyncBatchWriter
+from src.util.concurrency import create_limit
+from src.util.config import SOUNDCLOUD_API_BASE, SOUNDCLOUD_CLIENT_ID, SOUNDCLOUD_APP_VERSION, CLICKHOUSE_DATABASE
+from src.util.db import close_connections, migrate_table, redis_client, clickhouse_client
+from src.util.dedup import RecentWrites
+from src.util.frontier import Frontier
+from src.util.http_session import ConnectionStats, create_session
 from src.util.logger import logger
+from src.util.metric_snapshots import USER_METRICS, USER_METRICS_TABLE, MetricSnapshots, metrics_table_ddl
+from src.util.metrics import PAGES_PER_USER, QUEUE_DEPTH, WAIT_SECONDS, start_metrics
+from src.util.pipeline import LeasePipeline
+from src.util.seed_iterator import SeedIterator
+from src.util.shard import Shard, report_shard_metrics
+from src.util.soundcloud_api import FetchError, fetch_json
+from src.util.user_rows import UserRowEncoder
+from src.util.work_queue import WorkQueue
 
 CLIENT_ID = SOUNDCLOUD_CLIENT_ID
 APP_VERSION = SOUNDCLOUD_APP_VERSION
 
 TABLE_NAME = 'users'
-REDIS_KEY = 'soundcloud:snowbase:ck_offset_limit'
-BASE_URL="https://api-v2.soundcloud.com"
+REDIS_KEY = 'soundcloud:snowbase:ck_cursor'
+# 多台机器共享的种子批次队列；REDIS_KEY 游标记录的是已入队的位置
+QUEUE_NAME = 'soundcloud:snowbase:queue'
+BASE_URL = SOUNDCLOUD_API_BASE
 BATCH_LIMIT = 1000
-MAX_CONCURRENCY = 24
+# 并发扩展的用户数：初始值和上下限，实际窗口随 API 延迟和错误率调整（ADAPTIVE_CONCURRENCY=0 时固定为初始值）
+CONCURRENCY = 24
+MIN_CONCURRENCY = 4
+MAX_CONCURRENCY = 96
 
+# 雪球扩展：frontier / seen-set 的 Redis key 前缀与上限
+FRONTIER_KEY_PREFIX = 'soundcloud:snowbase'
+MAX_DEPTH = 3
+FRONTIER_MAX_LOCAL = 200000
+FRONTIER_MAX_TOTAL = 50000000
+FRONTIER_IDLE_SLEEP = 0.5
+# frontier 少于 并发窗口 * 该系数 个用户时就租下一批种子
+FRONTIER_LOW_FACTOR = 4
+# 正在翻页的用户的断点；这些用户已在 seen-set 里，重启后要先从断点续抓
+CHECKPOINT_PREFIX = f'{FRONTIER_KEY_PREFIX}:checkpoint'
+# users 和 user_metrics 的行攒够这么多或到时间就后台写入
+INSERT_FLUSH_ROWS = 20000
+INSERT_FLUSH_INTERVAL = 5.0
 
-def robust_parse_dt(dt_str):
-    if not dt_str:
-        return datetime(1970, 1, 1)
-    try:
-        return date_parser.parse(dt_str)
-    except Exception as e:
-        logger.warning(f"Failed to parse datetime '{dt_str}': {e}, using fallback.")
-        try:
-            return datetime.fromtimestamp(int(''.join(filter(str.isdigit, dt_str))) // 1000)
-        except Exception as e2:
-            logger.error(f"Fallback datetime failed for '{dt_str}': {e2}")
-            return datetime(1970, 1, 1)
+# 同一个用户会被每个关注者重复返回，写入前先按 (id, last_modified, 计数) 去重；
+# 计数变化不改 last_modified，不带上计数的话刷新到的新粉丝数会被当成重复丢掉
+USER_COUNTERS = ['followers_count', 'followings_count', 'track_count', 'likes_count', 'playlist_likes_count',
+                 'playlist_count', 'reposts_count', 'comments_count', 'groups_count']
+recent_writes = RecentWrites(counter_keys=USER_COUNTERS)
+user_rows = UserRowEncoder()
+# 粉丝数等计数变化时写一行到窄表，用于增长曲线
+user_snapshots = MetricSnapshots(redis_client, f'{FRONTIER_KEY_PREFIX}:snapshot', USER_METRICS, 'user_id')
 
 
-def get_ck_offset_limit_from_redis() -> (int, int):
-    offset = redis_client.hget(REDIS_KEY, 'offset')
-    limit = redis_client.hget(REDIS_KEY, 'limit')
-    return (int(offset) if offset else 0, int(limit) if limit else BATCH_LIMIT)
+def create_table(table_name=TABLE_NAME):
+    ddl = f"""
+    CREATE TABLE IF NOT EXISTS {CLICKHOUSE_DATABASE}.{table_name} (
+        id UInt64,
+        avatar_url String,
+        city String,
+        comments_count Int32,
+        country_code String,
+        created_at DateTime,
+        creator_subscriptions Array(String),
+        creator_subscription String,
+        description String,
+        followers_count UInt32,
+        followings_count UInt32,
+        first_name String,
+        full_name String,
+        groups_count UInt32,
+        kind String,
+        last_modified DateTime,
+        last_name String,
+        likes_count UInt32,
+        playlist_likes_count UInt32,
+        permalink String,
+        permalink_url String,
+        playlist_count UInt32,
+        reposts_count Nullable(Int32),
+        track_count UInt32,
+        uri String,
+        urn String,
+        username String,
+        verified UInt8,
+        visuals String,
+        badges String,
+        station_urn String,
+        station_permalink String{user_rows.raw_ddl}
+    )
+    ENGINE = ReplacingMergeTree(last_modified)
+    PARTITION BY toYYYYMM(created_at)
+    ORDER BY id
+    SETTINGS index_granularity = 8192;
+    """
+    clickhouse_client.command(ddl)
 
-def set_ck_offset_limit_to_redis(offset: int, limit: int):
-    redis_client.hset(REDIS_KEY, mapping={'offset': offset, 'limit': limit})
+def create_metrics_table(table_name=USER_METRICS_TABLE):
+    clickhouse_client.command(metrics_table_ddl(f"{CLICKHOUSE_DATABASE}.{table_name}", 'user_id', USER_METRICS))
 
-def get_seed_ids_from_ck(ch_client, offset=0, limit=BATCH_LIMIT) -> List[int]:
-    try:
-        sql = f"SELECT id FROM {CLICKHOUSE_DATABASE}.{TABLE_NAME} ORDER BY created_at DESC LIMIT {limit} OFFSET {offset}"
-        result = ch_client.query(sql)
-        ids = set([int(row[0]) for row in result.result_rows])
-        logger.info(f"Fetched {len(ids)} seed ids from ClickHouse for snowbase. (offset={offset}, limit={limit})")
-        return ids
-    except Exception as e:
-        logger.error(f"Error fetching seed ids from ClickHouse: {e}")
-        return []
 
-async def fetch_followers(session, user_id, url, max_retries=3, retry_backoff=2):
-    attempt = 0
-    while attempt < max_retries:
-        try:
-            async with session.get(url, timeout=60) as resp:
-                if resp.status != 200:
-                    t = await resp.text()
-                    logger.warning(f"Failed to fetch followers for url {url}: HTTP {resp.status} - {t}")
-                    if 500 <= resp.status < 600:  # Retry on server errors
-                        attempt += 1
-                        await asyncio.sleep(retry_backoff * attempt)
-                        continue
-                    return None
-                return await resp.json()
-        except Exception as e:
-            logger.error(f"Exception in fetch_followers for user {user_id}: {e}. URL: {url}. Traceback; {traceback.format_exc()}")
-            attempt += 1
-            await asyncio.sleep(retry_backoff * attempt)
-    logger.error(f"Exceeded max retries for fetch_followers for user {user_id}. URL: {url}")
-    return None
+# 多进程运行时种子按 id 分片，每个分片有自己的游标、队列、断点和 frontier 溢出集合；
+# 只有 seen-set 是全局共享的，扩展出的用户只会被一个分片抓一次
+def create_seed_iterator(ch_client, limit=BATCH_LIMIT, shard=Shard()):
+    return SeedIterator(ch_client, redis_client, REDIS_KEY + shard.suffix, table=f"{CLICKHOUSE_DATABASE}.{TABLE_NAME}",
+                        batch_size=limit, where=shard.where())
 
-def flatten_json(y):
-    out = {}
-    def flatten(x, name=''):
-        if type(x) is dict:
-            for a in x:
-                flatten(x[a], f'{name}{a}_')
-        elif type(x) is list:
-            out[name[:-1]] = json.dumps(x, ensure_ascii=False)
-        else:
-            out[name[:-1]] = x
-    flatten(y)
-    return out
+def create_work_queue(shard=Shard()):
+    return WorkQueue(redis_client, QUEUE_NAME + shard.suffix)
 
-def none_to_empty(val):
-    """Convert None to empty string, else return str(val)."""
-    if val is None:
-        return ""
-    if isinstance(val, str):
-        return val
-    return str(val)
+def create_checkpoint(shard=Shard()):
+    return CheckpointStore(redis_client, CHECKPOINT_PREFIX + shard.suffix)
 
-def none_to_zero(val):
-    """Convert None to zero, else return val."""
-    if val is None:
-        return 0
-    try:
-        return int(val)
-    except Exception:
-        return 0
+async def fetch_followers(session, user_id, url):
+    return await fetch_json(session, url, f"Followers of user {user_id}", schema=user_rows.page_schema)
 
-def safe_json(obj):
-    try:
-        return json.dumps(obj, ensure_ascii=False)
-    except Exception:
-        return ""
+def create_writer():
+    return AsyncBatchWriter(clickhouse_client, TABLE_NAME, user_rows.column_names,
+                            flush_rows=INSERT_FLUSH_ROWS, flush_interval=INSERT_FLUSH_INTERVAL,
+                            column_oriented=True)
 
-def parse_dt(val):
-    # Accepts ISO string or returns default datetime
-    if not val:
-        return datetime(1970, 1, 1, 0, 0, 0)
-    try:
-        return datetime.fromisoformat(val.replace("Z", "+00:00"))
-    except Exception:
-        try:
-            return robust_parse_dt(val)
-        except Exception:
-            return datetime(1970, 1, 1, 0, 0, 0)
+def create_metrics_writer():
+    return AsyncBatchWriter(clickhouse_client, USER_METRICS_TABLE, user_snapshots.column_names,
+                            flush_rows=INSERT_FLUSH_ROWS, flush_interval=INSERT_FLUSH_INTERVAL,
+                            column_oriented=True)
 
-def insert_records(records, user_id, client):
-    rows = []
-    for rec in records:
-        flat = flatten_json(rec)
-        # All .get() for non-nullable string cols are wrapped with none_to_empty
-        row = {
-            'id': none_to_zero(flat.get('id', 0)),
-            'avatar_url': none_to_empty(flat.get('avatar_url')),
-            'city': none_to_empty(flat.get('city')),
-            'comments_count': none_to_zero(flat.get('comments_count')),
-            'country_code': none_to_empty(flat.get('country_code')),
-            'created_at': parse_dt(flat.get('created_at') or '1970-01-01 00:00:00'),
-            'creator_subscriptions': [safe_json(rec.get('creator_subscriptions', []))],
-            'creator_subscription': safe_json(rec.get('creator_subscription', {})),
-            'description': none_to_empty(flat.get('description')),
-            'followers_count': none_to_zero(flat.get('followers_count')),
-            'followings_count': none_to_zero(flat.get('followings_count')),
-            'first_name': none_to_empty(flat.get('first_name')),
-            'full_name': none_to_empty(flat.get('full_name')),
-            'groups_count': none_to_zero(flat.get('groups_count')),
-            'kind': none_to_empty(flat.get('kind')),
-            'last_modified': parse_dt(flat.get('last_modified') or '1970-01-01 00:00:00'),
-            'last_name': none_to_empty(flat.get('last_name')),
-            'likes_count': none_to_zero(flat.get('likes_count')),
-            'playlist_likes_count': none_to_zero(flat.get('playlist_likes_count')),
-            'permalink': none_to_empty(flat.get('permalink')),
-            'permalink_url': none_to_empty(flat.get('permalink_url')),
-            'playlist_count': none_to_zero(flat.get('playlist_count')),
-            'reposts_count': rec.get('reposts_count', 0),  # Nullable, so leave as is
-            'track_count': none_to_zero(flat.get('track_count')),
-            'uri': none_to_empty(flat.get('uri')),
-            'urn': none_to_empty(flat.get('urn')),
-            'username': none_to_empty(flat.get('username')),
-            'verified': int(flat.get('verified', False)),
-            'visuals': safe_json(rec.get('visuals', {})),
-            'badges': safe_json(rec.get('badges', {})),
-            'station_urn': none_to_empty(flat.get('station_urn')),
-            'station_permalink': none_to_empty(flat.get('station_permalink')),
-            '_raw.key': [],
-            '_raw.value': []
-        }
-        for k, v in rec.items():
-            row['_raw.key'].append(none_to_empty(k))
-            row['_raw.value'].append(safe_json(v))
-        rows.append(tuple(row.values()))
-
-    if rows:
-        try:
-            client.insert(
-                TABLE_NAME,
-                rows,
-                column_names=[
-                    'id', 'avatar_url', 'city', 'comments_count', 'country_code', 'created_at',
-                    'creator_subscriptions', 'creator_subscription', 'description', 'followers_count',
-                    'followings_count', 'first_name', 'full_name', 'groups_count', 'kind', 'last_modified',
-                    'last_name', 'likes_count', 'playlist_likes_count', 'permalink', 'permalink_url',
-                    'playlist_count', 'reposts_count', 'track_count', 'uri', 'urn', 'username', 'verified',
-                    'visuals', 'badges', 'station_urn', 'station_permalink', '_raw.key', '_raw.value'
-                ]
-            )
-            logger.info(f"ClickHouse insert success, user id: {user_id}, table name: {TABLE_NAME}, length: {len(rows)}")
-        except Exception as e:
-            logger.error(f"ClickHouse insert failed: {e}")
+async def insert_records(records, user_id, writer, metrics_writer):
+    # 计数变化不一定会改 last_modified，快照要在去重之前取
+    await metrics_writer.put(user_snapshots.changed(records))
+    fresh = recent_writes.filter(records)
+    if fresh:
+        await writer.put(user_rows.encode(fresh))
+        logger.debug("Queued %d users from the followers of %s", len(fresh), user_id)
 
-async def snowball_user(user_id, queue: asyncio.Queue, ch_client):
+def create_frontier(shard=Shard()):
+    # 每个进程只统计、回填自己溢出的用户；上限按分片数平分
+    frontier = Frontier(redis_client, FRONTIER_KEY_PREFIX, max_depth=MAX_DEPTH, max_local=FRONTIER_MAX_LOCAL,
+                        max_total=FRONTIER_MAX_TOTAL // shard.count, suffix=shard.suffix)
+    if shard.count > 1:
+        # 旧版本各分片共用一个溢出集合，按 id 把里面的用户分给各分片
+        frontier.adopt(f"{FRONTIER_KEY_PREFIX}:frontier", shard.owns)
+    return frontier
 
-    async with aiohttp.ClientSession() as session:
-        url = f"{BASE_URL}/users/{user_id}/followers?client_id={CLIENT_ID}&offset=0&limit=100&linked_partitioning=1&app_version={APP_VERSION}&app_locale=en"
-        while True:
+async def snowball_user(session, user_id, depth, frontier: Frontier, writer, checkpoint, metrics_writer,
+                        url=None):
+    if url is None and depth == 0:
+        # 失败后被退回、重新租到的种子从断点续抓
+        state = checkpoint.resume(user_id)
+        url = state.get('next_href') if state else None
+    url = url or f"{BASE_URL}/users/{user_id}/followers?client_id={CLIENT_ID}&offset=0&limit=100&linked_partitioning=1&app_version={APP_VERSION}&app_locale=en"
+    pages = 0
+    while True:
+        try:
             data = await fetch_followers(session, user_id, url)
-            if not data or 'collection' not in data:
-                logger.info(f"No data or collection for user {user_id}")
-                break
-            collections = data['collection']
-            if collections:
-                insert_records(collections, user_id, ch_client)
-            # for u in collections:
-            #     uid = u.get('id')
-            #     if uid is not None and uid not in seen:
-            #         queue.put_nowait(uid)
-            next_href = data.get('next_href', None)
-            if not next_href:
+        except Exception as e:
+            if isinstance(e, FetchError) and e.permanent:
+                # 账号被删除或设为私密：重试也没用，记为完成，断点随之清掉
+                logger.warning("User %s: giving up, %s", user_id, e)
                 break
-            url = next_href + f'&client_id={CLIENT_ID}&linked_partitioning=1&app_version=1748345262&app_locale=en'
+            # 不标记完成、保留这一页的断点：种子用户所在批次的租约被退回，重新租到时从这一页接着抓；
+            # 扩展出的用户在下次启动时由 resume_in_progress 续抓。断点随下一次 flush_after 落盘
+            checkpoint.save_page(user_id, url, depth=depth)
+            raise
+        if not data or 'collection' not in data:
+            logger.debug("No data or collection for user %s", user_id)
+            break
+        pages += 1
+        collections = data['collection']
+        if collections:
+            await insert_records(collections, user_id, writer, metrics_writer)
+            frontier.push_many(((u.get('id'), u.get('followers_count')) for u in collections), depth + 1)
+        next_href = data.get('next_href', None)
+        if not next_href:
+            break
+        url = next_href + f'&client_id={CLIENT_ID}&linked_partitioning=1&app_version=1748345262&app_locale=en'
+        checkpoint.save_page(user_id, url, depth=depth)
+    PAGES_PER_USER.observe(pages, "snowball")
+    checkpoint.mark_done(user_id)
+    if checkpoint.should_flush():
+        # 行写入 ClickHouse 之后才写断点
+        await checkpoint.flush_after(writer)
 
-async def worker(queue):
-    ch_client = clickhouse_client
+async def resume_in_progress(session, frontier: Frontier, writer, checkpoint, metrics_writer, limit):
+    """Finish the users that were mid-pagination when the last run stopped."""
+    pending = checkpoint.in_progress()
+    if not pending:
+        return
+    logger.info(f"Resuming {len(pending)} users from checkpoint")
+    async def resume_one(user_id, state):
+        async with limit:
+            try:
+                await snowball_user(session, user_id, state.get('depth', 0), frontier, writer, checkpoint,
+                                    metrics_writer, url=state.get('next_href'))
+            except Exception as e:
+                logger.error(f"Error resuming user {user_id}: {e}")
+    await asyncio.gather(*(resume_one(uid, state) for uid, state in pending.items()))
+    await checkpoint.flush_after(writer)
+
+async def worker(session, frontier: Frontier, writer, checkpoint, metrics_writer, state, pipeline, limit):
     while True:
-        user_id = await queue.get()
-        logger.info(f"worker {user_id}")
-        if user_id is None:
-            queue.task_done()
-            break
+        item = frontier.pop()
+        if item is None:
+            # frontier 为空、没有 worker 还在扩展、种子也已全部租出时才退出
+            if state['active'] == 0 and pipeline.finished:
+                break
+            await asyncio.sleep(FRONTIER_IDLE_SLEEP)
+            WAIT_SECONDS.observe(FRONTIER_IDLE_SLEEP, "frontier")
+            continue
+        user_id, depth = item
+        logger.debug("worker %s (depth %d)", user_id, depth)
+        state['active'] += 1
+        ok = True
         try:
-            await snowball_user(user_id, queue, ch_client)
+            # 取出的用户先计入 active，再等并发窗口里的空位
+            async with limit:
+                await snowball_user(session, user_id, depth, frontier, writer, checkpoint, metrics_writer)
         except Exception as e:
-            logger.error(f"Error processing user in worker: {e}")
-            logger.error(traceback.format_exc())
+            ok = False
+            logger.error("Error processing user %s in worker: %s", user_id, e, exc_info=True)
         finally:
-            queue.task_done()
+            state['active'] -= 1
+        # 种子用户（depth 0）完成后计入所属批次，批次内全部完成才确认租约
+        if depth == 0:
+            pipeline.done(user_id, ok)
 
-async def process_batch(offset, limit):
-    ch_client = clickhouse_client
-    snow_ids = get_seed_ids_from_ck(ch_client, offset=offset, limit=limit)
-    if not snow_ids:
-        logger.info("No more seed ids from CK. All done.")
-        return False
+def create_pipeline(queue, seeds, frontier: Frontier, checkpoint, limit, on_complete=None):
+    """
+    Seeds go into the frontier at depth 0 as before; the next batch is
+    leased as soon as the frontier runs low instead of after it is empty,
+    so the workers never wait for the slowest user of a batch.
+    """
+    async def feed(items):
+        queued = frontier.push_new(((uid, 0) for uid in items), 0)
+        # 上次失败的种子已在 seen-set 里，但断点还在：退回的批次重新租到时要再排一次
+        new = set(queued)
+        retry = checkpoint.resumable([uid for uid in items if uid not in new])
+        if retry:
+            frontier.requeue(retry, 0)
+            logger.info(f"Retrying {len(retry)} seed users from their checkpoints")
+            queued = queued + retry
+        logger.info(f"{len(items)} seed ids from CK, {len(queued)} new, frontier size {len(frontier)}.")
+        return queued
 
-    queue = asyncio.Queue()
-    for uid in snow_ids:
-        await queue.put(uid)
-    logger.info(f"{len(snow_ids)} seed ids from CK. All done.")
-    workers = [asyncio.create_task(worker(queue)) for _ in range(MAX_CONCURRENCY)]
-    await queue.join()
-    # Put sentinel None for each worker to signal exit
-    for _ in workers:
-        await queue.put(None)
-    await asyncio.gather(*workers)
-    return True
+    return LeasePipeline(queue, seeds, on_complete=on_complete, feed=feed,
+                         ready=lambda: len(frontier) < limit.window * FRONTIER_LOW_FACTOR)
 
-async def main():
-    offset, limit = get_ck_offset_limit_from_redis()
-    while True:
-        logger.info(f"Snowballing batch: offset={offset}, limit={limit}")
-        success = await process_batch(offset, limit)
-        if not success:
-            logger.info("No more batches to process. Exiting.")
-            break
-        offset += limit
-        set_ck_offset_limit_to_redis(offset, limit)
+async def main(shard=Shard()):
+    start_metrics(f"snowball {shard.label}", shard.index)
+    create_table()
+    create_metrics_table()
+    seeds = create_seed_iterator(clickhouse_client, shard=shard)
+    queue = create_work_queue(shard)
+    checkpoint = create_checkpoint(shard)
+    frontier = create_frontier(shard)
+    QUEUE_DEPTH.track(lambda: len(frontier), "frontier")
+    stats = ConnectionStats()
+    state = {'active': 0}
+    writer = create_writer().start()
+    metrics_writer = create_metrics_writer().start()
+    limit = create_limit("snowball", CONCURRENCY, MIN_CONCURRENCY, MAX_CONCURRENCY).start()
+
+    async def on_complete(batch):
+        # 行先落盘，再写断点，最后确认租约
+        await checkpoint.flush_after(writer)
+        stats.log(f"Snowball {shard.label}")
+        report_shard_metrics(redis_client, FRONTIER_KEY_PREFIX, shard, batches=pipeline.batches_done + 1,
+                             frontier_size=len(frontier), rows_flushed=writer.rows_flushed,
+                             rows_lost=writer.rows_lost, duplicates_skipped=recent_writes.skipped,
+                             snapshots=user_snapshots.written, utilization=round(limit.utilization(), 3),
+                             concurrency=limit.window,
+                             **stats.snapshot())
+
+    pipeline = create_pipeline(queue, seeds, frontier, checkpoint, limit, on_complete)
+    try:
+        async with create_session(stats, limit=MAX_CONCURRENCY * 2, limit_per_host=MAX_CONCURRENCY) as session:
+            await resume_in_progress(session, frontier, writer, checkpoint, metrics_writer, limit)
+            pipeline.start()
+            await asyncio.gather(*(worker(session, frontier, writer, checkpoint, metrics_writer, state, pipeline, limit)
+                                   for _ in range(MAX_CONCURRENCY)))
+    finally:
+        limit.stop()
+        await pipeline.close()
+        await checkpoint.flush_after(writer)
+        await writer.close()
+        await metrics_writer.close()
+        frontier.persist()
+    logger.info("No more batches to process. Exiting.")
+
+def cli():
+    parser = argparse.ArgumentParser(description="Snowball users outward from the seed users' followers.")
+    parser.add_argument("--migrate", action="store_true",
+                        help="rebuild an existing table with the current DDL first (old rows kept in <table>_old)")
+    args = parser.parse_args()
+    if args.migrate:
+        migrate_table(TABLE_NAME, create_table)
+    asyncio.run(main())
 
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        cli()
     except Exception as e:
         logger.error(traceback.format_exc())
         close_connections()
@@ -0,0 +1,128 @@
+import json
+
+from src.util.frontier import SeenSet
+from src.util.logger import logger
+
+# 每完成多少个用户（或多少次翻页）合并成一次 Redis 写入
+FLUSH_EVERY_USERS = 50
+FLUSH_EVERY_PAGES = 500
+
+
+class CheckpointStore:
+    """
+    Per-user crawl checkpoints in Redis.
+
+    Finished user ids go into a sharded bitmap (``{prefix}:done``) and the
+    ``next_href`` of users still being paginated into a hash
+    (``{prefix}:pages``). Updates are buffered and written in one pipelined
+    round-trip per ``flush_every_users`` finished users, so after a restart
+    a crawler skips finished users and resumes the others at their first
+    unfinished page instead of redoing the whole batch.
+    """
+
+    def __init__(self, redis_client, prefix, flush_every_users=FLUSH_EVERY_USERS,
+                 flush_every_pages=FLUSH_EVERY_PAGES):
+        self.redis_client = redis_client
+        self.done = SeenSet(redis_client, f"{prefix}:done")
+        self.pages_key = f"{prefix}:pages"
+        self.flush_every_users = flush_every_users
+        self.flush_every_pages = flush_every_pages
+        self._done = []
+        self._pages = {}
+
+    def pending(self, user_ids):
+        """Drop the ids already marked as finished, including those not flushed yet."""
+        buffered = set(self._done)
+        user_ids = [uid for uid in user_ids if uid not in buffered]
+        try:
+            finished = self.done.contains_many(user_ids)
+        except Exception as e:
+            logger.error(f"Checkpoint lookup failed, crawling whole batch: {e}")
+            return user_ids
+        return [uid for uid, is_done in zip(user_ids, finished) if not is_done]
+
+    def resume(self, user_id):
+        """Saved state (``{"next_href": ..., ...}``) of an unfinished user, or None."""
+        state = self._pages.get(user_id)
+        if state is not None:
+            return state
+        try:
+            raw = self.redis_client.hget(self.pages_key, user_id)
+        except Exception as e:
+            logger.error(f"Checkpoint resume lookup failed for {user_id}: {e}")
+            return None
+        return json.loads(raw) if raw else None
+
+    def resumable(self, user_ids):
+        """The ids among ``user_ids`` that have a saved page (one round-trip for those not buffered)."""
+        lookup = [uid for uid in user_ids if uid not in self._pages]
+        try:
+            saved = self.redis_client.hmget(self.pages_key, lookup) if lookup else []
+        except Exception as e:
+            logger.error(f"Checkpoint lookup failed for {len(lookup)} users: {e}")
+            saved = [None] * len(lookup)
+        found = {uid for uid, raw in zip(lookup, saved) if raw}
+        return [uid for uid in user_ids if uid in self._pages or uid in found]
+
+    def in_progress(self):
+        """All users that were being paginated when the last run stopped."""
+        out = {}
+        for uid, raw in self.redis_client.hscan_iter(self.pages_key, count=1000):
+            out[int(uid)] = json.loads(raw)
+        return out
+
+    def clear(self):
+        """Drop all checkpoints, e.g. before starting a new refresh cycle."""
+        self._done, self._pages = [], {}
+        self.done.clear()
+        self.redis_client.delete(self.pages_key)
+
+    def save_page(self, user_id, next_href, **extra):
+        self._pages[user_id] = {"next_href": next_href, **extra}
+
+    def mark_done(self, user_id):
+        self._pages.pop(user_id, None)
+        self._done.append(user_id)
+
+    def should_flush(self):
+        return len(self._done) >= self.flush_every_users or len(self._pages) >= self.flush_every_pages
+
+    def take(self):
+        """
+        Detach the buffered updates. Callers whose rows go through an async
+        writer take first, wait for the writer to flush, then ``commit``.
+        """
+        done, pages = self._done, self._pages
+        self._done, self._pages = [], {}
+        return done, pages
+
+    def commit(self, done, pages):
+        if not done and not pages:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            if pages:
+                pipe.hset(self.pages_key, mapping={uid: json.dumps(state) for uid, state in pages.items()})
+            if done:
+                pipe.hdel(self.pages_key, *done)
+                self.done.add_to_pipeline(pipe, done)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Checkpoint flush failed ({len(done)} users, {len(pages)} pages): {e}")
+
+    def flush(self):
+        self.commit(*self.take())
+
+    async def flush_after(self, writer):
+        """
+        Commit the buffered updates once ``writer`` (an ``AsyncBatchWriter``)
+        has flushed every row queued so far. If rows were lost the updates
+        are dropped, so those users are crawled again on the next run.
+        """
+        done, pages = self.take()
+        if not done and not pages:
+            return
+        if await writer.sync():
+            self.commit(done, pages)
+        else:
+            logger.warning(f"Writer lost rows, not checkpointing {len(done)} users / {len(pages)} pages")
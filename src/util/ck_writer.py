@@ -0,0 +1,171 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.util.logger import logger
+from src.util.metrics import INSERT_ROWS, INSERT_SECONDS, QUEUE_DEPTH, ROWS_WRITTEN, WAIT_SECONDS
+
+# 默认刷写阈值：行数或时间任一满足即刷写
+FLUSH_ROWS = 20000
+FLUSH_INTERVAL = 5.0
+# 队列中最多积压的 put() 批次数，超过后生产者会被挂起（背压）
+MAX_PENDING_BATCHES = 64
+
+_STOP = object()
+
+
+class _Sync:
+    def __init__(self):
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class AsyncBatchWriter:
+    """
+    Background writer stage for ClickHouse.
+
+    Producers call ``await writer.put(rows)`` from any coroutine; rows are
+    collected from all of them and flushed to ``table`` in large blocks on an
+    executor thread, so the event loop never waits on an insert round-trip.
+    When the writer falls behind, the bounded queue makes ``put`` wait.
+
+    With ``column_oriented=True`` producers pass one list per column
+    instead of rows, and blocks are sent with a columnar insert.
+    """
+
+    def __init__(self, client, table, column_names, flush_rows=FLUSH_ROWS,
+                 flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING_BATCHES,
+                 column_oriented=False):
+        self.client = client
+        self.table = table
+        self.column_names = column_names
+        self.column_oriented = column_oriented
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        # clickhouse_connect 客户端不是线程安全的，只用一个线程串行写入
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"ck-writer-{table}")
+        self.rows_flushed = 0
+        self.rows_lost = 0
+        self.flushes = 0
+        self._buffer = self._empty_buffer()
+        self._buffered_rows = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            QUEUE_DEPTH.track(self.queue.qsize, f"writer:{self.table}")
+        return self
+
+    def _empty_buffer(self):
+        return [[] for _ in self.column_names] if self.column_oriented else []
+
+    def _count(self, item):
+        if self.column_oriented:
+            return len(item[0]) if item else 0
+        return len(item)
+
+    def _extend(self, item):
+        if self.column_oriented:
+            for column, values in zip(self._buffer, item):
+                column.extend(values)
+        else:
+            self._buffer.extend(item)
+        self._buffered_rows += self._count(item)
+
+    async def put(self, data):
+        """Queue rows (or, in column-oriented mode, a list of columns)."""
+        if data and self._count(data):
+            if self.queue.full():
+                started = time.perf_counter()
+                await self.queue.put(data)
+                WAIT_SECONDS.observe(time.perf_counter() - started, "writer")
+            else:
+                self.queue.put_nowait(data)
+
+    async def sync(self):
+        """
+        Wait until every row queued before this call has been flushed.
+        Returns False if any rows were lost in the meantime.
+        """
+        lost_before = self.rows_lost
+        if self._task is None or self._task.done():
+            return self._buffered_rows == 0 and self.queue.empty()
+        marker = _Sync()
+        await self.queue.put(marker)
+        await marker.future
+        return self.rows_lost == lost_before
+
+    async def _flush(self):
+        if not self._buffered_rows:
+            return
+        data, n = self._buffer, self._buffered_rows
+        self._buffer, self._buffered_rows = self._empty_buffer(), 0
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        INSERT_ROWS.observe(n, self.table)
+        try:
+            await loop.run_in_executor(self.executor, self._insert, data)
+            self.rows_flushed += n
+            self.flushes += 1
+            INSERT_SECONDS.observe(time.monotonic() - started, self.table)
+            ROWS_WRITTEN.inc(n, self.table, "ok")
+            logger.info("Flushed %d rows to %s in %.2fs", n, self.table, time.monotonic() - started)
+        except Exception:
+            self.rows_lost += n
+            ROWS_WRITTEN.inc(n, self.table, "lost")
+            logger.error("ClickHouse insert into %s failed, %d rows lost", self.table, n, exc_info=True)
+
+    def _insert(self, data):
+        self.client.insert(self.table, data, column_names=self.column_names,
+                           column_oriented=self.column_oriented)
+
+    async def _run(self):
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if item is _STOP:
+                self.queue.task_done()
+                await self._flush()
+                return
+            if isinstance(item, _Sync):
+                self.queue.task_done()
+                await self._flush()
+                deadline = time.monotonic() + self.flush_interval
+                item.future.set_result(None)
+                continue
+            if item is not None:
+                self._extend(item)
+                self.queue.task_done()
+            if self._buffered_rows >= self.flush_rows or time.monotonic() >= deadline:
+                await self._flush()
+                deadline = time.monotonic() + self.flush_interval
+
+    async def close(self):
+        """Drain the queue, flush what is left and report flushed/lost row counts."""
+        if self._task is not None:
+            if not self._task.done():
+                await self.queue.put(_STOP)
+            try:
+                await self._task
+            except (Exception, asyncio.CancelledError):
+                logger.error("Writer for %s stopped abnormally", self.table, exc_info=True)
+            self._task = None
+        # 写入任务异常退出时，队列和缓冲区里剩下的行都算丢失
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if isinstance(item, _Sync):
+                item.future.set_result(None)
+            elif item is not _STOP:
+                self.rows_lost += self._count(item)
+        self.rows_lost += self._buffered_rows
+        self._buffer, self._buffered_rows = self._empty_buffer(), 0
+        self.executor.shutdown(wait=True)
+        QUEUE_DEPTH.untrack(f"writer:{self.table}")
+        logger.info(f"Writer for {self.table} closed: {self.rows_flushed} rows flushed "
+                    f"in {self.flushes} blocks, {self.rows_lost} rows lost")
+        return self.rows_flushed, self.rows_lost
@@ -0,0 +1,44 @@
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from src.util.config import SOUNDCLOUD_CLIENT_IDS
+from src.util.logger import logger
+
+
+def with_client_id(url, client_id):
+    """Return ``url`` with its ``client_id`` query parameter set to ``client_id``."""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "client_id"]
+    query.append(("client_id", client_id))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+
+
+class ClientIdPool:
+    """
+    Rotates SoundCloud client_ids. A 401 on a client_id is treated as a
+    credential rotation event: the id is retired and the next one is used.
+    """
+
+    def __init__(self, client_ids):
+        self.client_ids = [c for c in dict.fromkeys(client_ids) if c]
+        self.index = 0
+        self.retired = set()
+
+    def current(self):
+        return self.client_ids[self.index] if self.client_ids else None
+
+    def rotate(self, bad_id):
+        """Retire ``bad_id``; returns True if another usable id is now current."""
+        if bad_id in self.retired:
+            return self.current() not in self.retired
+        self.retired.add(bad_id)
+        for offset in range(1, len(self.client_ids) + 1):
+            candidate = self.client_ids[(self.index + offset) % len(self.client_ids)]
+            if candidate not in self.retired:
+                self.index = (self.index + offset) % len(self.client_ids)
+                logger.warning(f"client_id {bad_id} rejected, rotated to {candidate}")
+                return True
+        logger.error("All SoundCloud client_ids have been rejected")
+        return False
+
+
+client_ids = ClientIdPool(SOUNDCLOUD_CLIENT_IDS)
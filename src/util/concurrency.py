@@ -0,0 +1,194 @@
+import asyncio
+import time
+from collections import deque
+
+from src.util.config import ADAPTIVE_CONCURRENCY
+from src.util.logger import logger
+from src.util.metrics import CONCURRENCY
+
+# 窗口平均 RTT 高出基准 RTT 的 TOLERANCE 倍以上才开始收缩
+TOLERANCE = 1.5
+# 基准 RTT 取观测到的最小值（Vegas），变差时每个窗口只向当前值靠拢 1/BASE_AGING，应对线路整体变慢
+BASE_AGING = 600
+# 每个窗口至少这么多样本、这么长时间才调整一次
+WINDOW_SAMPLES = 10
+WINDOW_SECONDS = 1.0
+# 新值与旧值的混合比例，避免窗口大小来回跳
+SMOOTHING = 0.2
+# 每次调整在 limit * gradient 之上额外允许的排队数，决定增长速度
+QUEUE_SIZE = 4
+# 窗口内 429 / 5xx / 超时的占比超过该值时直接乘性收缩
+ERROR_THRESHOLD = 0.1
+BACKOFF = 0.75
+
+_active = []
+
+
+class AdaptiveLimit:
+    """
+    Concurrency window sized from request latency and errors (gradient2,
+    with a Vegas-style base latency).
+
+    Every API request reports its latency and outcome (``sample``). Once a
+    window has ``WINDOW_SAMPLES`` samples and ``WINDOW_SECONDS`` elapsed,
+    its mean latency is compared with the base latency (the lowest window
+    mean seen, slowly aged upwards): while they are close the window grows
+    by about ``QUEUE_SIZE`` per step, as latency rises above ``TOLERANCE``
+    times the base it shrinks (at most halving), and if more than
+    ``ERROR_THRESHOLD`` of the requests
+    were throttled or failed it is cut by ``BACKOFF``. The window stays in
+    ``[min_limit, max_limit]`` and does not grow while less than half of
+    it is in use.
+
+    Holders take a slot with ``async with limit:``; waiters are admitted
+    in order as slots free up or the window grows.
+    """
+
+    def __init__(self, name, initial, min_limit, max_limit):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(initial, min_limit), self.max_limit))
+        self.in_flight = 0
+        self.base_rtt = None
+        self.waiters = deque()
+        self._reset_window(time.monotonic())
+        # 占用与容量对时间的积分，用于利用率
+        self.busy = 0.0
+        self.capacity = 0.0
+        self.updated = time.monotonic()
+
+    def __repr__(self):
+        return f"AdaptiveLimit({self.name} {self.window} [{self.min_limit}, {self.max_limit}])"
+
+    @property
+    def window(self):
+        return int(self.limit)
+
+    def _reset_window(self, now):
+        self.window_started = now
+        self.window_rtt = 0.0
+        self.window_ok = 0
+        self.window_errors = 0
+        self.window_peak = self.in_flight
+
+    def _account(self):
+        now = time.monotonic()
+        self.busy += self.in_flight * (now - self.updated)
+        self.capacity += self.window * (now - self.updated)
+        self.updated = now
+
+    def utilization(self):
+        """Share of the window that was in use, averaged over time since start."""
+        self._account()
+        return min(self.busy / self.capacity, 1.0) if self.capacity else 0.0
+
+    # --- slots ---
+    async def __aenter__(self):
+        if self.in_flight >= self.window or self.waiters:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # 已被放行却被取消：把名额让给下一个
+                    self._account()
+                    self.in_flight -= 1
+                    self._wake()
+                else:
+                    self.waiters.remove(waiter)
+                raise
+            # 放行时名额已经记在 in_flight 上
+        else:
+            self._account()
+            self.in_flight += 1
+        self.window_peak = max(self.window_peak, self.in_flight)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._account()
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self.waiters and self.in_flight < self.window:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                self._account()
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    # --- samples ---
+    def sample(self, seconds, ok):
+        """One request: its latency, and whether it succeeded (False for 429 / 5xx / transport errors)."""
+        if ok:
+            self.window_rtt += seconds
+            self.window_ok += 1
+        else:
+            self.window_errors += 1
+        now = time.monotonic()
+        if self.window_ok + self.window_errors >= WINDOW_SAMPLES and now - self.window_started >= WINDOW_SECONDS:
+            self._update()
+            self._reset_window(now)
+
+    def _update(self):
+        total = self.window_ok + self.window_errors
+        if self.window_errors / total > ERROR_THRESHOLD:
+            self._set(self.limit * BACKOFF)
+            return
+        short_rtt = self.window_rtt / self.window_ok
+        if self.base_rtt is None or short_rtt < self.base_rtt:
+            self.base_rtt = short_rtt
+        else:
+            self.base_rtt += (short_rtt - self.base_rtt) / BASE_AGING
+        if self.window_peak < self.limit / 2:
+            # 窗口没用满，延迟说明不了它该不该更大
+            return
+        gradient = max(0.5, min(1.0, TOLERANCE * self.base_rtt / short_rtt))
+        target = self.limit * gradient + QUEUE_SIZE
+        self._set(self.limit * (1 - SMOOTHING) + target * SMOOTHING)
+
+    def _set(self, limit):
+        old = self.window
+        self._account()
+        self.limit = min(max(limit, self.min_limit), self.max_limit)
+        if self.window != old:
+            logger.debug("Concurrency %s: %d -> %d", self.name, old, self.window)
+        self._wake()
+
+    # --- registration ---
+    def start(self):
+        """Receive the samples of this process's API requests and export the window as a gauge."""
+        _active.append(self)
+        CONCURRENCY.track(lambda: self.window, self.name, "limit")
+        CONCURRENCY.track(lambda: self.in_flight, self.name, "in_flight")
+        logger.info(f"Concurrency {self.name}: window {self.window}, bounds [{self.min_limit}, {self.max_limit}]")
+        return self
+
+    def stop(self):
+        if self in _active:
+            _active.remove(self)
+        CONCURRENCY.untrack(self.name, "limit")
+        CONCURRENCY.untrack(self.name, "in_flight")
+
+
+def observe(seconds, status):
+    """Feed one API request to the active limits; 4xx other than 429 says nothing about load."""
+    if not _active:
+        return
+    if status == "200":
+        ok = True
+    elif status == "429" or status == "error" or status.startswith("5"):
+        ok = False
+    else:
+        return
+    for limit in _active:
+        limit.sample(seconds, ok)
+
+
+def create_limit(name, initial, min_limit, max_limit):
+    """Adaptive window, or a fixed one of ``initial`` slots when ADAPTIVE_CONCURRENCY is off."""
+    if not ADAPTIVE_CONCURRENCY:
+        min_limit = max_limit = initial
+    return AdaptiveLimit(name, initial, min_limit, max_limit)
@@ -19,12 +19,54 @@ REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
 
 SOUNDCLOUD_CLIENT_ID = os.getenv("SOUNDCLOUD_CLIENT_ID")
 SOUNDCLOUD_APP_VERSION = int(os.getenv("SOUNDCLOUD_APP_VERSION", 0))
+# API 根地址；基准测试时指向本地回放服务（src/bench/stub_server.py）
+SOUNDCLOUD_API_BASE = os.getenv("SOUNDCLOUD_API_BASE", "https://api-v2.soundcloud.com").rstrip("/")
+# 可选的备用 client_id 列表（逗号分隔），遇到 401 时轮换
+SOUNDCLOUD_CLIENT_IDS = [c.strip() for c in os.getenv("SOUNDCLOUD_CLIENT_IDS", "").split(",") if c.strip()] \
+    or [SOUNDCLOUD_CLIENT_ID]
 
 PROXY_TUNNEL = os.getenv("PROXY_TUNNEL")
 PROXY_USER_NAME = os.getenv("PROXY_USER_NAME")
 PROXY_PWD = os.getenv("PROXY_PWD")
 PROXY_URL = os.getenv("PROXY_URL")
+# 多出口代理池，逗号分隔，例如 "http://127.0.0.1:7891,http://127.0.0.1:7892"
+PROXY_POOL = [u.strip() for u in os.getenv("PROXY_POOL", "").split(",") if u.strip()]
 
+# SoundCloud 请求速率预算（每秒请求数），按 client_id 限制
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", 10))
+# 按代理出口的额外上限，默认不设：只走一条隧道时它就是整个进程的上限，不应低于 RATE_LIMIT_RPS。
+# 用 PROXY_POOL 多出口时可设为单个出口不触发 429 的速率（从 RATE_LIMIT_RPS / 出口数 起调，
+# 看 /metrics 里 soundcloud_http_requests_total{status="429"} 按出口的计数再调整），各出口之和不低于 RATE_LIMIT_RPS，出口才不会成为瓶颈
+RATE_LIMIT_PROXY_RPS = float(os.getenv("RATE_LIMIT_PROXY_RPS")) if os.getenv("RATE_LIMIT_PROXY_RPS") else None
+# 设为 1 时令牌桶放在 Redis 里，多个爬虫进程共享同一预算
+RATE_LIMIT_REDIS = os.getenv("RATE_LIMIT_REDIS", "0") == "1"
+
+# 用户表 _raw 的存储方式：full（每个字段一份 JSON，Nested）、uncovered（只存类型列没覆盖的字段）、
+# blob（整条记录一个 ZSTD 压缩的 JSON 列 _raw_json）、off（不存）
+USER_RAW_MODE = os.getenv("USER_RAW_MODE", "full")
+
+# track 爬虫刷新方式：full（每个用户翻完全部 track）或 incremental（先探测用户资料，只抓有变化的用户的新 track）
+TRACK_REFRESH_MODE = os.getenv("TRACK_REFRESH_MODE", "full")
+# track 爬虫负责的 users.id 区间 (START, END]；都不设时沿用旧版按位置分配的区间，换算成 id 边界后存在 Redis
+TRACK_SEED_ID_START = int(os.getenv("TRACK_SEED_ID_START")) if os.getenv("TRACK_SEED_ID_START") else None
+TRACK_SEED_ID_END = int(os.getenv("TRACK_SEED_ID_END")) if os.getenv("TRACK_SEED_ID_END") else None
+
+# 本地 /metrics 端口（0 表示不开启；分片进程依次使用 端口+分片序号）和汇总日志间隔（秒，0 表示不输出）
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_SUMMARY_INTERVAL = float(os.getenv("METRICS_SUMMARY_INTERVAL", 60))
+
+# 爬虫并发窗口按 API 延迟和错误率自动调整（0 表示固定为各爬虫的初始值）
+ADAPTIVE_CONCURRENCY = os.getenv("ADAPTIVE_CONCURRENCY", "1") == "1"
+
+# 本地 API 响应缓存（SQLite 文件路径，空表示不启用），重跑抓取时直接读缓存的原始响应
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "")
+# readwrite：先读缓存，未命中再请求并写入；offline：只读缓存，不发请求
+RESPONSE_CACHE_MODE = os.getenv("RESPONSE_CACHE_MODE", "readwrite")
+RESPONSE_CACHE_MAX_MB = int(os.getenv("RESPONSE_CACHE_MAX_MB", 4096))
+# 按接口覆盖缓存有效期（秒），例如 "tracks=604800,search=3600"；接口为 tracks / followers / search / users
+RESPONSE_CACHE_TTLS = {k.strip(): int(v) for k, v in
+                       (p.split("=", 1) for p in os.getenv("RESPONSE_CACHE_TTLS", "").split(",") if "=" in p)}
 
 CLASH_GROUP = os.getenv("CLASH_GROUP")
 CLASH_URL = os.getenv("CLASH_URL")
@@ -45,10 +87,28 @@ def get_config():
         "REDIS_PASSWORD": REDIS_PASSWORD,
         "SOUNDCLOUD_CLIENT_ID": SOUNDCLOUD_CLIENT_ID,
         "SOUNDCLOUD_APP_VERSION": SOUNDCLOUD_APP_VERSION,
+        "SOUNDCLOUD_API_BASE": SOUNDCLOUD_API_BASE,
+        "SOUNDCLOUD_CLIENT_IDS": SOUNDCLOUD_CLIENT_IDS,
         "PROXY_TUNNEL": PROXY_TUNNEL,
         "PROXY_USER_NAME": PROXY_USER_NAME,
         "PROXY_PWD": PROXY_PWD,
         "PROXY_URL": PROXY_URL,
+        "PROXY_POOL": PROXY_POOL,
+        "RATE_LIMIT_RPS": RATE_LIMIT_RPS,
+        "RATE_LIMIT_PROXY_RPS": RATE_LIMIT_PROXY_RPS,
+        "RATE_LIMIT_REDIS": RATE_LIMIT_REDIS,
+        "USER_RAW_MODE": USER_RAW_MODE,
+        "TRACK_REFRESH_MODE": TRACK_REFRESH_MODE,
+        "TRACK_SEED_ID_START": TRACK_SEED_ID_START,
+        "TRACK_SEED_ID_END": TRACK_SEED_ID_END,
+        "METRICS_HOST": METRICS_HOST,
+        "METRICS_PORT": METRICS_PORT,
+        "METRICS_SUMMARY_INTERVAL": METRICS_SUMMARY_INTERVAL,
+        "ADAPTIVE_CONCURRENCY": ADAPTIVE_CONCURRENCY,
+        "RESPONSE_CACHE_PATH": RESPONSE_CACHE_PATH,
+        "RESPONSE_CACHE_MODE": RESPONSE_CACHE_MODE,
+        "RESPONSE_CACHE_MAX_MB": RESPONSE_CACHE_MAX_MB,
+        "RESPONSE_CACHE_TTLS": RESPONSE_CACHE_TTLS,
         "CLASH_GROUP": CLASH_GROUP,
         "CLASH_URL": CLASH_URL,
         "CLASH_USER": CLASH_USER,
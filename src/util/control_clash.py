@@ -1,5 +1,7 @@
+import math
 import random
 import time
+from urllib.parse import quote
 
 import requests
 
@@ -106,18 +108,174 @@ NODES = [
 CONTROLLER = f"{CLASH_URL}/proxies/{CLASH_GROUP}"
 SECRET = CLASH_SECRET
 
+# 调度参数
+POLICY = "thompson"          # "thompson" 或 "ucb"
+SWITCH_INTERVAL = 10         # 正常情况下多久重新选一次节点（秒）
+CHECK_INTERVAL = 1           # 检查爬虫错误计数的间隔（秒）
+PROBES_PER_ROUND = 4         # 每轮探测的节点数（当前节点 + 最久未探测的节点）
+PROBE_URL = "https://api-v2.soundcloud.com"
+PROBE_TIMEOUT_MS = 5000
+SWITCH_TIMEOUT = 5           # 切换节点请求的超时（秒），控制器卡住时不拖住调度循环
+EWMA_ALPHA = 0.2
+UCB_C = 0.5
+LATENCY_CAP_MS = 3000
+# 每个 CHECK_INTERVAL 内爬虫上报的错误数超过该值则立即切换
+ERROR_SPIKE_THRESHOLD = 20
+
+# 爬虫通过这个 Redis 计数器上报 429/5xx/连接错误
+ERROR_COUNTER_KEY = "soundcloud:clash:errors"
+# 调度器不运行时计数没人清零，几个检查间隔后自动过期，避免启动时误判为错误激增
+ERROR_COUNTER_TTL = CHECK_INTERVAL * 5
+
+
+def report_crawler_error(redis_client, n=1):
+    """Called by crawlers on 429/5xx/connection errors so the scheduler can switch early."""
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.incrby(ERROR_COUNTER_KEY, n)
+        pipe.expire(ERROR_COUNTER_KEY, ERROR_COUNTER_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"Failed to report crawler error: {e}")
+
+
+class NodeStats:
+    def __init__(self):
+        self.success = 0.5       # EWMA 成功率
+        self.latency = LATENCY_CAP_MS / 2  # EWMA 延迟 (ms)
+        self.trials = 0
+        self.last_probe = 0.0
+
+    def record(self, ok, latency_ms=None):
+        self.success += EWMA_ALPHA * ((1.0 if ok else 0.0) - self.success)
+        if ok and latency_ms is not None:
+            self.latency += EWMA_ALPHA * (min(latency_ms, LATENCY_CAP_MS) - self.latency)
+        self.trials += 1
+
+    def reward(self):
+        # 成功率乘以延迟折扣，落在 [0, 1]
+        return self.success * (1 - self.latency / LATENCY_CAP_MS)
+
+
+class NodeScheduler:
+    """
+    Health-aware Clash node selection.
+
+    Probes node latency through the controller's ``/proxies/{name}/delay``
+    API, keeps per-node EWMAs of success rate and latency, and picks the
+    group's node with a bandit policy (Thompson sampling or UCB1) instead
+    of ``random.choice``. Error spikes reported by the crawlers penalize the
+    current node and trigger an early switch.
+    """
+
+    def __init__(self, nodes, controller_url, secret=None, group=GROUP, policy=POLICY,
+                 http=None, redis_client=None, rng=None):
+        self.nodes = list(nodes)
+        self.controller_url = controller_url.rstrip("/")
+        self.secret = secret
+        self.group = group
+        self.policy = policy
+        self.http = http or requests.Session()
+        self.redis_client = redis_client
+        self.rng = rng or random.Random()
+        self.stats = {node: NodeStats() for node in self.nodes}
+        self.current = None
+
+    def _url(self, path):
+        url = f"{self.controller_url}{path}"
+        if self.secret:
+            url += ("&" if "?" in url else "?") + "secret=" + self.secret
+        return url
+
+    def probe(self, node):
+        stats = self.stats[node]
+        stats.last_probe = time.monotonic()
+        url = self._url(f"/proxies/{quote(node)}/delay?timeout={PROBE_TIMEOUT_MS}&url={quote(PROBE_URL, safe='')}")
+        try:
+            resp = self.http.get(url, timeout=PROBE_TIMEOUT_MS / 1000 + 2)
+            delay = resp.json().get("delay") if resp.status_code == 200 else None
+        except Exception as e:
+            logger.debug(f"Probe failed for {node}: {e}")
+            delay = None
+        stats.record(bool(delay), delay)
+        return delay
+
+    def probe_round(self):
+        # 当前节点 + 最久没探测过的几个节点
+        candidates = sorted(self.nodes, key=lambda n: self.stats[n].last_probe)[:PROBES_PER_ROUND]
+        if self.current and self.current not in candidates:
+            candidates[-1] = self.current
+        for node in candidates:
+            self.probe(node)
+
+    def _score(self, node, total_trials):
+        stats = self.stats[node]
+        if self.policy == "ucb":
+            if stats.trials == 0:
+                return float("inf")
+            return stats.reward() + UCB_C * math.sqrt(math.log(total_trials + 1) / stats.trials)
+        # Thompson：把 EWMA 成功率当作 Beta 分布的均值，试验越多分布越窄
+        n = min(stats.trials, 50) + 2
+        success = min(max(stats.success, 0.01), 0.99)
+        p = self.rng.betavariate(success * n, (1 - success) * n)
+        return p * (1 - stats.latency / LATENCY_CAP_MS)
+
+    def choose(self):
+        total = sum(s.trials for s in self.stats.values())
+        return max(self.nodes, key=lambda node: self._score(node, total))
+
+    def switch(self, node):
+        try:
+            resp = self.http.put(self._url(f"/proxies/{quote(self.group)}"), json={"name": node},
+                                 timeout=SWITCH_TIMEOUT)
+        except requests.RequestException as e:
+            logger.warning(f"Switch to {node} failed: {e}")
+            return
+        logger.info(f"Switched to {node}, status: {resp.status_code}, "
+                    f"success={self.stats[node].success:.2f}, latency={self.stats[node].latency:.0f}ms")
+        if resp.status_code < 300:
+            self.current = node
+
+    def error_spike(self):
+        """Errors reported by crawlers since the last check (the counter is reset), or 0 without Redis."""
+        if self.redis_client is None:
+            return 0
+        try:
+            # 取出并清零，计数只反映上次检查以来的错误
+            return int(self.redis_client.getset(ERROR_COUNTER_KEY, 0) or 0)
+        except Exception as e:
+            logger.warning(f"Failed to read crawler error counter: {e}")
+            return 0
+
+    def check_errors(self):
+        """Penalize the current node on a spike of crawler errors; True if it should be switched now."""
+        errors = self.error_spike()
+        if errors < ERROR_SPIKE_THRESHOLD or not self.current:
+            return False
+        logger.warning(f"{errors} crawler errors on {self.current}, switching early")
+        self.stats[self.current].record(False)
+        return True
+
+    def step(self):
+        self.probe_round()
+        self.switch(self.choose())
+
+    def run(self):
+        # 上次停止之后攒下的错误不算在第一个节点头上
+        self.error_spike()
+        next_switch = 0.0
+        while True:
+            if self.check_errors():
+                next_switch = 0.0
+            if time.monotonic() >= next_switch:
+                self.step()
+                next_switch = time.monotonic() + SWITCH_INTERVAL
+            time.sleep(CHECK_INTERVAL)
+
 
 def main():
-    i = 0
-    while True:
-        node = random.choice(NODES)
-        url = CONTROLLER
-        if SECRET:
-            url += "?secret=" + SECRET
-        resp = requests.put(url, json={"name": node})
-        logger.info(f"Switched to {node}, status: {resp.status_code}")
-        i += 1
-        time.sleep(10)
+    from src.util.db import redis_client
+    NodeScheduler(NODES, CLASH_URL, SECRET, redis_client=redis_client).run()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
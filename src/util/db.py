@@ -30,4 +30,36 @@ def close_connections():
             logger.info("Closing Redis connection")
             redis_client.close()
     except Exception as e:
-        pass
\ No newline at end of file
+        pass
+
+def table_columns(table_name):
+    return [row[0] for row in clickhouse_client.query(f"DESCRIBE TABLE {table_name}").result_rows]
+
+def migrate_table(table_name, create_table_fn):
+    """
+    Rebuild ``table_name`` with the current DDL from ``create_table_fn``
+    (e.g. after an engine change), copying the columns both versions have.
+    The old data stays in ``{table_name}_old`` until it is dropped by hand;
+    refuses to run while that table exists.
+    """
+    staging = f"{table_name}_old"
+    if not int(clickhouse_client.command(f"EXISTS TABLE {table_name}")):
+        logger.info(f"{table_name} does not exist yet, nothing to migrate")
+        return
+    if int(clickhouse_client.command(f"EXISTS TABLE {staging}")):
+        raise RuntimeError(f"{staging} already exists (left by an earlier migration?); "
+                           f"drop it before migrating {table_name}")
+    create_table_fn(staging)
+    old_columns = table_columns(table_name)
+    new_columns = table_columns(staging)
+    # 只复制两边都有的列：新表多出的列取默认值，旧表多出的列（如换了 raw 模式）不复制
+    columns = [c for c in new_columns if c in set(old_columns)]
+    dropped = [c for c in old_columns if c not in set(new_columns)]
+    if dropped:
+        logger.warning(f"Migrating {table_name}: columns not in the new DDL are not copied: {dropped}")
+    column_list = ", ".join(f"`{c}`" for c in columns)
+    logger.info(f"Copying {len(columns)} columns of {table_name} into {staging}")
+    clickhouse_client.command(f"INSERT INTO {staging} ({column_list}) SELECT {column_list} FROM {table_name}")
+    # 交换后 staging 名下是旧表
+    clickhouse_client.command(f"EXCHANGE TABLES {table_name} AND {staging}")
+    logger.info(f"Migrated {table_name}; previous data kept in {staging}")
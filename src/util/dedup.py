@@ -0,0 +1,49 @@
+from collections import OrderedDict
+
+# 每个进程记住最近写入的记录数
+RECENT_WRITES_CAPACITY = 500000
+
+
+class RecentWrites:
+    """
+    LRU of recently written ``id -> last_modified`` pairs.
+
+    Records whose ``(id, last_modified)`` was already written by this process
+    are dropped before they are transformed or sent to ClickHouse. Counters
+    such as ``followers_count`` change without bumping ``last_modified``;
+    those listed in ``counter_keys`` are part of the version, so a record
+    with new counts is written again. Tables
+    are ReplacingMergeTree on ``id`` so anything that slips through
+    (restarts, other processes) still collapses on merge.
+    """
+
+    def __init__(self, capacity=RECENT_WRITES_CAPACITY, id_key='id', version_key='last_modified', counter_keys=()):
+        self.capacity = capacity
+        self.id_key = id_key
+        self.version_key = version_key
+        self.counter_keys = tuple(counter_keys)
+        self.cache = OrderedDict()
+        self.skipped = 0
+
+    def filter(self, records):
+        """Return the records that are new or changed and remember them as written."""
+        fresh = []
+        cache = self.cache
+        for rec in records:
+            uid = rec.get(self.id_key)
+            version = rec.get(self.version_key)
+            if uid is None or version is None:
+                fresh.append(rec)
+                continue
+            if self.counter_keys:
+                version = (version, *(rec.get(k) for k in self.counter_keys))
+            if cache.get(uid) == version:
+                cache.move_to_end(uid)
+                self.skipped += 1
+                continue
+            cache[uid] = version
+            cache.move_to_end(uid)
+            if len(cache) > self.capacity:
+                cache.popitem(last=False)
+            fresh.append(rec)
+        return fresh
@@ -0,0 +1,171 @@
+import json
+from typing import Any, List, Optional, TypedDict
+
+try:
+    import msgspec  # 可选依赖：带类型的解码，未声明的字段直接跳过
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson  # 可选依赖：没有 msgspec 时的快速解析/序列化
+except ImportError:
+    orjson = None
+
+BACKEND = "msgspec" if msgspec is not None else "orjson" if orjson is not None else "json"
+
+
+# --- PAYLOAD SCHEMAS ---
+# 只声明下游会读的字段；msgspec 解码时其余字段（media、user 等大对象）不会被构建
+class PublisherMetadata(TypedDict, total=False):
+    id: Optional[int]
+    urn: Optional[str]
+    artist: Optional[str]
+    album_title: Optional[str]
+    contains_music: Optional[bool]
+    upc_or_ean: Optional[str]
+    isrc: Optional[str]
+    explicit: Optional[bool]
+    p_line: Optional[str]
+    p_line_for_display: Optional[str]
+    c_line: Optional[str]
+    c_line_for_display: Optional[str]
+    release_title: Optional[str]
+
+
+class TrackPayload(TypedDict, total=False):
+    id: int
+    artwork_url: Optional[str]
+    caption: Optional[str]
+    commentable: Optional[bool]
+    comment_count: Optional[int]
+    created_at: Optional[str]
+    description: Optional[str]
+    downloadable: Optional[bool]
+    download_count: Optional[int]
+    duration: Optional[int]
+    full_duration: Optional[int]
+    embeddable_by: Optional[str]
+    genre: Optional[str]
+    has_downloads_left: Optional[bool]
+    kind: Optional[str]
+    label_name: Optional[str]
+    last_modified: Optional[str]
+    license: Optional[str]
+    likes_count: Optional[int]
+    permalink: Optional[str]
+    permalink_url: Optional[str]
+    playback_count: Optional[int]
+    public: Optional[bool]
+    purchase_title: Optional[str]
+    purchase_url: Optional[str]
+    release_date: Optional[str]
+    reposts_count: Optional[int]
+    secret_token: Optional[str]
+    sharing: Optional[str]
+    state: Optional[str]
+    streamable: Optional[bool]
+    tag_list: Optional[str]
+    title: Optional[str]
+    uri: Optional[str]
+    urn: Optional[str]
+    user_id: Optional[int]
+    visuals: Any
+    waveform_url: Optional[str]
+    display_date: Optional[str]
+    station_urn: Optional[str]
+    station_permalink: Optional[str]
+    track_authorization: Optional[str]
+    monetization_model: Optional[str]
+    policy: Optional[str]
+    publisher_metadata: Optional[PublisherMetadata]
+
+
+class UserPayload(TypedDict, total=False):
+    id: int
+    avatar_url: Optional[str]
+    city: Optional[str]
+    comments_count: Optional[int]
+    country_code: Optional[str]
+    created_at: Optional[str]
+    creator_subscriptions: Any
+    creator_subscription: Any
+    description: Optional[str]
+    followers_count: Optional[int]
+    followings_count: Optional[int]
+    first_name: Optional[str]
+    full_name: Optional[str]
+    groups_count: Optional[int]
+    kind: Optional[str]
+    last_modified: Optional[str]
+    last_name: Optional[str]
+    likes_count: Optional[int]
+    playlist_likes_count: Optional[int]
+    permalink: Optional[str]
+    permalink_url: Optional[str]
+    playlist_count: Optional[int]
+    reposts_count: Optional[int]
+    track_count: Optional[int]
+    uri: Optional[str]
+    urn: Optional[str]
+    username: Optional[str]
+    verified: Optional[bool]
+    visuals: Any
+    badges: Any
+    station_urn: Optional[str]
+    station_permalink: Optional[str]
+
+
+# 页面 schema 名称 -> 记录类型；RAW 表示不套 schema，保留全部字段（_raw 需要）
+TRACKS = "tracks"
+USERS = "users"
+RAW = None
+RECORD_TYPES = {TRACKS: TrackPayload, USERS: UserPayload}
+
+if msgspec is not None:
+    def _page_struct(record_type):
+        return msgspec.defstruct("Page", [
+            ("collection", List[record_type], msgspec.field(default_factory=list)),
+            ("next_href", Optional[str], None),
+        ])
+
+    _page_decoders = {name: msgspec.json.Decoder(_page_struct(t)) for name, t in RECORD_TYPES.items()}
+    _any_decoder = msgspec.json.Decoder()
+    _encoder = msgspec.json.Encoder()
+
+
+def loads(data):
+    """Decode JSON from bytes/str with the fastest available library."""
+    if msgspec is not None:
+        return _any_decoder.decode(data)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def decode_page(data, schema=RAW):
+    """
+    Decode an API response (usually ``{"collection": [...], "next_href": ...}``)
+    straight from the response bytes. With msgspec and ``schema`` set to
+    ``TRACKS``/``USERS`` only the declared fields of each record are built.
+    Falls back to an untyped decode if the page does not match its schema.
+    Raises ``ValueError`` on malformed JSON.
+    """
+    if msgspec is None or schema is RAW:
+        return loads(data)
+    try:
+        page = _page_decoders[schema].decode(data)
+    except msgspec.ValidationError:
+        return _any_decoder.decode(data)
+    return {"collection": page.collection, "next_href": page.next_href}
+
+
+def dumps(obj):
+    """Serialize nested fields (visuals, badges, ...) to a compact UTF-8 JSON string."""
+    try:
+        if msgspec is not None:
+            return _encoder.encode(obj).decode()
+        if orjson is not None:
+            return orjson.dumps(obj).decode()
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return json.dumps(obj, ensure_ascii=False)
@@ -0,0 +1,250 @@
+import heapq
+import itertools
+
+from src.util.logger import logger
+
+try:
+    from pyroaring import BitMap  # 可选依赖：本地 roaring bitmap 镜像
+except ImportError:
+    BitMap = None
+
+# 每个 Redis bitmap key 覆盖 2^24 个 id（2MB），避免单个超大 string
+BITMAP_SHARD_BITS = 24
+BITMAP_SHARD_MASK = (1 << BITMAP_SHARD_BITS) - 1
+
+MAX_DEPTH = 3
+MAX_LOCAL = 200000
+MAX_TOTAL = 50000000
+# 溢出/回填到 Redis 时每次搬运的条数
+SPILL_CHUNK = 50000
+# 分数 = depth * DEPTH_WEIGHT - followers_count，越小越优先
+DEPTH_WEIGHT = 10 ** 10
+
+
+class SeenSet:
+    """
+    Set of user ids already queued or crawled, stored as sharded Redis
+    bitmaps. When pyroaring is installed a local roaring bitmap mirrors the
+    ids this process has seen so repeat lookups skip Redis.
+    """
+
+    def __init__(self, redis_client, key_prefix):
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.local = BitMap() if BitMap is not None else None
+
+    def _key(self, uid):
+        return f"{self.key_prefix}:{uid >> BITMAP_SHARD_BITS}"
+
+    def add_many(self, ids):
+        """Mark ``ids`` as seen and return the ones that were not seen before."""
+        candidates = []
+        for uid in dict.fromkeys(ids):
+            if self.local is not None and uid in self.local:
+                continue
+            candidates.append(uid)
+        if not candidates:
+            return []
+        pipe = self.redis_client.pipeline(transaction=False)
+        for uid in candidates:
+            pipe.setbit(self._key(uid), uid & BITMAP_SHARD_MASK, 1)
+        previous = pipe.execute()
+        if self.local is not None:
+            self.local.update(candidates)
+        return [uid for uid, old in zip(candidates, previous) if not old]
+
+    def add_to_pipeline(self, pipe, ids):
+        """Queue SETBITs for ``ids`` on an existing pipeline (no new/old bookkeeping)."""
+        for uid in ids:
+            pipe.setbit(self._key(uid), uid & BITMAP_SHARD_MASK, 1)
+        if self.local is not None:
+            self.local.update(ids)
+
+    def clear(self):
+        """Forget every id (deletes all bitmap shards)."""
+        keys = list(self.redis_client.scan_iter(match=f"{self.key_prefix}:*", count=1000))
+        if keys:
+            self.redis_client.delete(*keys)
+        if self.local is not None:
+            self.local.clear()
+
+    def contains(self, uid):
+        if self.local is not None and uid in self.local:
+            return True
+        return bool(self.redis_client.getbit(self._key(uid), uid & BITMAP_SHARD_MASK))
+
+    def contains_many(self, ids):
+        """Return a list of booleans, one per id, in a single pipelined round-trip."""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for uid in ids:
+            pipe.getbit(self._key(uid), uid & BITMAP_SHARD_MASK)
+        return [bool(bit) for bit in pipe.execute()] if ids else []
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Frontier:
+    """
+    Breadth-first snowball frontier.
+
+    Users are ordered by depth first, then by ``followers_count`` (bigger
+    accounts first). Every id goes through the ``SeenSet`` before it is
+    queued, so nobody is fetched twice. The in-memory heap holds at most
+    ``max_local`` entries; the lowest-priority entries spill to a Redis
+    sorted set and are pulled back when the heap runs low. The whole
+    frontier (memory + Redis) is capped at ``max_total``.
+
+    The spill set belongs to one process: pass a distinct ``suffix`` per
+    crawler process. Only the ``SeenSet`` is meant to be shared.
+    """
+
+    def __init__(self, redis_client, key_prefix, max_depth=MAX_DEPTH, max_local=MAX_LOCAL,
+                 max_total=MAX_TOTAL, spill_chunk=SPILL_CHUNK, suffix=""):
+        self.redis_client = redis_client
+        self.seen = SeenSet(redis_client, f"{key_prefix}:seen")
+        self.spill_key = f"{key_prefix}:frontier{suffix}"
+        self.max_depth = max_depth
+        self.max_local = max_local
+        self.max_total = max_total
+        self.spill_chunk = min(spill_chunk, max_local)
+        self.heap = []
+        self.spilled = self._spilled_count()
+        self.spilled_min_depth = self._best_spilled_depth() if self.spilled else self.max_depth + 1
+        self.dropped = 0
+        self._seq = itertools.count()
+
+    def _spilled_count(self):
+        try:
+            return int(self.redis_client.zcard(self.spill_key))
+        except Exception as e:
+            logger.error(f"Redis zcard error ({self.spill_key}): {e}")
+            return 0
+
+    def __len__(self):
+        return len(self.heap) + self.spilled
+
+    def adopt(self, key, owns):
+        """Move the entries of another spill set ``key`` whose user id satisfies ``owns`` into this one."""
+        moved = 0
+        for chunk in _chunks(self.redis_client.zscan_iter(key, count=self.spill_chunk), self.spill_chunk):
+            mapping = {}
+            for member, score in chunk:
+                if isinstance(member, bytes):
+                    member = member.decode()
+                if owns(int(member.split(":")[0])):
+                    mapping[member] = score
+            if mapping:
+                pipe = self.redis_client.pipeline()
+                pipe.zadd(self.spill_key, mapping)
+                pipe.zrem(key, *mapping)
+                pipe.execute()
+                moved += len(mapping)
+        if moved:
+            self.spilled = self._spilled_count()
+            self.spilled_min_depth = self._best_spilled_depth()
+            logger.info(f"Frontier: adopted {moved} users from {key} into {self.spill_key}")
+        return moved
+
+    def push_many(self, users, depth):
+        """
+        Queue ``users`` (iterable of ``(user_id, followers_count)``) at
+        ``depth``. Returns how many were new and queued.
+        """
+        return len(self.push_new(users, depth))
+
+    def push_new(self, users, depth):
+        """
+        Like ``push_many``, but returns the ids that were new and queued.
+        Users beyond ``max_depth`` are not queued but still marked as seen.
+        """
+        counts = {}
+        for uid, followers_count in users:
+            if uid is not None:
+                counts[int(uid)] = int(followers_count or 0)
+        if depth > self.max_depth:
+            # 它们已经写进 users 表；记入 seen-set，之后的种子遍历不会把它们当作 depth 0 再扩展
+            self.seen.add_many(list(counts))
+            return []
+        room = self.max_total - len(self)
+        if room < len(counts):
+            self.dropped += len(counts) - max(room, 0)
+        if room <= 0:
+            return []
+        new_ids = self.seen.add_many(list(counts)[:room])
+        for uid in new_ids:
+            heapq.heappush(self.heap, (depth, -counts[uid], next(self._seq), uid))
+        if len(self.heap) > self.max_local:
+            self._spill(len(self.heap) - self.max_local + self.spill_chunk)
+        return new_ids
+
+    def requeue(self, ids, depth):
+        """Queue already-seen ``ids`` again, e.g. users whose crawl failed and is retried."""
+        for uid in ids:
+            heapq.heappush(self.heap, (depth, 0, next(self._seq), int(uid)))
+        if len(self.heap) > self.max_local:
+            self._spill(len(self.heap) - self.max_local + self.spill_chunk)
+
+    def pop(self):
+        """Return ``(user_id, depth)`` of the best queued user, or None."""
+        # 只有本地堆空了，或者已经退到比 Redis 里更深的层时才回填
+        if self.spilled and (not self.heap or self.heap[0][0] > self.spilled_min_depth):
+            self._refill()
+        if not self.heap:
+            return None
+        depth, _, _, uid = heapq.heappop(self.heap)
+        return uid, depth
+
+    def _best_spilled_depth(self):
+        try:
+            best = self.redis_client.zrange(self.spill_key, 0, 0, withscores=True)
+        except Exception as e:
+            logger.error(f"Redis zrange error ({self.spill_key}): {e}")
+            best = None
+        if not best:
+            return self.max_depth + 1
+        return int((best[0][1] + DEPTH_WEIGHT - 1) // DEPTH_WEIGHT)
+
+    def _spill(self, n):
+        """Move the ``n`` lowest-priority entries from memory to Redis."""
+        self.heap.sort()
+        moved, self.heap = self.heap[-n:], self.heap[:-n]
+        mapping = {f"{uid}:{depth}": depth * DEPTH_WEIGHT + neg_followers
+                   for depth, neg_followers, _, uid in moved}
+        try:
+            self.redis_client.zadd(self.spill_key, mapping)
+            self.spilled += len(mapping)
+            self.spilled_min_depth = min(self.spilled_min_depth, moved[0][0])
+        except Exception as e:
+            self.dropped += len(mapping)
+            logger.error(f"Frontier spill to Redis failed, {len(mapping)} users dropped: {e}")
+
+    def _refill(self):
+        try:
+            items = self.redis_client.zpopmin(self.spill_key, self.spill_chunk)
+        except Exception as e:
+            logger.error(f"Frontier refill from Redis failed: {e}")
+            return
+        self.spilled = max(self.spilled - len(items), 0)
+        for member, score in items:
+            if isinstance(member, bytes):
+                member = member.decode()
+            uid, depth = (int(x) for x in member.split(":"))
+            heapq.heappush(self.heap, (depth, int(score) - depth * DEPTH_WEIGHT, next(self._seq), uid))
+        if not items:
+            self.spilled = 0
+        self.spilled_min_depth = self._best_spilled_depth() if self.spilled else self.max_depth + 1
+
+    def persist(self):
+        """Spill everything still in memory so the next run resumes from Redis."""
+        if self.heap:
+            self._spill(len(self.heap))
+        logger.info(f"Frontier persisted: {self.spilled} users in {self.spill_key}, {self.dropped} dropped")
@@ -0,0 +1,82 @@
+import aiohttp
+
+from src.util.logger import logger
+
+# 连接池参数
+CONNECTOR_LIMIT = 100
+CONNECTOR_LIMIT_PER_HOST = 32
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 60
+
+# 单次请求超时（秒），替代写死的 timeout=60
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=60, connect=10, sock_connect=10, sock_read=30)
+
+
+class ConnectionStats:
+    """Counters fed by an aiohttp TraceConfig to check connection reuse."""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_lookups = 0
+        self.dns_cache_hits = 0
+
+    def trace_config(self):
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._on_request_start)
+        trace.on_connection_create_end.append(self._on_connection_create_end)
+        trace.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        trace.on_dns_resolvehost_end.append(self._on_dns_resolvehost_end)
+        trace.on_dns_cache_hit.append(self._on_dns_cache_hit)
+        return trace
+
+    async def _on_request_start(self, session, ctx, params):
+        self.requests += 1
+
+    async def _on_connection_create_end(self, session, ctx, params):
+        self.connections_created += 1
+
+    async def _on_connection_reuseconn(self, session, ctx, params):
+        self.connections_reused += 1
+
+    async def _on_dns_resolvehost_end(self, session, ctx, params):
+        self.dns_lookups += 1
+
+    async def _on_dns_cache_hit(self, session, ctx, params):
+        self.dns_cache_hits += 1
+
+    def handshakes_per_request(self):
+        return self.connections_created / self.requests if self.requests else 0.0
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "dns_lookups": self.dns_lookups,
+            "dns_cache_hits": self.dns_cache_hits,
+            "handshakes_per_request": round(self.handshakes_per_request(), 4),
+        }
+
+    def log(self, prefix="HTTP"):
+        logger.info(f"{prefix} connection stats: {self.snapshot()}")
+
+
+def create_session(stats=None, limit=CONNECTOR_LIMIT, limit_per_host=CONNECTOR_LIMIT_PER_HOST,
+                   ttl_dns_cache=DNS_CACHE_TTL, keepalive_timeout=KEEPALIVE_TIMEOUT,
+                   timeout=REQUEST_TIMEOUT, headers=None):
+    """
+    Build the long-lived ClientSession shared by every worker of a crawler
+    process. Must be called from inside the running event loop.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        ttl_dns_cache=ttl_dns_cache,
+        use_dns_cache=True,
+        keepalive_timeout=keepalive_timeout,
+    )
+    trace_configs = [stats.trace_config()] if stats is not None else None
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers,
+                                 trace_configs=trace_configs)
@@ -1,21 +1,143 @@
+import atexit
+import json
 import logging
 import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
 
-# 日志格式，包含 py 文件名 (module) 和方法名 (funcName)
-LOG_FORMAT = "%(asctime)s %(levelname)s [%(module)s.%(funcName)s] %(name)s: %(message)s"
+# 日志格式，包含进程名 (processName，多进程运行时为分片名)、py 文件名 (module) 和方法名 (funcName)
+LOG_FORMAT = "%(asctime)s %(levelname)s %(processName)s [%(module)s.%(funcName)s] %(name)s: %(message)s"
 
 # 日志级别（可通过环境变量控制，默认INFO）
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# LOG_JSON=1 时每行输出一个 JSON 对象，extra 里的字段原样带上
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"
+# 默认经队列交给后台线程写出，调用方（事件循环）不做格式化和 I/O；LOG_ASYNC=0 时同步写
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+# 队列满了就丢弃新日志，不阻塞调用方
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# 带 log_key 的日志，同一个 key 在这段时间内只输出第一条，其余计数后随下一条输出
+LOG_REPEAT_INTERVAL = float(os.getenv("LOG_REPEAT_INTERVAL", 30))
 
-# 日志配置
-logging.basicConfig(
-    level=LOG_LEVEL,
-    format=LOG_FORMAT,
-    handlers=[
-        logging.StreamHandler()
-        # 如需写入文件可添加: logging.FileHandler("app.log")
-    ]
-)
+# LogRecord 自带的属性，其余的都是调用方通过 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+def _fields(record):
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    """The plain ``LOG_FORMAT`` line, plus how many repeats of it were suppressed."""
+
+    def format(self, record):
+        line = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{line} (+{suppressed} similar suppressed)" if suppressed else line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: standard fields, ``extra`` fields and the traceback if any."""
+
+    def format(self, record):
+        out = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "process": record.processName,
+            "where": f"{record.module}.{record.funcName}",
+            "msg": record.getMessage(),
+        }
+        out.update(_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class RepeatFilter(logging.Filter):
+    """
+    Rate limit for repeated warnings: records logged with
+    ``extra={"log_key": key}`` pass once per ``interval`` seconds per key;
+    the next one that passes carries the number suppressed in between
+    (``record.suppressed``). Records without a key always pass.
+    """
+
+    def __init__(self, interval=LOG_REPEAT_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self.last = {}
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, "log_key", None)
+        if key is None or not self.interval:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            last = self.last.get(key)
+            if last is not None and now - last < self.interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+            self.last[key] = now
+            record.suppressed = self.suppressed.pop(key, 0)
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    ``QueueHandler`` that leaves all formatting to the listener thread and
+    drops records (counting them) instead of blocking when the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 参数在后台线程里才拼进消息；日志参数应是不会再被修改的值
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _formatter():
+    return JsonFormatter() if LOG_JSON else TextFormatter(LOG_FORMAT)
+
+
+def _setup():
+    stream = logging.StreamHandler()
+    stream.setFormatter(_formatter())
+    if not LOG_ASYNC:
+        stream.addFilter(RepeatFilter())
+        logging.basicConfig(level=LOG_LEVEL, handlers=[stream])
+        return None
+    handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(RepeatFilter())
+    logging.basicConfig(level=LOG_LEVEL, handlers=[handler])
+    listener = QueueListener(handler.queue, stream, respect_handler_level=True)
+    listener.start()
+
+    def stop():
+        # 退出前把队列里剩下的日志写完
+        listener.stop()
+        if handler.dropped:
+            stream.handle(logging.makeLogRecord({"msg": f"{handler.dropped} log records dropped (queue full)",
+                                                 "levelno": logging.WARNING, "levelname": "WARNING",
+                                                 "name": "soundcloud_project"}))
+    atexit.register(stop)
+    return handler
+
+
+queue_handler = _setup()
 
 # 推荐用法：统一导出一个 logger 实例
-logger = logging.getLogger("soundcloud_project")
\ No newline at end of file
+# 热路径上用 %s 占位符传参（logger.info("user %s", uid)），级别被过滤时不做格式化
+logger = logging.getLogger("soundcloud_project")
@@ -0,0 +1,139 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from src.util.logger import logger
+
+# 跟踪增长曲线的指标列
+TRACK_METRICS = ["playback_count", "likes_count", "reposts_count", "comment_count"]
+USER_METRICS = ["followers_count", "followings_count", "track_count", "likes_count"]
+TRACK_METRICS_TABLE = "track_metrics"
+USER_METRICS_TABLE = "user_metrics"
+# 每个进程在内存里记住多少个实体的最新值，其余的去 Redis 查
+LOCAL_CAPACITY = 500000
+# 最新值按 id 分桶存进 Redis hash，每个 hash 足够小，能用紧凑编码
+BUCKET_BITS = 10
+LAST_VALUES_TTL = 90 * 86400
+
+
+def metrics_table_ddl(table, id_col, metrics):
+    """
+    Narrow ``(id, ts, metrics...)`` table: rows sorted by entity then time,
+    so Delta on the counters and DoubleDelta on the timestamps leave
+    mostly small numbers for ZSTD.
+    """
+    metric_cols = ",\n".join(f"        {m} UInt64 CODEC(Delta, ZSTD(1))" for m in metrics)
+    return f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+        {id_col} UInt64 CODEC(Delta, ZSTD(1)),
+        ts DateTime CODEC(DoubleDelta, ZSTD(1)),
+{metric_cols}
+    )
+    ENGINE = MergeTree
+    PARTITION BY toYYYYMM(ts)
+    ORDER BY ({id_col}, ts)
+    SETTINGS index_granularity = 8192;
+    """
+
+
+class MetricSnapshots:
+    """
+    Change-only snapshot stream of engagement counters.
+
+    ``changed(records)`` compares each record's ``metrics`` with the last
+    values written for its id and returns column lists (``column_names``)
+    for the records that are new or changed, stamped with the crawl time.
+    Last values live in a local LRU backed by bucketed Redis hashes under
+    ``{key_prefix}:{id >> BUCKET_BITS}``, so restarts and other processes
+    don't write the same values again.
+
+    Redis is updated when the rows are produced, not when they reach
+    ClickHouse; a lost insert leaves a gap in the curve until the value
+    changes again, it never duplicates points.
+    """
+
+    def __init__(self, redis_client, key_prefix, metrics, id_col, id_key="id",
+                 local_capacity=LOCAL_CAPACITY):
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.metrics = list(metrics)
+        self.id_key = id_key
+        self.column_names = [id_col, "ts"] + self.metrics
+        self.local_capacity = local_capacity
+        self.cache = OrderedDict()
+        self.written = 0
+        self.unchanged = 0
+
+    def _key(self, uid):
+        return f"{self.key_prefix}:{uid >> BUCKET_BITS}"
+
+    def _values(self, rec):
+        out = []
+        for m in self.metrics:
+            try:
+                out.append(max(int(rec.get(m) or 0), 0))
+            except (TypeError, ValueError):
+                out.append(0)
+        return tuple(out)
+
+    def _load(self, ids):
+        """Fill the local cache with the Redis values of ``ids`` (one pipelined round-trip)."""
+        if not ids:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for uid in ids:
+                pipe.hget(self._key(uid), uid)
+            stored = pipe.execute()
+        except Exception as e:
+            logger.error(f"Metric snapshot lookup failed ({self.key_prefix}): {e}")
+            return
+        for uid, raw in zip(ids, stored):
+            if raw:
+                if isinstance(raw, bytes):
+                    raw = raw.decode()
+                self._remember(uid, tuple(int(x) for x in raw.split(",")))
+
+    def _remember(self, uid, values):
+        self.cache[uid] = values
+        self.cache.move_to_end(uid)
+        if len(self.cache) > self.local_capacity:
+            self.cache.popitem(last=False)
+
+    def changed(self, records, ts=None):
+        """Columns for the records whose counters differ from the last snapshot ([] if none)."""
+        latest = {}
+        for rec in records:
+            uid = rec.get(self.id_key)
+            if uid is not None:
+                latest[int(uid)] = self._values(rec)
+        if not latest:
+            return []
+        self._load([uid for uid in latest if uid not in self.cache])
+        fresh = {}
+        for uid, values in latest.items():
+            if self.cache.get(uid) == values:
+                self.cache.move_to_end(uid)
+                self.unchanged += 1
+                continue
+            self._remember(uid, values)
+            fresh[uid] = values
+        if not fresh:
+            return []
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for uid, values in fresh.items():
+                key = self._key(uid)
+                pipe.hset(key, uid, ",".join(map(str, values)))
+                pipe.expire(key, LAST_VALUES_TTL)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Metric snapshot save failed ({self.key_prefix}), {len(fresh)} ids: {e}")
+        self.written += len(fresh)
+        stamp = ts or datetime.fromtimestamp(int(time.time()), tz=timezone.utc)
+        ids = list(fresh)
+        columns = [ids, [stamp] * len(ids)]
+        for i in range(len(self.metrics)):
+            columns.append([fresh[uid][i] for uid in ids])
+        return columns
+
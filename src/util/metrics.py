@@ -0,0 +1,282 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from src.util.config import METRICS_HOST, METRICS_PORT, METRICS_SUMMARY_INTERVAL
+from src.util.logger import logger
+
+# 延迟（秒）和批量大小（行）的直方图分桶
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 20000, 100000)
+PAGE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        # label 取值元组 -> 值；只在事件循环线程里写，/metrics 线程读的是快照
+        self.values = {}
+
+    def _label_str(self, key, extra=""):
+        pairs = [f'{n}="{v}"' for n, v in zip(self.label_names, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in list(self.values.items()):
+            lines.append(f"{self.name}{self._label_str(key)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, *labels):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def total(self):
+        return sum(list(self.values.values()))
+
+
+class Gauge(Metric):
+    """Set directly, or ``track(fn, *labels)`` to read ``fn()`` at scrape time (queue depths)."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self.functions = {}
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def track(self, fn, *labels):
+        self.functions[labels] = fn
+
+    def untrack(self, *labels):
+        self.functions.pop(labels, None)
+
+    def current(self):
+        out = dict(self.values)
+        for key, fn in list(self.functions.items()):
+            try:
+                out[key] = fn()
+            except Exception:
+                continue
+        return out
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.current().items():
+            lines.append(f"{self.name}{self._label_str(key)} {value}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # [每个桶的计数..., +Inf 桶, sum]
+        slot = self.values.get(labels)
+        if slot is None:
+            slot = self.values[labels] = [0] * (len(self.buckets) + 2)
+        slot[bisect_left(self.buckets, value)] += 1
+        slot[-1] += value
+
+    def snapshot(self):
+        """Merged ``(counts, sum)`` over every label set."""
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for slot in list(self.values.values()):
+            for i, c in enumerate(slot[:-1]):
+                counts[i] += c
+            total += slot[-1]
+        return counts, total
+
+    def quantile(self, q, counts=None):
+        """Upper bucket bound below which ``q`` of the observations fall (None if empty)."""
+        counts = counts if counts is not None else self.snapshot()[0]
+        n = sum(counts)
+        if not n:
+            return None
+        rank = q * n
+        seen = 0
+        for bound, c in zip(self.buckets + (float("inf"),), counts):
+            seen += c
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, slot in list(self.values.items()):
+            slot = list(slot)
+            cumulative = 0
+            for bound, c in zip(self.buckets + ("+Inf",), slot[:-1]):
+                cumulative += c
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{self._label_str(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_str(key)} {slot[-1]}")
+            lines.append(f"{self.name}_count{self._label_str(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _get(self, cls, name, *args, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, *args, **kwargs)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- CRAWLER METRICS ---
+HTTP_REQUESTS = REGISTRY.counter("soundcloud_http_requests_total", "API requests by status and proxy",
+                                 ("status", "proxy"))
+HTTP_SECONDS = REGISTRY.histogram("soundcloud_http_request_seconds", "API request latency by status", ("status",))
+HTTP_RETRIES = REGISTRY.counter("soundcloud_http_retries_total", "API requests retried")
+PAGES_PER_USER = REGISTRY.histogram("crawler_pages_per_user", "API pages fetched per crawled user",
+                                    ("crawler",), buckets=PAGE_BUCKETS)
+TRANSFORM_SECONDS = REGISTRY.histogram("crawler_transform_seconds", "Time to turn a page into insert columns",
+                                       ("kind",))
+INSERT_ROWS = REGISTRY.histogram("clickhouse_insert_rows", "Rows per ClickHouse insert", ("table",),
+                                 buckets=SIZE_BUCKETS)
+INSERT_SECONDS = REGISTRY.histogram("clickhouse_insert_seconds", "ClickHouse insert latency", ("table",))
+ROWS_WRITTEN = REGISTRY.counter("clickhouse_rows_total", "Rows sent to ClickHouse by result", ("table", "result"))
+WAIT_SECONDS = REGISTRY.histogram("crawler_wait_seconds",
+                                  "Time spent blocked: rate limiter, writer backpressure, idle workers", ("stage",))
+QUEUE_DEPTH = REGISTRY.gauge("crawler_queue_depth", "Items waiting in in-process queues", ("queue",))
+CACHE_REQUESTS = REGISTRY.counter("response_cache_requests_total", "Response cache lookups and stores by result",
+                                  ("result",))
+CONCURRENCY = REGISTRY.gauge("crawler_concurrency", "Adaptive concurrency window and users in flight",
+                             ("crawler", "kind"))
+
+
+@lru_cache(maxsize=1024)
+def proxy_label(proxy):
+    """Proxy host:port without credentials (``direct`` for no proxy)."""
+    if not proxy:
+        return "direct"
+    parts = urlsplit(proxy)
+    return f"{parts.hostname}:{parts.port}" if parts.hostname else proxy
+
+
+# --- EXPORT ---
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class Summary:
+    """
+    One-line digest of the crawler metrics: rates since the previous line,
+    latency quantiles (bucket upper bounds) and blocked seconds since start.
+    """
+
+    def __init__(self):
+        self.last_time = time.monotonic()
+        self.last_requests = 0
+        self.last_rows = 0
+        self.last_retries = 0
+
+    def line(self):
+        now = time.monotonic()
+        elapsed = max(now - self.last_time, 1e-9)
+        requests = HTTP_REQUESTS.total()
+        retries = HTTP_RETRIES.total()
+        rows = sum(v for k, v in list(ROWS_WRITTEN.values.items()) if k[1] == "ok")
+        ok = sum(v for k, v in list(HTTP_REQUESTS.values.items()) if k[0] == "200")
+        waits = {k[0]: round(slot[-1], 1) for k, slot in list(WAIT_SECONDS.values.items())}
+        queues = {k[0]: v for k, v in QUEUE_DEPTH.current().items()}
+        windows = {k[0]: v for k, v in CONCURRENCY.current().items() if k[1] == "limit"}
+        line = (f"req/s {(requests - self.last_requests) / elapsed:.1f} "
+                f"(ok {ok / requests if requests else 0:.0%}), "
+                f"api p50/p99 {_fmt(HTTP_SECONDS.quantile(0.5))}/{_fmt(HTTP_SECONDS.quantile(0.99))}, "
+                f"retries +{retries - self.last_retries}, rows/s {(rows - self.last_rows) / elapsed:.0f}, "
+                f"insert p99 {_fmt(INSERT_SECONDS.quantile(0.99))}, blocked {waits}, queues {queues}, "
+                f"concurrency {windows}")
+        self.last_time, self.last_requests, self.last_rows, self.last_retries = now, requests, rows, retries
+        return line
+
+
+def _fmt(seconds):
+    return "-" if seconds is None else f"<={seconds}s"
+
+
+_started = False
+
+
+def start_metrics(name, port_offset=0, port=METRICS_PORT, host=METRICS_HOST, interval=METRICS_SUMMARY_INTERVAL):
+    """
+    Serve ``/metrics`` on ``port + port_offset`` (sharded processes pass
+    their shard index; port 0 disables it) and log a summary line every
+    ``interval`` seconds (0 disables it). Only the first call per process
+    does anything.
+    """
+    global _started
+    if _started:
+        return
+    _started = True
+    if port:
+        try:
+            server = ThreadingHTTPServer((host, port + port_offset), _Handler)
+        except OSError as e:
+            logger.warning(f"Metrics endpoint for {name} not started on {host}:{port + port_offset}: {e}")
+        else:
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Metrics for {name} on http://{host}:{port + port_offset}/metrics")
+    if interval:
+        summary = Summary()
+
+        def report():
+            while True:
+                time.sleep(interval)
+                try:
+                    logger.info(f"{name} metrics: {summary.line()}")
+                except Exception as e:
+                    logger.warning(f"Metrics summary failed: {e}")
+        threading.Thread(target=report, name="metrics-summary", daemon=True).start()
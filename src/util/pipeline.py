@@ -0,0 +1,228 @@
+import asyncio
+import time
+from contextlib import nullcontext
+
+from src.util.logger import logger
+from src.util.metrics import QUEUE_DEPTH, WAIT_SECONDS
+
+# 有界队列里最多排多少个用户；满了以后预取协程挂起
+QUEUE_SIZE = 64
+# ready() 不满足时，预取协程隔多久再看一次
+READY_POLL = 0.5
+
+_DONE = object()
+
+
+class PipelineBatch:
+    """One leased batch whose users are spread over the workers."""
+
+    def __init__(self, lease, user_ids, heartbeat):
+        self.lease = lease
+        self.pending = set(user_ids)
+        self.heartbeat = heartbeat
+        self.failed = 0
+        self.started = time.monotonic()
+
+
+class LeasePipeline:
+    """
+    Overlapped processing of ``WorkQueue`` batches.
+
+    Instead of crawling one batch, waiting for its slowest user and only
+    then leasing the next, a prefetcher task keeps leasing ahead: it runs
+    ``prepare(lease)`` (checkpoint lookups, planning, ...; returns
+    ``{user_id: arg}``) and ``feed``s the users to the workers. By default
+    they go into a bounded queue (``next_item``), so the prefetcher stays
+    only ``maxsize`` users ahead and the queue refills before it drains;
+    ``ready()``, if given, additionally holds the next lease back until it
+    returns true.
+
+    Completion is tracked per user: workers report each user with
+    ``done(user_id, ok)``. A lease is heartbeated until all of its users
+    are reported, then ``on_complete(batch)`` runs and the lease is acked,
+    or released if any user failed (finished users are skipped through the
+    checkpoints when it comes back). A lease that expired and was taken
+    over by another host is neither completed nor acked.
+    """
+
+    def __init__(self, work_queue, seeds, prepare=None, on_complete=None, feed=None, ready=None,
+                 maxsize=QUEUE_SIZE):
+        self.work_queue = work_queue
+        self.seeds = seeds
+        self.prepare = prepare
+        self.on_complete = on_complete
+        self.ready = ready
+        self.items = asyncio.Queue(maxsize=maxsize)
+        if feed is not None:
+            self.feed = feed
+        self.batches = []
+        self.owner = {}
+        self.finished = False
+        self.batches_done = 0
+        self.users_done = 0
+        self.idle_seconds = 0.0
+        self._completions = set()
+        self._prefetcher = None
+        self._workers = 0
+        self._started = None
+
+    # --- producer ---
+    async def feed(self, items):
+        """Hand ``{user_id: arg}`` to the workers; returns the ids that were actually queued."""
+        for item in items.items():
+            await self.items.put(item)
+        return list(items)
+
+    def start(self, workers=0):
+        """Start the prefetcher; with ``workers`` > 0 it ends the queue with one stop marker per worker."""
+        self._workers = workers
+        self._started = time.monotonic()
+        self._prefetcher = asyncio.create_task(self._prefetch())
+        QUEUE_DEPTH.track(self.items.qsize, "pipeline")
+        return self
+
+    async def _prefetch(self):
+        try:
+            await self._lease_ahead()
+        except asyncio.CancelledError:
+            self.finished = True
+            raise
+        except Exception:
+            self.finished = True
+            await self._stop_workers()
+            raise
+        self.finished = True
+        await self._stop_workers()
+
+    async def _stop_workers(self):
+        for _ in range(self._workers):
+            await self.items.put(_DONE)
+
+    async def _lease_ahead(self):
+        async for lease in self.work_queue.leases(self.seeds):
+            batch = PipelineBatch(lease, lease.user_ids, self.work_queue.keep_alive(lease))
+            try:
+                items = await self.prepare(lease) if self.prepare else dict.fromkeys(lease.user_ids)
+            except Exception:
+                logger.error("Preparing %s failed, releasing it", lease, exc_info=True)
+                batch.pending.clear()
+                batch.failed += 1
+                self._complete(batch)
+                continue
+            self.batches.append(batch)
+            for uid in batch.pending:
+                self.owner[uid] = batch
+            # 不需要再抓的用户（断点已完成、未变化、已见过）直接算完成
+            skipped = batch.pending - set(items)
+            queued = await self.feed(items) if items else []
+            skipped |= set(items) - set(queued)
+            for uid in skipped:
+                self.done(uid)
+            if self.ready is not None:
+                while not self.ready():
+                    await asyncio.sleep(READY_POLL)
+
+    # --- workers ---
+    async def next_item(self):
+        """Next ``(user_id, arg)`` from the queue, or None once every batch has been handed out."""
+        started = time.monotonic()
+        item = await self.items.get()
+        waited = time.monotonic() - started
+        self.idle_seconds += waited
+        WAIT_SECONDS.observe(waited, "pipeline")
+        return None if item is _DONE else item
+
+    def done(self, user_id, ok=True):
+        """Report one user; completes its batch when it was the last one."""
+        batch = self.owner.pop(user_id, None)
+        if batch is None:
+            return
+        batch.pending.discard(user_id)
+        self.users_done += 1
+        if not ok:
+            batch.failed += 1
+        if not batch.pending:
+            self._complete(batch)
+
+    def _complete(self, batch):
+        if batch in self.batches:
+            self.batches.remove(batch)
+        task = asyncio.create_task(self._finish(batch))
+        self._completions.add(task)
+        task.add_done_callback(self._completions.discard)
+
+    async def _finish(self, batch):
+        batch.heartbeat.cancel()
+        # 租约过期后被别的主机重新租走的批次归它所有，这里既不确认也不退回
+        if batch.lease.lost or not await asyncio.to_thread(self.work_queue.heartbeat, batch.lease):
+            logger.warning(f"{batch.lease} was lost (lease expired and taken over), leaving it to its new owner")
+            return
+        try:
+            if self.on_complete is not None and not batch.failed:
+                await self.on_complete(batch)
+        except Exception:
+            logger.error("Completing %s failed", batch.lease, exc_info=True)
+            batch.failed += 1
+        if batch.failed:
+            if batch.lease.attempt >= self.work_queue.max_attempts:
+                logger.error(f"{batch.lease}: {batch.failed} users failed on the last attempt, moving it to dead")
+                self.work_queue.bury(batch.lease)
+            else:
+                logger.warning(f"{batch.lease}: {batch.failed} users failed, releasing it")
+                self.work_queue.release(batch.lease)
+            return
+        self.work_queue.ack(batch.lease)
+        self.batches_done += 1
+        logger.info("Batch complete: %s in %.1fs, %d batches in flight", batch.lease,
+                    time.monotonic() - batch.started, len(self.batches))
+
+    async def run(self, handle, workers, limit=None):
+        """
+        Crawl everything with ``workers`` coroutines calling
+        ``await handle(user_id, arg)`` per user; a user whose handler
+        raises counts as failed. With an ``AdaptiveLimit``, ``workers``
+        is its upper bound and each user is crawled inside one of its slots.
+        """
+        async def worker():
+            while (item := await self.next_item()) is not None:
+                user_id, arg = item
+                try:
+                    async with limit or nullcontext():
+                        await handle(user_id, arg)
+                except Exception:
+                    logger.error("User %s failed", user_id, exc_info=True)
+                    self.done(user_id, ok=False)
+                else:
+                    self.done(user_id)
+        self.start(workers)
+        try:
+            await asyncio.gather(*(worker() for _ in range(workers)))
+            await self._prefetcher
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Stop prefetching, wait for batches being completed and release the unfinished ones."""
+        if self._prefetcher is not None and not self._prefetcher.done():
+            self._prefetcher.cancel()
+            try:
+                await self._prefetcher
+            except (Exception, asyncio.CancelledError):
+                pass
+        if self._completions:
+            await asyncio.gather(*list(self._completions), return_exceptions=True)
+        for batch in self.batches:
+            batch.heartbeat.cancel()
+            self.work_queue.release(batch.lease)
+        if self.batches:
+            logger.info(f"Released {len(self.batches)} unfinished batches")
+        self.batches = []
+        self.owner = {}
+        QUEUE_DEPTH.untrack("pipeline")
+
+    def utilization(self, workers):
+        """Share of worker time spent crawling rather than waiting for users."""
+        if not self._started or not workers:
+            return 0.0
+        elapsed = (time.monotonic() - self._started) * workers
+        return max(0.0, 1 - self.idle_seconds / elapsed) if elapsed else 0.0
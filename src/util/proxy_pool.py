@@ -0,0 +1,116 @@
+import time
+from contextlib import asynccontextmanager
+
+from src.util.logger import logger
+
+# 连续失败多少次后隔离该出口
+QUARANTINE_AFTER = 3
+# 隔离时长（秒），每次再被隔离翻倍，直到上限
+QUARANTINE_BASE = 30
+QUARANTINE_MAX = 900
+
+
+class ProxyEndpoint:
+    def __init__(self, url):
+        self.url = url
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.quarantine_count = 0
+        self.quarantined_until = 0.0
+
+    def available(self, now):
+        return now >= self.quarantined_until
+
+
+class ProxyPool:
+    """
+    Spreads in-flight requests over several proxy exits (Clash mixed-port
+    listeners, tunnel URLs, ...), since SoundCloud rate limits per exit IP.
+
+    ``acquire()`` hands out the least-loaded healthy endpoint. Endpoints that
+    fail ``QUARANTINE_AFTER`` times in a row are quarantined with an
+    exponential cooldown and brought back automatically when it expires.
+    A pool built from an empty list hands out ``None`` (direct connection).
+    """
+
+    def __init__(self, urls):
+        self.endpoints = [ProxyEndpoint(url) for url in dict.fromkeys(u for u in urls if u)]
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def _pick(self):
+        now = time.monotonic()
+        healthy = [e for e in self.endpoints if e.available(now)]
+        if not healthy:
+            # 全部被隔离时退而求其次：用最早解除隔离的出口
+            return min(self.endpoints, key=lambda e: e.quarantined_until)
+        return min(healthy, key=lambda e: (e.in_flight, e.requests))
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Yield a proxy URL for one request. Callers report the outcome with
+        ``pool.success(url)`` / ``pool.failure(url)``.
+        """
+        if not self.endpoints:
+            yield None
+            return
+        endpoint = self._pick()
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+        try:
+            yield endpoint.url
+        finally:
+            endpoint.in_flight -= 1
+
+    def _find(self, url):
+        for e in self.endpoints:
+            if e.url == url:
+                return e
+        return None
+
+    def success(self, url):
+        endpoint = self._find(url)
+        if endpoint is not None:
+            endpoint.consecutive_failures = 0
+            if endpoint.quarantine_count and endpoint.available(time.monotonic()):
+                endpoint.quarantine_count = 0
+
+    def failure(self, url):
+        endpoint = self._find(url)
+        if endpoint is None:
+            return
+        endpoint.failures += 1
+        if not endpoint.available(time.monotonic()):
+            # 隔离前已发出的请求陆续失败，不再叠加隔离时长
+            return
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= QUARANTINE_AFTER:
+            cooldown = min(QUARANTINE_BASE * (2 ** endpoint.quarantine_count), QUARANTINE_MAX)
+            endpoint.quarantined_until = time.monotonic() + cooldown
+            endpoint.quarantine_count += 1
+            endpoint.consecutive_failures = 0
+            logger.warning(f"Proxy {endpoint.url} quarantined for {cooldown}s")
+
+    def snapshot(self):
+        now = time.monotonic()
+        return [{
+            "url": e.url,
+            "in_flight": e.in_flight,
+            "requests": e.requests,
+            "failures": e.failures,
+            "quarantined": not e.available(now),
+        } for e in self.endpoints]
+
+
+def create_proxy_pool(urls, fallback=None):
+    """Pool over ``urls``; falls back to the single ``fallback`` proxy when the list is empty."""
+    urls = list(urls or [])
+    if not urls and fallback:
+        urls = [fallback]
+    pool = ProxyPool(urls)
+    logger.info(f"Proxy pool with {len(pool)} endpoints")
+    return pool
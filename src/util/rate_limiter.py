@@ -0,0 +1,214 @@
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+
+from src.util.config import RATE_LIMIT_RPS, RATE_LIMIT_PROXY_RPS, RATE_LIMIT_REDIS
+from src.util.logger import logger
+from src.util.metrics import proxy_label
+
+# 突发容量（秒数 * 速率）
+BURST_SECONDS = 1.0
+# AIMD：收到 429 时速率乘以该系数；每次成功增加 ADDITIVE_INCREASE / rate
+DECREASE_FACTOR = 0.5
+# 一次限流通常同时返回给多个并发请求，同一窗口内只降速一次
+DECREASE_COOLDOWN = 1.0
+ADDITIVE_INCREASE = 0.1
+MIN_RATE = 0.2
+# 集群模式下攒够多少次成功再写一次 Redis
+REDIS_INCREASE_EVERY = 20
+REDIS_KEY_PREFIX = "soundcloud:ratelimit"
+REDIS_KEY_TTL_MS = 600000
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a ``Retry-After`` header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except Exception:
+        return None
+
+
+class LocalBucket:
+    """In-process token bucket with an AIMD-adjusted rate."""
+
+    def __init__(self, name, rate):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.tokens = rate * BURST_SECONDS
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.decreased_at = float("-inf")
+
+    def reserve(self):
+        """Take one token (possibly going into debt) and return how long to wait for it."""
+        now = time.monotonic()
+        burst = max(self.rate * BURST_SECONDS, 1.0)
+        self.tokens = min(burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def decrease(self, retry_after=None):
+        now = time.monotonic()
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+        if now - self.decreased_at < DECREASE_COOLDOWN:
+            return
+        self.decreased_at = now
+        self.rate = max(self.rate * DECREASE_FACTOR, MIN_RATE)
+        if retry_after:
+            logger.warning("Rate limit %s throttled, rate now %.2f/s, paused %.1fs", self.name, self.rate,
+                           retry_after, extra={"log_key": ("throttle", self.name)})
+        else:
+            logger.warning("Rate limit %s throttled, rate now %.2f/s", self.name, self.rate,
+                           extra={"log_key": ("throttle", self.name)})
+
+    def increase(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.rate + ADDITIVE_INCREASE / self.rate, self.max_rate)
+
+
+# KEYS[1] = bucket hash; ARGV = now, max_rate, burst_seconds, ttl_ms
+# 返回需要等待的毫秒数；令牌可以透支，等待时间由透支量决定
+_RESERVE_LUA = """
+local h = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate', 'paused_until')
+local now = tonumber(ARGV[1])
+local rate = tonumber(h[3]) or tonumber(ARGV[2])
+local burst = math.max(rate * tonumber(ARGV[3]), 1)
+local tokens = tonumber(h[1]) or burst
+local ts = tonumber(h[2]) or now
+local paused = tonumber(h[4]) or 0
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now), 'rate', tostring(rate))
+redis.call('PEXPIRE', KEYS[1], tonumber(ARGV[4]))
+local wait = 0
+if tokens < 0 then wait = -tokens / rate end
+wait = math.max(wait, paused - now)
+return math.ceil(wait * 1000)
+"""
+
+# KEYS[1] = bucket hash; ARGV = factor_or_step, mode ('mul'|'add'), min_rate, max_rate, paused_until,
+#          now, cooldown
+# 返回 {新速率, 是否降速}；'mul' 在 cooldown 秒内只生效一次
+_ADJUST_LUA = """
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate')) or tonumber(ARGV[4])
+local decreased = 0
+if ARGV[2] == 'mul' then
+  local now = tonumber(ARGV[6])
+  local last = tonumber(redis.call('HGET', KEYS[1], 'decreased_at')) or 0
+  if now - last >= tonumber(ARGV[7]) then
+    rate = math.max(rate * tonumber(ARGV[1]), tonumber(ARGV[3]))
+    redis.call('HSET', KEYS[1], 'decreased_at', tostring(now))
+    decreased = 1
+  end
+else
+  rate = math.min(rate + tonumber(ARGV[1]) / rate, tonumber(ARGV[4]))
+end
+redis.call('HSET', KEYS[1], 'rate', tostring(rate))
+local paused = tonumber(ARGV[5])
+if paused > 0 then
+  local current = tonumber(redis.call('HGET', KEYS[1], 'paused_until')) or 0
+  if paused > current then redis.call('HSET', KEYS[1], 'paused_until', tostring(paused)) end
+end
+return {tostring(rate), decreased}
+"""
+
+
+class RedisBucket:
+    """Token bucket shared by every crawler process through a Redis hash."""
+
+    def __init__(self, name, rate, redis_client):
+        self.name = name
+        self.max_rate = rate
+        self.redis_client = redis_client
+        self.key = f"{REDIS_KEY_PREFIX}:{name}"
+        self._reserve = redis_client.register_script(_RESERVE_LUA)
+        self._adjust = redis_client.register_script(_ADJUST_LUA)
+        self._successes = 0
+
+    def reserve(self):
+        wait_ms = self._reserve(keys=[self.key], args=[time.time(), self.max_rate, BURST_SECONDS, REDIS_KEY_TTL_MS])
+        return int(wait_ms) / 1000
+
+    def decrease(self, retry_after=None):
+        now = time.time()
+        paused_until = now + retry_after if retry_after else 0
+        rate, decreased = self._adjust(keys=[self.key], args=[DECREASE_FACTOR, "mul", MIN_RATE, self.max_rate,
+                                                              paused_until, now, DECREASE_COOLDOWN])
+        if not decreased:
+            return
+        logger.warning("Rate limit %s throttled (cluster), rate now %.2f/s", self.name, float(rate),
+                       extra={"log_key": ("throttle", self.name)})
+
+    def increase(self):
+        self._successes += 1
+        if self._successes >= REDIS_INCREASE_EVERY:
+            self._adjust(keys=[self.key],
+                         args=[ADDITIVE_INCREASE * self._successes, "add", MIN_RATE, self.max_rate, 0, 0, 0])
+            self._successes = 0
+
+
+class RateLimiter:
+    """
+    Requests-per-second budget per SoundCloud client_id and, when
+    ``proxy_rate`` is set, per proxy exit.
+
+    Every API request calls ``await acquire(client_id, proxy)`` first,
+    then reports the outcome: ``on_success`` grows the budget back
+    slowly, ``on_throttle`` halves it and honours ``Retry-After``. With a Redis client the buckets
+    live in Redis and are shared by all crawler processes.
+    """
+
+    def __init__(self, client_rate=RATE_LIMIT_RPS, proxy_rate=RATE_LIMIT_PROXY_RPS, redis_client=None):
+        self.client_rate = client_rate
+        self.proxy_rate = proxy_rate
+        self.redis_client = redis_client
+        self.buckets = {}
+
+    def _bucket(self, name, rate):
+        bucket = self.buckets.get(name)
+        if bucket is None:
+            if self.redis_client is not None:
+                bucket = RedisBucket(name, rate, self.redis_client)
+            else:
+                bucket = LocalBucket(name, rate)
+            self.buckets[name] = bucket
+        return bucket
+
+    def _buckets_for(self, client_id, proxy):
+        buckets = [self._bucket(f"client:{client_id}", self.client_rate)]
+        if proxy and self.proxy_rate:
+            # 桶名会进 Redis key 和日志，不能带代理的账号密码
+            buckets.append(self._bucket(f"proxy:{proxy_label(proxy)}", self.proxy_rate))
+        return buckets
+
+    def _wait_time(self, client_id, proxy):
+        return max(b.reserve() for b in self._buckets_for(client_id, proxy))
+
+    async def acquire(self, client_id, proxy=None):
+        wait = self._wait_time(client_id, proxy)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self, client_id, proxy=None):
+        for b in self._buckets_for(client_id, proxy):
+            b.increase()
+
+    def on_throttle(self, client_id, proxy=None, retry_after=None):
+        for b in self._buckets_for(client_id, proxy):
+            b.decrease(retry_after)
+
+
+def create_rate_limiter():
+    redis_client = None
+    if RATE_LIMIT_REDIS:
+        from src.util.db import redis_client
+    return RateLimiter(redis_client=redis_client)
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from src.util.config import RESPONSE_CACHE_MAX_MB, RESPONSE_CACHE_MODE, RESPONSE_CACHE_PATH, RESPONSE_CACHE_TTLS
+from src.util.logger import logger
+from src.util.metrics import CACHE_REQUESTS
+
+# 各接口默认有效期（秒），可用 RESPONSE_CACHE_TTLS 覆盖
+ENDPOINT_TTLS = {
+    "tracks": 86400,
+    "followers": 86400,
+    "search": 6 * 3600,
+    "users": 3600,
+}
+DEFAULT_TTL = 3600
+# 不影响响应内容、不参与缓存 key 的参数
+IGNORED_PARAMS = {"client_id"}
+# zlib 级别：API 响应是 JSON，1 级已能压到 1/5 左右且很快
+COMPRESS_LEVEL = 1
+# 命中时 accessed_at 落后超过这么久才回写，避免每次命中都写库
+TOUCH_AFTER = 3600
+# 每写入这么多条检查一次大小，超出上限时按 accessed_at 淘汰到上限的 EVICT_TO
+CHECK_EVERY = 500
+EVICT_TO = 0.9
+MODES = ("readwrite", "offline")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key BLOB PRIMARY KEY,
+    endpoint TEXT NOT NULL,
+    body BLOB NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+"""
+
+
+def normalize_url(url):
+    """``url`` without ``client_id`` and with sorted query parameters, so every client_id shares one entry."""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in IGNORED_PARAMS)
+    return f"{parts.netloc}{parts.path}?{urlencode(query)}"
+
+
+def endpoint_of(url):
+    """TTL class of an API url: ``tracks``, ``followers``, ``search`` or ``users``."""
+    path = urlsplit(url).path.rstrip("/")
+    if path.endswith("/tracks"):
+        return "tracks"
+    if path.endswith("/followers"):
+        return "followers"
+    if path.startswith("/search"):
+        return "search"
+    return "users"
+
+
+class ResponseCache:
+    """
+    On-disk cache of raw 200 responses from the SoundCloud API.
+
+    Entries live in one SQLite file (WAL, so sharded processes can share
+    it) keyed by the SHA-1 of the normalized url and stored
+    zlib-compressed. Each endpoint has its own TTL (``ttls``); expired
+    entries are misses. When the live data exceeds ``max_bytes`` the least
+    recently used entries are evicted. In ``offline`` mode the fetch
+    functions serve only from the cache and never touch the network.
+    """
+
+    def __init__(self, path, max_bytes, ttls=None, mode="readwrite"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown response cache mode {mode!r}, expected one of {MODES}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = {**ENDPOINT_TTLS, **(ttls or {})}
+        self.mode = mode
+        self.offline = mode == "offline"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 共用一个连接并加锁，允许从事件循环以外的线程访问
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, url):
+        return hashlib.sha1(normalize_url(url).encode()).digest()
+
+    def get(self, url):
+        """
+        Raw body cached for ``url``, or None if missing or expired. Offline
+        mode ignores the TTL. Expired rows are left for eviction to remove,
+        so a later offline replay can still read them.
+        """
+        key = self._key(url)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT endpoint, body, stored_at, accessed_at FROM responses WHERE key = ?",
+                                    (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                CACHE_REQUESTS.inc(1, "miss")
+                return None
+            endpoint, body, stored_at, accessed_at = row
+            if not self.offline and now - stored_at > self.ttls.get(endpoint, DEFAULT_TTL):
+                self.misses += 1
+                CACHE_REQUESTS.inc(1, "expired")
+                return None
+            if now - accessed_at > TOUCH_AFTER:
+                self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        CACHE_REQUESTS.inc(1, "hit")
+        return zlib.decompress(body)
+
+    def put(self, url, body):
+        """Store the raw 200 body of ``url``."""
+        if self.offline:
+            return
+        now = time.time()
+        blob = zlib.compress(body, COMPRESS_LEVEL)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                              (self._key(url), endpoint_of(url), blob, now, now))
+            self.writes += 1
+            if self.writes % CHECK_EVERY == 0:
+                self._evict()
+        CACHE_REQUESTS.inc(1, "store")
+
+    def size(self):
+        """Bytes used by live pages of the database file."""
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        pages = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        free = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * page_size
+
+    def _evict(self):
+        used = self.size()
+        if used <= self.max_bytes:
+            return
+        count = self.conn.execute("SELECT count(*) FROM responses").fetchone()[0]
+        # 按平均条目大小估算要删多少条；删掉的页进 freelist，之后的写入会复用
+        n = max(int(count * (1 - self.max_bytes * EVICT_TO / used)), 1)
+        self.conn.execute("DELETE FROM responses WHERE key IN "
+                          "(SELECT key FROM responses ORDER BY accessed_at LIMIT ?)", (n,))
+        logger.info("Response cache %s: evicted %d of %d entries (%.0f MB > %.0f MB)",
+                    self.path, n, count, used / 1e6, self.max_bytes / 1e6)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def create_response_cache(path=RESPONSE_CACHE_PATH, max_mb=RESPONSE_CACHE_MAX_MB, ttls=RESPONSE_CACHE_TTLS,
+                          mode=RESPONSE_CACHE_MODE):
+    """The configured cache, or None when ``RESPONSE_CACHE_PATH`` is not set."""
+    if not path:
+        return None
+    cache = ResponseCache(path, max_mb * 1024 * 1024, ttls, mode)
+    logger.info(f"Response cache at {path} ({mode}, {max_mb} MB)")
+    return cache
@@ -0,0 +1,83 @@
+import random
+import time
+
+# 状态码分类
+OK = "ok"
+RETRY = "retry"
+FAIL = "fail"
+CREDENTIAL = "credential"
+
+MAX_ATTEMPTS = 6
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+# 重试预算：每个首次请求存入 RETRY_RATIO 个令牌，每次重试取出 1 个；
+# 另外每秒保底 MIN_RETRIES_PER_SECOND 次重试，防止低流量时完全不能重试
+RETRY_RATIO = 0.2
+MIN_RETRIES_PER_SECOND = 2.0
+MAX_RETRY_TOKENS = 500.0
+
+
+def classify_status(status):
+    """Map an HTTP status to OK / RETRY / FAIL / CREDENTIAL."""
+    if 200 <= status < 300:
+        return OK
+    if status == 401:
+        # client_id 失效，换一个 client_id 再试
+        return CREDENTIAL
+    if status in (408, 429) or status >= 500:
+        return RETRY
+    return FAIL
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter."""
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY, rng=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt, retry_after=None):
+        """Sleep before retry number ``attempt`` (0-based); never shorter than ``retry_after``."""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        delay = self.rng.uniform(0, ceiling)
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class RetryBudget:
+    """
+    Process-wide cap on retries relative to first attempts, so a bad period
+    degrades into failed users instead of a storm of duplicate requests.
+    """
+
+    def __init__(self, ratio=RETRY_RATIO, min_per_second=MIN_RETRIES_PER_SECOND, max_tokens=MAX_RETRY_TOKENS):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = 0.0
+        self.reserve = min_per_second
+        self.updated = time.monotonic()
+        self.exhausted = 0
+
+    def deposit(self):
+        self.tokens = min(self.tokens + self.ratio, self.max_tokens)
+
+    def try_withdraw(self):
+        now = time.monotonic()
+        self.reserve = min(self.min_per_second, self.reserve + (now - self.updated) * self.min_per_second)
+        self.updated = now
+        if self.reserve >= 1:
+            self.reserve -= 1
+            return True
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.exhausted += 1
+        return False
+
+
+retry_budget = RetryBudget()
@@ -0,0 +1,99 @@
+from src.util.logger import logger
+
+SEED_TABLE = "users"
+BATCH_SIZE = 1000
+# 每次向 ClickHouse 发起的查询最多覆盖多少个 id，结果按 block 流式读取
+WINDOW_SIZE = 100000
+
+
+class SeedIterator:
+    """
+    Keyset-paginated iterator over the ids of a ClickHouse table.
+
+    Pages with ``WHERE id > last_id ORDER BY id`` instead of LIMIT/OFFSET, so
+    each query only reads the part of the primary key it returns and the
+    order stays stable while other crawlers keep inserting into the table.
+    The last committed id is kept in Redis under ``redis_key``.
+    """
+
+    def __init__(self, ch_client, redis_client, redis_key, table=SEED_TABLE,
+                 batch_size=BATCH_SIZE, window_size=WINDOW_SIZE, start_after=0, stop_at=None,
+                 where=None):
+        self.ch_client = ch_client
+        self.redis_client = redis_client
+        self.redis_key = redis_key
+        self.table = table
+        self.batch_size = batch_size
+        self.window_size = max(window_size, batch_size)
+        self.start_after = start_after
+        self.stop_at = stop_at
+        self.where = where
+        # 最近一次 batches() 是否读到了区间末尾（出错中断时为 False）
+        self.exhausted = False
+
+    def get_cursor(self):
+        try:
+            val = self.redis_client.get(self.redis_key)
+            return int(val) if val else self.start_after
+        except Exception as e:
+            logger.error(f"Redis get cursor error ({self.redis_key}): {e}")
+            return self.start_after
+
+    def commit(self, last_id):
+        """Persist ``last_id``: everything up to and including it is done."""
+        try:
+            self.redis_client.set(self.redis_key, str(last_id))
+        except Exception as e:
+            logger.error(f"Redis set cursor error ({self.redis_key}): {e}")
+
+    def range_marker(self):
+        """Identifies the cursor position and range; a queue's exhausted flag only holds while it is unchanged."""
+        return f"{self.get_cursor()}|{self.start_after}|{self.stop_at}|{self.where or ''}"
+
+    def _window_sql(self, after_id):
+        conditions = [f"id > {int(after_id)}"]
+        if self.stop_at is not None:
+            conditions.append(f"id <= {int(self.stop_at)}")
+        if self.where:
+            conditions.append(f"({self.where})")
+        return (f"SELECT DISTINCT id FROM {self.table} WHERE {' AND '.join(conditions)} "
+                f"ORDER BY id LIMIT {self.window_size}")
+
+    def _stream_window(self, after_id):
+        with self.ch_client.query_row_block_stream(self._window_sql(after_id)) as stream:
+            for block in stream:
+                for row in block:
+                    yield int(row[0])
+
+    def batches(self, after_id=None):
+        """
+        Yield lists of up to ``batch_size`` ids in ascending order, starting
+        after the Redis cursor. Callers commit ``batch[-1]`` once a batch is done.
+        ``exhausted`` is set when the generator ends because the range is
+        done, not because ClickHouse failed.
+        """
+        self.exhausted = False
+        cursor = self.get_cursor() if after_id is None else after_id
+        while True:
+            batch = []
+            count = 0
+            failed = False
+            try:
+                for uid in self._stream_window(cursor):
+                    batch.append(uid)
+                    count += 1
+                    if len(batch) >= self.batch_size:
+                        cursor = batch[-1]
+                        yield batch
+                        batch = []
+            except Exception as e:
+                logger.error(f"ClickHouse seed stream error after id {cursor}: {e}")
+                if count == 0:
+                    return
+                failed = True
+            if batch:
+                cursor = batch[-1]
+                yield batch
+            if count < self.window_size and not failed:
+                self.exhausted = True
+                return
@@ -0,0 +1,54 @@
+import time
+
+from src.util.logger import logger
+
+# 各分片的计数快照写到 Redis hash，过期时间防止残留
+METRICS_TTL = 86400
+
+
+class Shard:
+    """
+    One slice ``id % count == index`` of the user-id space.
+
+    Crawlers append ``suffix`` to their Redis keys (cursor, queue,
+    checkpoints) so every shard keeps its own progress; the default
+    ``Shard()`` (0 of 1) keeps the original, unsuffixed keys.
+    """
+
+    def __init__(self, index=0, count=1):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Invalid shard {index}/{count}")
+        self.index = index
+        self.count = count
+
+    def __repr__(self):
+        return f"Shard({self.index}/{self.count})"
+
+    @property
+    def suffix(self):
+        return f":shard{self.index}of{self.count}" if self.count > 1 else ""
+
+    @property
+    def label(self):
+        return f"shard-{self.index}/{self.count}"
+
+    def where(self, column="id"):
+        """ClickHouse condition selecting this shard, or None when unsharded."""
+        if self.count == 1:
+            return None
+        return f"{column} % {self.count} = {self.index}"
+
+    def owns(self, uid):
+        return uid % self.count == self.index
+
+
+def report_shard_metrics(redis_client, key_prefix, shard, **counters):
+    """Store this shard's counters under ``{key_prefix}:metrics{suffix}``."""
+    key = f"{key_prefix}:metrics{shard.suffix}"
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hset(key, mapping={**counters, "updated_at": int(time.time())})
+        pipe.expire(key, METRICS_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Shard metrics write failed ({key}): {e}")
@@ -0,0 +1,168 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from src.util import concurrency
+from src.util.client_ids import client_ids, with_client_id
+from src.util.config import PROXY_POOL, PROXY_URL
+from src.util.control_clash import report_crawler_error
+from src.util.db import redis_client
+from src.util.fastjson import RAW, decode_page
+from src.util.logger import logger
+from src.util.metrics import HTTP_REQUESTS, HTTP_RETRIES, HTTP_SECONDS, WAIT_SECONDS, proxy_label
+from src.util.proxy_pool import create_proxy_pool
+from src.util.rate_limiter import create_rate_limiter, parse_retry_after
+from src.util.response_cache import create_response_cache
+from src.util.retry import CREDENTIAL, FAIL, RETRY, RetryPolicy, classify_status, retry_budget
+
+# 进程内共享：代理池、限速器、默认重试策略、响应缓存（未配置时为 None）
+proxy_pool = create_proxy_pool(PROXY_POOL, fallback=PROXY_URL)
+rate_limiter = create_rate_limiter()
+default_policy = RetryPolicy()
+response_cache = create_response_cache()
+
+# 日志里最多保留的响应体长度
+MAX_LOGGED_BODY = 200
+
+
+class FetchError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def permanent(self):
+        """True for a 4xx that no retry will fix (deleted or private account, bad request)."""
+        return self.status is not None and classify_status(self.status) == FAIL
+
+
+def _on_error_status(status, headers, client_id, proxy):
+    """Feed a non-2xx response back into the limiter/proxy pool; returns (outcome, retry_after)."""
+    outcome = classify_status(status)
+    retry_after = None
+    if status == 429:
+        retry_after = parse_retry_after(headers.get("Retry-After"))
+        rate_limiter.on_throttle(client_id, proxy, retry_after)
+    if outcome == RETRY:
+        proxy_pool.failure(proxy)
+        report_crawler_error(redis_client)
+    return outcome, retry_after
+
+
+def _on_transport_error(proxy):
+    proxy_pool.failure(proxy)
+    report_crawler_error(redis_client)
+
+
+def _observe(status, proxy, sent):
+    elapsed = time.perf_counter() - sent
+    HTTP_REQUESTS.inc(1, status, proxy_label(proxy))
+    HTTP_SECONDS.observe(elapsed, status)
+    concurrency.observe(elapsed, status)
+
+
+def _log_failure(label, attempt, policy, url, proxy, status, detail):
+    """
+    Per-attempt warning with structured fields. Repeats of the same status
+    from the same host and proxy are rate limited (``log_key``), so a burst
+    of 429s costs one line per interval instead of one per request.
+    """
+    host = urlsplit(url).hostname
+    logger.warning("%s: status %s on attempt %d/%d for %s via %s - %s",
+                   label, status, attempt + 1, policy.max_attempts, url, proxy, detail,
+                   extra={"status": status, "host": host, "proxy": proxy_label(proxy), "attempt": attempt + 1,
+                          "log_key": ("http", status, host, proxy)}, stacklevel=2)
+
+
+def _from_cache(url, label, schema):
+    """Decoded cached page of ``url``, or None on a miss (``FetchError`` on a miss in offline mode)."""
+    body = response_cache.get(url)
+    if body is not None:
+        try:
+            return decode_page(body, schema)
+        except ValueError:
+            logger.warning("%s: unreadable cache entry for %s, fetching it again", label, url)
+    if response_cache.offline:
+        raise FetchError(f"{label}: {url} is not in the response cache (offline mode)")
+    return None
+
+
+def _next_step(outcome, attempt, policy, client_id):
+    """Whether to try again after ``outcome``; rotates the client_id on CREDENTIAL."""
+    if outcome == FAIL:
+        return False
+    if outcome == CREDENTIAL:
+        return client_ids.rotate(client_id)
+    if attempt + 1 >= policy.max_attempts:
+        return False
+    if not retry_budget.try_withdraw():
+        logger.warning("Retry budget exhausted, not retrying")
+        return False
+    return True
+
+
+async def fetch_json(session, url, label="", headers=None, policy=default_policy, schema=RAW, cache=True):
+    """
+    GET a SoundCloud API url and return the decoded JSON.
+    Pages are decoded from the raw body with ``fastjson.decode_page``;
+    ``schema`` (``TRACKS``/``USERS``) keeps only the fields rows are built from.
+
+    Takes a proxy from the pool and a token from the rate limiter for every
+    attempt, retries 5xx/429/timeouts with capped full-jitter backoff inside
+    the process-wide retry budget, rotates the client_id on 401, and fails
+    fast on other 4xx. Raises ``FetchError`` when it gives up.
+
+    With a response cache configured, a fresh cached body is served
+    without a request and every 200 body is stored. ``cache=False`` skips
+    the cache both ways, for requests whose answer must be current.
+    """
+    cache = cache and response_cache is not None
+    if cache:
+        data = _from_cache(url, label, schema)
+        if data is not None:
+            return data
+    elif response_cache is not None and response_cache.offline:
+        raise FetchError(f"{label}: {url} bypasses the response cache (offline mode)")
+    retry_budget.deposit()
+    last_error = None
+    for attempt in range(policy.max_attempts):
+        client_id = client_ids.current()
+        retry_after = None
+        async with proxy_pool.acquire() as proxy:
+            started = time.perf_counter()
+            await rate_limiter.acquire(client_id, proxy)
+            sent = time.perf_counter()
+            WAIT_SECONDS.observe(sent - started, "rate_limit")
+            status = "error"
+            try:
+                async with session.get(with_client_id(url, client_id), headers=headers, proxy=proxy) as resp:
+                    status = str(resp.status)
+                    if resp.status == 200:
+                        body = await resp.read()
+                        data = decode_page(body, schema)
+                        if cache:
+                            response_cache.put(url, body)
+                        _observe(status, proxy, sent)
+                        proxy_pool.success(proxy)
+                        rate_limiter.on_success(client_id, proxy)
+                        return data
+                    text = await resp.text()
+                    outcome, retry_after = _on_error_status(resp.status, resp.headers, client_id, proxy)
+                    last_error = FetchError(f"{label}: HTTP {resp.status} for {url}", resp.status)
+                    _log_failure(label, attempt, policy, url, proxy, status, text[:MAX_LOGGED_BODY])
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                outcome = RETRY
+                status = "error"
+                _on_transport_error(proxy)
+                last_error = FetchError(f"{label}: {type(e).__name__} {e} for {url}")
+                _log_failure(label, attempt, policy, url, proxy, type(e).__name__, e)
+            _observe(status, proxy, sent)
+        if not _next_step(outcome, attempt, policy, client_id):
+            break
+        HTTP_RETRIES.inc()
+        if outcome == RETRY:
+            await asyncio.sleep(policy.delay(attempt, retry_after))
+    raise last_error
+
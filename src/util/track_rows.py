@@ -0,0 +1,216 @@
+import time
+from datetime import datetime
+
+from src.util import fastjson
+from src.util.metrics import TRANSFORM_SECONDS
+
+# --- SCHEMA INFO ---
+TRACK_COLS = [
+    "id","artwork_url","caption","commentable","comment_count","created_at","description",
+    "downloadable","download_count","duration","full_duration","embeddable_by","genre",
+    "has_downloads_left","kind","label_name","last_modified","license","likes_count",
+    "permalink","permalink_url","playback_count","public","purchase_title","purchase_url",
+    "release_date","reposts_count","secret_token","sharing","state","streamable","tag_list",
+    "title","uri","urn","user_id","visuals","waveform_url","display_date","station_urn",
+    "station_permalink","track_authorization","monetization_model","policy",
+    "publisher_metadata_id","publisher_metadata_urn","publisher_metadata_artist",
+    "publisher_metadata_album_title","publisher_metadata_contains_music",
+    "publisher_metadata_upc_or_ean","publisher_metadata_isrc","publisher_metadata_explicit",
+    "publisher_metadata_p_line","publisher_metadata_p_line_for_display",
+    "publisher_metadata_c_line","publisher_metadata_c_line_for_display",
+    "publisher_metadata_release_title"
+]
+NON_NULLABLE_UINT32 = [
+    'id', 'comment_count', 'download_count', 'duration', 'full_duration',
+    'likes_count', 'playback_count', 'reposts_count', 'user_id'
+]
+NON_NULLABLE_BOOL = [
+    'commentable', 'downloadable', 'has_downloads_left', 'public', 'streamable'
+]
+NON_NULLABLE_STRING = [
+    "artwork_url","embeddable_by","kind","license","permalink","permalink_url","sharing",
+    "state","tag_list","title","uri","urn","waveform_url","station_urn","station_permalink",
+    "track_authorization","monetization_model","policy"
+]
+NULLABLE_STRING_SPECIAL = ["visuals"]
+DATETIME_FIELDS = [
+    "created_at", "last_modified", "release_date", "display_date"
+]
+PM_FIELDS = [
+    "id", "urn", "artist", "album_title", "contains_music", "upc_or_ean", "isrc",
+    "explicit", "p_line", "p_line_for_display", "c_line", "c_line_for_display", "release_title"
+]
+
+EPOCH = datetime(1970, 1, 1)
+
+# --- TYPE HELPERS ---
+def parse_datetime(val):
+    if val is None:
+        return None
+    if isinstance(val, datetime):
+        return val
+    if isinstance(val, str):
+        v = val.replace("Z", "")
+        for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S"):
+            try:
+                return datetime.strptime(v, fmt)
+            except Exception:
+                continue
+        try:
+            return datetime.fromisoformat(v)
+        except Exception:
+            return None
+    return None
+
+def safe_release_date(val):
+    dt = parse_datetime(val)
+    if not dt or dt.year < 1970:
+        return None
+    return dt
+
+def safe_int(val):
+    try:
+        return int(val)
+    except Exception:
+        return 0
+
+def safe_bool(val):
+    if isinstance(val, bool):
+        return val
+    if isinstance(val, str):
+        return val.lower() in ("1", "true", "yes")
+    if isinstance(val, int):
+        return val != 0
+    return False
+
+def safe_str(val):
+    return str(val) if val is not None else ""
+
+def safe_nullable_string(val):
+    if val is None:
+        return None
+    if isinstance(val, (dict, list)):
+        return fastjson.dumps(val)
+    return str(val)
+
+# --- MAIN TRACK TRANSFORM ---
+def transform_track_to_ck(track: dict) -> list:
+    # Flatten publisher_metadata
+    pm = track.pop("publisher_metadata", {}) or {}
+    for pm_field in PM_FIELDS:
+        track[f"publisher_metadata_{pm_field}"] = pm.get(pm_field, None)
+
+    # Fix datetimes (created_at / last_modified are the partition and version columns)
+    for k in ["created_at", "last_modified"]:
+        track[k] = parse_datetime(track.get(k)) or EPOCH
+    track["display_date"] = parse_datetime(track.get("display_date"))
+    track["release_date"] = safe_release_date(track.get("release_date"))
+
+    # Non-nullable ints/bools/strings
+    for k in NON_NULLABLE_UINT32:
+        track[k] = safe_int(track.get(k, 0))
+    for k in NON_NULLABLE_BOOL:
+        track[k] = safe_bool(track.get(k, False))
+    for k in NON_NULLABLE_STRING:
+        track[k] = safe_str(track.get(k, ""))
+
+    # Nullable string fields that may be dicts
+    for k in NULLABLE_STRING_SPECIAL:
+        track[k] = safe_nullable_string(track.get(k, None))
+
+    # Output as ordered list
+    return [track.get(col, None) for col in TRACK_COLS]
+
+
+# --- COLUMNAR TRACK TRANSFORM ---
+# SoundCloud 固定返回 "2024-05-01T12:34:56Z"，走 C 实现的 fromisoformat 快速路径
+ISO_Z_LEN = 20
+
+def parse_datetime_column(values, default=None):
+    out = []
+    append = out.append
+    fromisoformat = datetime.fromisoformat
+    for v in values:
+        if type(v) is str and len(v) == ISO_Z_LEN and v[10] == "T" and v[19] == "Z":
+            try:
+                append(fromisoformat(v[:19]))
+                continue
+            except ValueError:
+                pass
+        append(parse_datetime(v) or default)
+    return out
+
+def _uint32_column(values):
+    return [v if type(v) is int else safe_int(v) for v in values]
+
+def _bool_column(values):
+    return [v if type(v) is bool else safe_bool(v) for v in values]
+
+def _string_column(values):
+    return [v if type(v) is str else safe_str(v) for v in values]
+
+def _nullable_string_column(values):
+    return [v if v is None or type(v) is str else safe_nullable_string(v) for v in values]
+
+def _release_date_column(values):
+    return [dt if dt is not None and dt.year >= 1970 else None for dt in parse_datetime_column(values)]
+
+def _build_column_plan():
+    plan = []
+    for col in TRACK_COLS:
+        if col.startswith("publisher_metadata_"):
+            plan.append((col, "pm", col[len("publisher_metadata_"):]))
+        elif col in ("created_at", "last_modified"):
+            plan.append((col, "datetime_required", None))
+        elif col == "display_date":
+            plan.append((col, "datetime", None))
+        elif col == "release_date":
+            plan.append((col, "release_date", None))
+        elif col in NON_NULLABLE_UINT32:
+            plan.append((col, "uint32", None))
+        elif col in NON_NULLABLE_BOOL:
+            plan.append((col, "bool", None))
+        elif col in NON_NULLABLE_STRING:
+            plan.append((col, "string", None))
+        elif col in NULLABLE_STRING_SPECIAL:
+            plan.append((col, "nullable_string", None))
+        else:
+            plan.append((col, "raw", None))
+    return plan
+
+# 按 TRACK_COLS 顺序预先算好每列的转换方式，只构建一次
+COLUMN_PLAN = _build_column_plan()
+
+def transform_tracks_columnar(tracks: list) -> list:
+    """
+    Turn a page of track dicts into one list per column of ``TRACK_COLS``,
+    ready for a ``column_oriented`` ClickHouse insert. Produces the same
+    values as ``transform_track_to_ck`` without mutating the input.
+    """
+    started = time.perf_counter()
+    pms = None
+    columns = []
+    for col, kind, pm_field in COLUMN_PLAN:
+        if kind == "pm":
+            if pms is None:
+                pms = [t.get("publisher_metadata") or {} for t in tracks]
+            columns.append([pm.get(pm_field) for pm in pms])
+            continue
+        values = [t.get(col) for t in tracks]
+        if kind == "uint32":
+            values = _uint32_column(values)
+        elif kind == "bool":
+            values = _bool_column(values)
+        elif kind == "string":
+            values = _string_column(values)
+        elif kind == "nullable_string":
+            values = _nullable_string_column(values)
+        elif kind == "datetime_required":
+            values = parse_datetime_column(values, EPOCH)
+        elif kind == "datetime":
+            values = parse_datetime_column(values)
+        elif kind == "release_date":
+            values = _release_date_column(values)
+        columns.append(values)
+    TRANSFORM_SECONDS.observe(time.perf_counter() - started, "tracks")
+    return columns
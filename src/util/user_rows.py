@@ -0,0 +1,269 @@
+import time
+from datetime import datetime, timezone
+
+from dateutil import parser as date_parser
+
+from src.util import fastjson
+from src.util.config import USER_RAW_MODE
+from src.util.fastjson import RAW, USERS
+from src.util.logger import logger
+from src.util.metrics import INSERT_ROWS, INSERT_SECONDS, ROWS_WRITTEN, TRANSFORM_SECONDS
+
+# --- SCHEMA INFO ---
+# users / followers / user_query 三张表共用的列，顺序与 DDL 一致
+USER_COLS = [
+    "id", "avatar_url", "city", "comments_count", "country_code", "created_at",
+    "creator_subscriptions", "creator_subscription", "description", "followers_count",
+    "followings_count", "first_name", "full_name", "groups_count", "kind", "last_modified",
+    "last_name", "likes_count", "playlist_likes_count", "permalink", "permalink_url",
+    "playlist_count", "reposts_count", "track_count", "uri", "urn", "username", "verified",
+    "visuals", "badges", "station_urn", "station_permalink",
+]
+
+# --- _raw MODES ---
+RAW_FULL = "full"
+RAW_UNCOVERED = "uncovered"
+RAW_BLOB = "blob"
+RAW_OFF = "off"
+RAW_MODES = (RAW_FULL, RAW_UNCOVERED, RAW_BLOB, RAW_OFF)
+RAW_NESTED_COLS = ["_raw.key", "_raw.value"]
+RAW_BLOB_COL = "_raw_json"
+RAW_COLUMNS = {
+    RAW_FULL: RAW_NESTED_COLS,
+    RAW_UNCOVERED: RAW_NESTED_COLS,
+    RAW_BLOB: [RAW_BLOB_COL],
+    RAW_OFF: [],
+}
+# 接在上一列后面的 DDL 片段（自带前导逗号，off 时为空）
+_NESTED_DDL = """,
+        _raw Nested (
+            key String,
+            value String
+        )"""
+RAW_DDL = {
+    RAW_FULL: _NESTED_DDL,
+    RAW_UNCOVERED: _NESTED_DDL,
+    RAW_BLOB: f",\n        {RAW_BLOB_COL} String CODEC(ZSTD(3))",
+    RAW_OFF: "",
+}
+# 类型列已经覆盖的字段，uncovered 模式下不再重复存
+COVERED_KEYS = frozenset(USER_COLS)
+
+INT_FIELDS = [
+    "id", "comments_count", "followers_count", "followings_count", "groups_count",
+    "likes_count", "playlist_likes_count", "playlist_count", "track_count",
+]
+DATETIME_FIELDS = ["created_at", "last_modified"]
+# 以 JSON 字符串存储的嵌套字段及其缺省值
+JSON_FIELDS = {"creator_subscription": {}, "visuals": {}, "badges": {}}
+JSON_ARRAY_FIELDS = {"creator_subscriptions": []}
+NULLABLE_FIELDS = {"reposts_count": 0}
+FLAG_FIELDS = ["verified"]
+
+EPOCH = datetime(1970, 1, 1)
+# SoundCloud 固定返回 "2024-05-01T12:34:56Z"
+ISO_Z_LEN = 20
+
+
+# --- TYPE HELPERS ---
+def parse_user_datetime(val):
+    """ISO strings become UTC-aware datetimes; anything unparsable becomes the epoch."""
+    if not val:
+        return EPOCH
+    if type(val) is str and len(val) == ISO_Z_LEN and val[10] == "T" and val[19] == "Z":
+        try:
+            return datetime.fromisoformat(val[:19]).replace(tzinfo=timezone.utc)
+        except ValueError:
+            pass
+    try:
+        return datetime.fromisoformat(val.replace("Z", "+00:00"))
+    except Exception:
+        pass
+    try:
+        return date_parser.parse(val)
+    except Exception as e:
+        logger.warning("Failed to parse datetime '%s': %s, using epoch.", val, e, extra={"log_key": "datetime"})
+        return EPOCH
+
+
+def to_int(val):
+    if type(val) is int:
+        return val
+    try:
+        return int(val)
+    except Exception:
+        return 0
+
+
+def to_str(val):
+    # 嵌套对象不是字符串列的合法取值，列表按 JSON 存
+    if type(val) is str:
+        return val
+    if val is None or type(val) is dict:
+        return ""
+    if type(val) is list:
+        return fastjson.dumps(val)
+    return str(val)
+
+
+def to_json(val):
+    try:
+        return fastjson.dumps(val)
+    except Exception:
+        return ""
+
+
+def _build_column_plan():
+    plan = []
+    for col in USER_COLS:
+        if col in INT_FIELDS:
+            plan.append((col, "int", None))
+        elif col in DATETIME_FIELDS:
+            plan.append((col, "datetime", None))
+        elif col in JSON_FIELDS:
+            plan.append((col, "json", JSON_FIELDS[col]))
+        elif col in JSON_ARRAY_FIELDS:
+            plan.append((col, "json_array", JSON_ARRAY_FIELDS[col]))
+        elif col in NULLABLE_FIELDS:
+            plan.append((col, "nullable", NULLABLE_FIELDS[col]))
+        elif col in FLAG_FIELDS:
+            plan.append((col, "flag", None))
+        else:
+            plan.append((col, "string", None))
+    return plan
+
+
+# 每列的转换方式只算一次，所有表共用
+COLUMN_PLAN = _build_column_plan()
+
+
+class UserRowEncoder:
+    """
+    Columnar encoder for SoundCloud user records.
+
+    Built once per table: ``extra_cols`` are per-call constant columns
+    (e.g. ``query_keyword``) placed between the user columns and ``_raw``.
+    ``encode`` returns one list per ``column_names`` entry, ready for a
+    ``column_oriented`` insert, reading each field straight from the
+    record instead of flattening it first.
+
+    ``raw_mode`` (see ``USER_RAW_MODE``) picks how the original record is
+    kept: every field as a JSON value in the ``_raw`` Nested column
+    (``full``), only the fields no typed column covers (``uncovered``), the
+    whole record as one ZSTD-compressed ``_raw_json`` string (``blob``), or
+    not at all (``off``).
+    """
+
+    def __init__(self, extra_cols=(), raw_mode=USER_RAW_MODE):
+        if raw_mode not in RAW_MODES:
+            raise ValueError(f"Unknown _raw mode {raw_mode!r}, expected one of {RAW_MODES}")
+        self.extra_cols = list(extra_cols)
+        self.raw_mode = raw_mode
+        self.column_names = USER_COLS + self.extra_cols + RAW_COLUMNS[raw_mode]
+
+    @property
+    def raw_ddl(self):
+        """DDL for the ``_raw`` column(s), to append after the last regular column."""
+        return RAW_DDL[self.raw_mode]
+
+    @property
+    def page_schema(self):
+        """``fastjson`` page schema: without ``_raw`` only the typed fields need decoding."""
+        return USERS if self.raw_mode == RAW_OFF else RAW
+
+    def encode(self, records, **extra):
+        missing = set(self.extra_cols) - set(extra)
+        if missing:
+            raise ValueError(f"Missing values for columns {sorted(missing)}")
+        started = time.perf_counter()
+        n = len(records)
+        columns = []
+        for col, kind, default in COLUMN_PLAN:
+            if kind == "int":
+                values = [to_int(r.get(col)) for r in records]
+            elif kind == "string":
+                values = [to_str(r.get(col)) for r in records]
+            elif kind == "datetime":
+                values = [parse_user_datetime(r.get(col)) for r in records]
+            elif kind == "json":
+                values = [to_json(r.get(col, default)) for r in records]
+            elif kind == "json_array":
+                values = [[to_json(r.get(col, default))] for r in records]
+            elif kind == "nullable":
+                values = [r.get(col, default) for r in records]
+            else:
+                values = [1 if r.get(col) else 0 for r in records]
+            columns.append(values)
+        for col in self.extra_cols:
+            columns.append([extra[col]] * n)
+        mode = self.raw_mode
+        if mode == RAW_FULL:
+            columns.append([list(r.keys()) for r in records])
+            columns.append([[to_json(v) for v in r.values()] for r in records])
+        elif mode == RAW_UNCOVERED:
+            rest = [[(k, v) for k, v in r.items() if k not in COVERED_KEYS] for r in records]
+            columns.append([[k for k, _ in items] for items in rest])
+            columns.append([[to_json(v) for _, v in items] for items in rest])
+        elif mode == RAW_BLOB:
+            columns.append([to_json(r) for r in records])
+        TRANSFORM_SECONDS.observe(time.perf_counter() - started, "users")
+        return columns
+
+    def insert(self, client, table, records, **extra):
+        """Encode ``records`` and insert them; returns the number of rows written (0 on failure)."""
+        if not records:
+            return 0
+        columns = self.encode(records, **extra)
+        started = time.perf_counter()
+        INSERT_ROWS.observe(len(records), table)
+        try:
+            client.insert(table, columns, column_names=self.column_names, column_oriented=True)
+        except Exception as e:
+            ROWS_WRITTEN.inc(len(records), table, "lost")
+            logger.error(f"ClickHouse insert into {table} failed, {len(records)} rows lost: {e}")
+            return 0
+        INSERT_SECONDS.observe(time.perf_counter() - started, table)
+        ROWS_WRITTEN.inc(len(records), table, "ok")
+        return len(records)
+
+
+# --- MIGRATION ---
+def _covered_list():
+    return ", ".join(f"'{k}'" for k in USER_COLS)
+
+
+def migrate_raw_column(client, table, mode, drop_nested=False):
+    """
+    Convert an existing user table (created with the ``full`` Nested
+    ``_raw``) to ``mode`` in place, with synchronous ALTER mutations.
+
+    * ``uncovered``: filters covered keys out of ``_raw.key``/``_raw.value``.
+    * ``blob``: adds ``_raw_json`` and fills it from the Nested arrays (the
+      values already are JSON); the Nested column is only dropped with
+      ``drop_nested=True``, so it can be checked first.
+    * ``off``: drops the Nested column.
+
+    Mutations rewrite every part of the table; run it off-peak, with the
+    crawlers writing this table stopped.
+    """
+    if mode not in RAW_MODES:
+        raise ValueError(f"Unknown _raw mode {mode!r}, expected one of {RAW_MODES}")
+    settings = {"mutations_sync": 2}
+    if mode == RAW_UNCOVERED:
+        covered = _covered_list()
+        client.command(
+            f"ALTER TABLE {table} UPDATE "
+            f"`_raw.value` = arrayFilter((v, k) -> k NOT IN ({covered}), `_raw.value`, `_raw.key`), "
+            f"`_raw.key` = arrayFilter(k -> k NOT IN ({covered}), `_raw.key`) WHERE 1",
+            settings=settings)
+    elif mode == RAW_BLOB:
+        client.command(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {RAW_BLOB_COL} String CODEC(ZSTD(3))")
+        client.command(
+            f"ALTER TABLE {table} UPDATE {RAW_BLOB_COL} = concat('{{', arrayStringConcat("
+            f"arrayMap((k, v) -> concat(toJSONString(k), ':', v), `_raw.key`, `_raw.value`), ','), '}}') "
+            f"WHERE {RAW_BLOB_COL} = ''",
+            settings=settings)
+    if mode == RAW_OFF or (mode == RAW_BLOB and drop_nested):
+        client.command(f"ALTER TABLE {table} DROP COLUMN IF EXISTS `_raw.key`, DROP COLUMN IF EXISTS `_raw.value`",
+                       settings=settings)
+    logger.info(f"Migrated {table} to _raw mode {mode}")
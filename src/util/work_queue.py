@@ -0,0 +1,291 @@
+import asyncio
+import itertools
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from src.util.logger import logger
+
+# 租约时长（秒）：超过这个时间没有心跳，批次会被重新放回队列
+LEASE_SECONDS = 300
+HEARTBEAT_INTERVAL = 60
+# 一个批次最多被租出多少次，超过后进入 dead 列表等人工处理
+MAX_ATTEMPTS = 5
+# pending 少于该数量时补充新批次，每次最多补 FILL_BATCHES 个
+LOW_WATERMARK = 8
+FILL_BATCHES = 32
+PRODUCER_LOCK_SECONDS = 60
+IDLE_SLEEP = 5
+
+# KEYS = pending, leases, items, owners, attempts, dead
+# ARGV = now, lease_seconds, token, max_attempts
+# 先把过期租约放回 pending 头部，再取出一个批次并登记租约
+_LEASE_LUA = """
+local now = tonumber(ARGV[1])
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)
+for _, id in ipairs(expired) do
+  redis.call('ZREM', KEYS[2], id)
+  redis.call('HDEL', KEYS[4], id)
+  if tonumber(redis.call('HGET', KEYS[5], id) or '0') >= tonumber(ARGV[4]) then
+    redis.call('RPUSH', KEYS[6], id)
+  else
+    redis.call('RPUSH', KEYS[1], id)
+  end
+end
+local id = redis.call('RPOP', KEYS[1])
+if not id then return false end
+redis.call('ZADD', KEYS[2], now + tonumber(ARGV[2]), id)
+redis.call('HSET', KEYS[4], id, ARGV[3])
+local attempt = redis.call('HINCRBY', KEYS[5], id, 1)
+return {id, redis.call('HGET', KEYS[3], id), attempt}
+"""
+
+# KEYS = leases, owners; ARGV = id, token, expires_at
+_HEARTBEAT_LUA = """
+if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then return 0 end
+redis.call('ZADD', KEYS[1], 'XX', tonumber(ARGV[3]), ARGV[1])
+return 1
+"""
+
+# KEYS = leases, items, owners, attempts, pending; ARGV = id, token, requeue (0|1)
+# 只有当前租约持有者才能确认或退回，过期后被别人重新租走的批次不受影响
+_FINISH_LUA = """
+if redis.call('HGET', KEYS[3], ARGV[1]) ~= ARGV[2] then return 0 end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+if ARGV[3] == '1' then
+  redis.call('RPUSH', KEYS[5], ARGV[1])
+else
+  redis.call('HDEL', KEYS[2], ARGV[1])
+  redis.call('HDEL', KEYS[4], ARGV[1])
+end
+return 1
+"""
+
+
+class Lease:
+    def __init__(self, batch_id, user_ids, token, attempt):
+        self.batch_id = batch_id
+        self.user_ids = user_ids
+        self.token = token
+        self.attempt = attempt
+        self.lost = False
+
+    def __repr__(self):
+        return f"Lease({self.batch_id}, {len(self.user_ids)} ids, attempt {self.attempt})"
+
+
+class WorkQueue:
+    """
+    Lease-based batch queue in Redis shared by every crawler host.
+
+    One producer at a time (guarded by a Redis lock) cuts the seed id range
+    into batches with a ``SeedIterator`` and pushes them to ``{name}:pending``;
+    the iterator's cursor only records what has been *enqueued*. Workers
+    ``lease()`` a batch for ``lease_seconds``, keep it alive with heartbeats
+    and ``ack`` it when done. Leases that expire (crashed or stuck worker) go
+    back to the head of the queue on the next ``lease()`` call; a batch
+    leased ``max_attempts`` times is parked in ``{name}:dead``.
+
+    Timestamps come from the caller's clock, so hosts need NTP-level sync
+    (leases are minutes long).
+    """
+
+    def __init__(self, redis_client, name, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.redis_client = redis_client
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.pending_key = f"{name}:pending"
+        self.leases_key = f"{name}:leases"
+        self.items_key = f"{name}:items"
+        self.owners_key = f"{name}:owners"
+        self.attempts_key = f"{name}:attempts"
+        self.dead_key = f"{name}:dead"
+        self.exhausted_key = f"{name}:exhausted"
+        self.producer_key = f"{name}:producer"
+        self._lease = redis_client.register_script(_LEASE_LUA)
+        self._heartbeat = redis_client.register_script(_HEARTBEAT_LUA)
+        self._finish = redis_client.register_script(_FINISH_LUA)
+
+    # --- producer ---
+    def enqueue(self, user_ids):
+        """Push one batch; returns its id (``first-last``)."""
+        batch_id = f"{user_ids[0]}-{user_ids[-1]}"
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.hset(self.items_key, batch_id, json.dumps(user_ids))
+        pipe.lpush(self.pending_key, batch_id)
+        pipe.execute()
+        return batch_id
+
+    def fill(self, seeds, low_watermark=LOW_WATERMARK, max_batches=FILL_BATCHES):
+        """
+        Top the queue up from ``seeds`` (a ``SeedIterator``) when it runs low.
+        Only the host holding the producer lock does any work. Returns the
+        number of batches added. The queue is marked exhausted only when
+        ``seeds`` reached the end of its range, not when ClickHouse failed.
+        """
+        if self.is_exhausted(seeds) or self.redis_client.llen(self.pending_key) >= low_watermark:
+            return 0
+        token = uuid.uuid4().hex
+        if not self.redis_client.set(self.producer_key, token, nx=True, ex=PRODUCER_LOCK_SECONDS):
+            return 0
+        added = 0
+        try:
+            for user_ids in itertools.islice(seeds.batches(), max_batches):
+                self.enqueue(user_ids)
+                seeds.commit(user_ids[-1])
+                added += 1
+            if added < max_batches:
+                if seeds.exhausted:
+                    self.redis_client.set(self.exhausted_key, seeds.range_marker())
+                    logger.info(f"Work queue {self.name}: seed range exhausted")
+                elif not added:
+                    logger.warning(f"Work queue {self.name}: no seeds read, will retry")
+        finally:
+            if self.redis_client.get(self.producer_key) in (token, token.encode()):
+                self.redis_client.delete(self.producer_key)
+        if added:
+            logger.info(f"Work queue {self.name}: enqueued {added} batches")
+        return added
+
+    def is_exhausted(self, seeds=None):
+        """
+        True once the producer has enqueued the whole seed range. With
+        ``seeds``, a flag set for another cursor position or range (the
+        cursor was reset, the bounds changed) is cleared instead.
+        """
+        marker = self.redis_client.get(self.exhausted_key)
+        if marker is None:
+            return False
+        if seeds is None:
+            return True
+        if isinstance(marker, bytes):
+            marker = marker.decode()
+        if marker != seeds.range_marker():
+            self.redis_client.delete(self.exhausted_key)
+            logger.info(f"Work queue {self.name}: seed cursor or range changed, filling again")
+            return False
+        return True
+
+    def reset_exhausted(self):
+        """Let ``fill`` run again, e.g. after new seeds were loaded."""
+        self.redis_client.delete(self.exhausted_key)
+
+    def clear(self):
+        """Drop every batch, lease and flag of this queue."""
+        self.redis_client.delete(self.pending_key, self.leases_key, self.items_key, self.owners_key,
+                                 self.attempts_key, self.dead_key, self.exhausted_key, self.producer_key)
+
+    # --- worker ---
+    def lease(self):
+        """Take the next batch, or None if nothing is pending right now."""
+        token = uuid.uuid4().hex
+        res = self._lease(keys=[self.pending_key, self.leases_key, self.items_key, self.owners_key,
+                                self.attempts_key, self.dead_key],
+                          args=[time.time(), self.lease_seconds, token, self.max_attempts])
+        if not res:
+            return None
+        batch_id, payload, attempt = res
+        if isinstance(batch_id, bytes):
+            batch_id = batch_id.decode()
+        if payload is None:
+            logger.error(f"Work queue {self.name}: batch {batch_id} has no payload, dropping")
+            self._finish_lease(batch_id, token, requeue=False)
+            return self.lease()
+        return Lease(batch_id, json.loads(payload), token, int(attempt))
+
+    def heartbeat(self, lease):
+        """Extend ``lease``; returns False (and marks it lost) if it already expired and was requeued."""
+        ok = self._heartbeat(keys=[self.leases_key, self.owners_key],
+                             args=[lease.batch_id, lease.token, time.time() + self.lease_seconds])
+        if not ok:
+            lease.lost = True
+        return bool(ok)
+
+    def _finish_lease(self, batch_id, token, requeue, target=None):
+        return bool(self._finish(keys=[self.leases_key, self.items_key, self.owners_key,
+                                       self.attempts_key, target or self.pending_key],
+                                 args=[batch_id, token, 1 if requeue else 0]))
+
+    def ack(self, lease):
+        if not self._finish_lease(lease.batch_id, lease.token, requeue=False):
+            logger.warning(f"Work queue {self.name}: {lease} expired before ack, it may be crawled twice")
+            return False
+        return True
+
+    def release(self, lease):
+        """Give a batch back without finishing it (shutdown, error)."""
+        return self._finish_lease(lease.batch_id, lease.token, requeue=True)
+
+    def bury(self, lease):
+        """Park a batch that keeps failing in ``{name}:dead`` instead of retrying it."""
+        return self._finish_lease(lease.batch_id, lease.token, requeue=True, target=self.dead_key)
+
+    def drained(self, seeds=None):
+        """True when the producer is done and no batch is pending or leased."""
+        if not self.is_exhausted(seeds):
+            return False
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.llen(self.pending_key)
+        pipe.zcard(self.leases_key)
+        pending, leased = pipe.execute()
+        return pending == 0 and leased == 0
+
+    def stats(self):
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.llen(self.pending_key)
+        pipe.zcard(self.leases_key)
+        pipe.llen(self.dead_key)
+        pending, leased, dead = pipe.execute()
+        return {"pending": pending, "leased": leased, "dead": dead}
+
+    def keep_alive(self, lease, interval=HEARTBEAT_INTERVAL):
+        """Start heartbeating ``lease`` every ``interval`` seconds; cancel the returned task to stop."""
+        async def beat():
+            while True:
+                await asyncio.sleep(interval)
+                if not await asyncio.to_thread(self.heartbeat, lease):
+                    logger.warning(f"Work queue {self.name}: lost {lease}")
+                    return
+        return asyncio.create_task(beat())
+
+    @asynccontextmanager
+    async def holding(self, lease, interval=HEARTBEAT_INTERVAL):
+        """
+        Heartbeat ``lease`` in the background while the body runs; ack it on
+        success, release it back to the queue if the body raises. A lease
+        that was lost meanwhile belongs to another host and is left alone.
+        """
+        task = self.keep_alive(lease, interval)
+        try:
+            yield lease
+        except BaseException:
+            if not lease.lost:
+                self.release(lease)
+            raise
+        else:
+            if lease.lost:
+                logger.warning(f"Work queue {self.name}: {lease} was lost, not acking it")
+            else:
+                self.ack(lease)
+        finally:
+            task.cancel()
+
+    async def leases(self, seeds, idle_sleep=None):
+        """
+        Yield leases until the whole seed range is done, filling the queue
+        from ``seeds`` as needed. Waits while other hosts still hold leases
+        that could expire and come back. The Redis and ClickHouse calls run
+        in a thread so the event loop keeps serving the workers.
+        """
+        while True:
+            await asyncio.to_thread(self.fill, seeds)
+            lease = await asyncio.to_thread(self.lease)
+            if lease is not None:
+                yield lease
+                continue
+            if await asyncio.to_thread(self.drained, seeds):
+                return
+            await asyncio.sleep(IDLE_SLEEP if idle_sleep is None else idle_sleep)
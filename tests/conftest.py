@@ -0,0 +1,4 @@
+from src.bench import standins
+
+# 爬虫模块导入时就会连接 ClickHouse 和 Redis；测试里换成进程内的替身
+standins.install([])
@@ -0,0 +1,15 @@
+import fakeredis
+
+from src.util.checkpoint import CheckpointStore
+
+
+def test_pending_skips_done_users_before_and_after_flush():
+    checkpoint = CheckpointStore(fakeredis.FakeRedis(), "test:checkpoint")
+    checkpoint.save_page(3, "https://api/next")
+    checkpoint.mark_done(2)
+    # 退回的批次在同一进程里重新租到：缓冲中已完成的用户不再抓
+    assert checkpoint.pending([1, 2, 3]) == [1, 3]
+
+    checkpoint.flush()
+    assert checkpoint.pending([1, 2, 3]) == [1, 3]
+    assert checkpoint.resumable([1, 2, 3]) == [3]
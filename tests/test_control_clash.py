@@ -0,0 +1,136 @@
+import random
+from collections import Counter
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import fakeredis
+import pytest
+import requests
+
+from src.util import control_clash
+from src.util.control_clash import ERROR_COUNTER_KEY, ERROR_COUNTER_TTL, NodeScheduler, report_crawler_error
+
+CONTROLLER = "http://clash.local:9090"
+GROUP = "SoundCloud"
+GOOD, BAD, SLOW = "good", "bad", "slow"
+
+
+class Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.body = body or {}
+
+    def json(self):
+        return self.body
+
+
+class StubClash:
+    """Clash controller: ``/proxies/{name}/delay`` per node, ``PUT /proxies/{group}`` to switch."""
+
+    def __init__(self, delays):
+        # node -> delay in ms, or None for a node whose probe times out
+        self.delays = delays
+        self.probes = Counter()
+        self.switches = []
+        self.secrets = set()
+        self.hung = False
+
+    def get(self, url, timeout=None):
+        parts = urlsplit(url)
+        self.secrets.update(parse_qs(parts.query).get("secret", []))
+        _, proxies, name, action = parts.path.split("/")
+        assert (proxies, action) == ("proxies", "delay")
+        node = unquote(name)
+        self.probes[node] += 1
+        delay = self.delays[node]
+        if delay is None:
+            return Response(504, {"message": "Timeout"})
+        return Response(200, {"delay": delay})
+
+    def put(self, url, json=None, timeout=None):
+        assert timeout
+        if self.hung:
+            raise requests.Timeout(f"Read timed out. (read timeout={timeout})")
+        parts = urlsplit(url)
+        assert unquote(parts.path) == f"/proxies/{GROUP}"
+        self.switches.append(json["name"])
+        return Response(204)
+
+
+def create_scheduler(delays, policy="thompson", redis_client=None):
+    stub = StubClash(delays)
+    scheduler = NodeScheduler(list(delays), CONTROLLER, secret="s3cret", group=GROUP, policy=policy, http=stub,
+                              redis_client=redis_client, rng=random.Random(7))
+    return scheduler, stub
+
+
+@pytest.mark.parametrize("policy", ["thompson", "ucb"])
+def test_failing_node_loses_selection_share(policy):
+    scheduler, stub = create_scheduler({GOOD: 120, BAD: None, SLOW: 2500}, policy)
+    rounds = 60
+    for _ in range(rounds):
+        scheduler.step()
+
+    # 节点名按 URL 编码后探测，带上 secret；三个节点每轮都会被探测
+    assert stub.secrets == {"s3cret"}
+    assert set(stub.probes) == {GOOD, BAD, SLOW}
+    assert stub.switches[-1] == scheduler.current == GOOD
+    share = Counter(stub.switches[10:])
+    assert share[BAD] == 0
+    assert share[GOOD] / (rounds - 10) > 0.9
+    assert scheduler.stats[BAD].success < 0.01
+    assert scheduler.stats[GOOD].reward() > scheduler.stats[SLOW].reward()
+
+
+def test_node_that_starts_failing_is_dropped():
+    scheduler, stub = create_scheduler({GOOD: 300, BAD: 100})
+    for _ in range(20):
+        scheduler.step()
+    assert scheduler.current == BAD
+
+    stub.delays[BAD] = None
+    for _ in range(20):
+        scheduler.step()
+    assert scheduler.current == GOOD
+    assert Counter(stub.switches[-10:])[BAD] == 0
+
+
+def test_crawler_errors_penalize_current_node_and_are_consumed(monkeypatch):
+    redis_client = fakeredis.FakeRedis()
+    scheduler, stub = create_scheduler({GOOD: 100, BAD: 100}, redis_client=redis_client)
+    monkeypatch.setattr(control_clash, "ERROR_SPIKE_THRESHOLD", 5)
+    scheduler.switch(BAD)
+    success = scheduler.stats[BAD].success
+
+    for _ in range(3):
+        report_crawler_error(redis_client)
+    assert not scheduler.check_errors()
+    assert int(redis_client.get(ERROR_COUNTER_KEY)) == 0
+
+    report_crawler_error(redis_client, 6)
+    assert scheduler.check_errors()
+    assert scheduler.stats[BAD].success < success
+    assert int(redis_client.get(ERROR_COUNTER_KEY)) == 0
+    # 已经计过的错误不会在下一次检查里再触发切换
+    assert not scheduler.check_errors()
+
+
+def test_error_spike_without_redis():
+    scheduler, _ = create_scheduler({GOOD: 100})
+    scheduler.switch(GOOD)
+    assert scheduler.error_spike() == 0
+    assert not scheduler.check_errors()
+
+
+def test_error_counter_expires_while_nobody_consumes_it():
+    redis_client = fakeredis.FakeRedis()
+    report_crawler_error(redis_client, 3)
+    assert 0 < redis_client.ttl(ERROR_COUNTER_KEY) <= ERROR_COUNTER_TTL
+
+
+def test_hung_controller_does_not_stall_the_scheduler():
+    scheduler, stub = create_scheduler({GOOD: 100, BAD: 200})
+    scheduler.switch(GOOD)
+    stub.hung = True
+    scheduler.switch(BAD)
+    assert scheduler.current == GOOD
+    assert stub.switches == [GOOD]
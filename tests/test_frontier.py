@@ -0,0 +1,45 @@
+import fakeredis
+
+from src.util.frontier import Frontier
+from src.util.shard import Shard
+
+PREFIX = "test:snowball"
+
+
+def create_frontier(redis_client, shard, **kwargs):
+    return Frontier(redis_client, PREFIX, max_local=4, spill_chunk=2, suffix=shard.suffix, **kwargs)
+
+
+def drain(frontier):
+    out = []
+    while (item := frontier.pop()) is not None:
+        out.append(item[0])
+    return out
+
+
+def test_shards_refill_only_what_they_spilled():
+    redis_client = fakeredis.FakeRedis()
+    a = create_frontier(redis_client, Shard(0, 2))
+    b = create_frontier(redis_client, Shard(1, 2))
+
+    assert len(a.push_new(((uid, uid) for uid in range(1, 11)), 1)) == 10
+    # 共享 seen-set：别的分片已经排过的用户不再排
+    assert b.push_new(((uid, uid) for uid in range(5, 17)), 1) == [11, 12, 13, 14, 15, 16]
+    assert a.spilled and b.spilled
+
+    assert sorted(drain(a)) == list(range(1, 11))
+    assert sorted(drain(b)) == [11, 12, 13, 14, 15, 16]
+    assert redis_client.zcard(a.spill_key) == redis_client.zcard(b.spill_key) == 0
+
+
+def test_persisted_frontier_is_adopted_by_its_shards():
+    redis_client = fakeredis.FakeRedis()
+    legacy = create_frontier(redis_client, Shard())
+    legacy.push_new(((uid, 0) for uid in range(1, 9)), 1)
+    legacy.persist()
+
+    shards = [create_frontier(redis_client, Shard(i, 2)) for i in range(2)]
+    assert [f.adopt(legacy.spill_key, Shard(i, 2).owns) for i, f in enumerate(shards)] == [4, 4]
+    assert redis_client.zcard(legacy.spill_key) == 0
+    assert sorted(drain(shards[0])) == [2, 4, 6, 8]
+    assert sorted(drain(shards[1])) == [1, 3, 5, 7]
@@ -0,0 +1,175 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from src.crawler import soundcloud_track_crawler as track_crawler
+from src.util import work_queue
+from src.util.checkpoint import CheckpointStore
+from src.util.pipeline import LeasePipeline
+from src.util.work_queue import WorkQueue
+
+LEASE_SECONDS = 300
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class Seeds:
+    """Seed iterator over a fixed list of batches."""
+
+    def __init__(self, batches):
+        self.remaining = list(batches)
+        self.exhausted = False
+
+    def batches(self):
+        while self.remaining:
+            yield self.remaining.pop(0)
+        self.exhausted = True
+
+    def commit(self, last_id):
+        pass
+
+    def range_marker(self):
+        return str(len(self.remaining))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(work_queue, "time", clock)
+    monkeypatch.setattr(work_queue, "IDLE_SLEEP", 0.01)
+    return clock
+
+
+@pytest.fixture
+def queue(clock):
+    queue = WorkQueue(fakeredis.FakeRedis(), "test:queue", lease_seconds=LEASE_SECONDS, max_attempts=3)
+    acks = []
+    ack = queue.ack
+    queue.ack = lambda lease: acks.append(lease.token) or ack(lease)
+    queue.acks = acks
+    return queue
+
+
+class Response:
+    def __init__(self, status, body=b'{"collection": []}'):
+        self.status = status
+        self.body = body
+        self.headers = {}
+
+    async def read(self):
+        return self.body
+
+    async def text(self):
+        return self.body.decode()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+
+class TracksApi:
+    """``/users/{id}/tracks``: an empty listing, or ``status`` for the ids in ``errors``."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.requests = []
+
+    def get(self, url, headers=None, proxy=None):
+        user_id = int(url.split("/users/")[1].split("/")[0])
+        self.requests.append(user_id)
+        return Response(self.errors.get(user_id, 200))
+
+
+class Writer:
+    async def put(self, data):
+        pass
+
+    async def sync(self):
+        return True
+
+
+def run(pipeline, handle, workers=2):
+    asyncio.run(asyncio.wait_for(pipeline.run(handle, workers), timeout=10))
+
+
+def test_failed_user_releases_the_batch_until_it_succeeds(queue):
+    completed = []
+    failures = {2: 1}
+
+    async def handle(user_id, arg):
+        if failures.get(user_id):
+            failures[user_id] -= 1
+            raise RuntimeError("fetch failed after retries")
+
+    async def on_complete(batch):
+        completed.append((batch.lease.batch_id, batch.lease.attempt))
+
+    pipeline = LeasePipeline(queue, Seeds([[1, 2], [3, 4]]), on_complete=on_complete)
+    run(pipeline, handle)
+
+    assert sorted(completed) == [("1-2", 2), ("3-4", 1)]
+    assert len(queue.acks) == 2
+    assert pipeline.batches_done == 2
+    assert queue.stats() == {"pending": 0, "leased": 0, "dead": 0}
+
+
+def test_batch_that_keeps_failing_is_buried(queue):
+    async def handle(user_id, arg):
+        raise RuntimeError("always fails")
+
+    pipeline = LeasePipeline(queue, Seeds([[1, 2]]))
+    run(pipeline, handle)
+
+    assert queue.acks == []
+    assert queue.stats() == {"pending": 0, "leased": 0, "dead": 1}
+
+
+def test_lost_lease_is_not_completed_or_acked(queue, clock):
+    completed = []
+    other = {}
+
+    async def handle(user_id, arg):
+        # 处理期间租约过期，被另一台主机收回并租走
+        clock.now += LEASE_SECONDS + 1
+        other["lease"] = queue.lease()
+        asyncio.get_running_loop().call_later(0.05, queue.ack, other["lease"])
+
+    async def on_complete(batch):
+        completed.append(batch.lease.batch_id)
+
+    pipeline = LeasePipeline(queue, Seeds([[1]]), on_complete=on_complete)
+    run(pipeline, handle, workers=1)
+
+    assert completed == []
+    assert pipeline.batches_done == 0
+    # 只有新的持有者确认了批次
+    assert queue.acks == [other["lease"].token]
+    assert queue.stats() == {"pending": 0, "leased": 0, "dead": 0}
+
+
+def test_deleted_user_does_not_fail_its_batch(queue):
+    session = TracksApi({2: 404})
+    checkpoint = CheckpointStore(fakeredis.FakeRedis(), "test:checkpoint")
+
+    async def handle(user_id, stop_before):
+        await track_crawler.fetch_and_store_tracks_for_user(session, Writer(), user_id, checkpoint, stop_before)
+
+    pipeline = LeasePipeline(queue, Seeds([[1, 2, 3]]))
+    run(pipeline, handle)
+
+    # 404 不重试，用户记为完成，批次照常确认
+    assert sorted(session.requests) == [1, 2, 3]
+    assert len(queue.acks) == 1
+    assert queue.stats() == {"pending": 0, "leased": 0, "dead": 0}
+    checkpoint.flush()
+    assert checkpoint.pending([1, 2, 3]) == []
+    assert checkpoint.resume(2) is None
@@ -0,0 +1,53 @@
+import pytest
+
+from src.util import response_cache
+from src.util.response_cache import ResponseCache
+
+URL = "https://api-v2.soundcloud.com/users/1/tracks?limit=100&client_id=abc"
+BODY = b'{"collection": []}'
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache, "time", clock)
+    return clock
+
+
+def create_cache(tmp_path, mode="readwrite"):
+    return ResponseCache(str(tmp_path / "responses.db"), 10 * 1024 * 1024, mode=mode)
+
+
+def test_expired_row_is_a_miss_but_kept(tmp_path, clock):
+    cache = create_cache(tmp_path)
+    cache.put(URL, BODY)
+    assert cache.get(URL) == BODY
+
+    clock.now += response_cache.ENDPOINT_TTLS["tracks"] + 1
+    assert cache.get(URL) is None
+    assert cache.conn.execute("SELECT count(*) FROM responses").fetchone()[0] == 1
+    cache.close()
+
+
+def test_offline_replay_serves_expired_rows(tmp_path, clock):
+    cache = create_cache(tmp_path)
+    cache.put(URL, BODY)
+    cache.close()
+
+    # 一天后离线回放前一天的抓取
+    clock.now += response_cache.ENDPOINT_TTLS["tracks"] + 3600
+    offline = create_cache(tmp_path, mode="offline")
+    assert offline.get(URL) == BODY
+    assert offline.get(URL.replace("abc", "other")) == BODY
+    assert offline.conn.execute("SELECT count(*) FROM responses").fetchone()[0] == 1
+    offline.put(URL.replace("/1/", "/2/"), BODY)
+    assert offline.get(URL.replace("/1/", "/2/")) is None
+    offline.close()
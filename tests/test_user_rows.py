@@ -0,0 +1,163 @@
+import json
+import os
+import uuid
+
+import pytest
+
+from src.bench.fixtures import synthetic_pages
+from src.bench.user_rows_bench import EDGE_CASES, legacy_row
+from src.util.user_rows import (COVERED_KEYS, RAW_BLOB, RAW_BLOB_COL, RAW_COLUMNS, RAW_FULL, RAW_MODES,
+                                RAW_NESTED_COLS, RAW_OFF, RAW_UNCOVERED, USER_COLS, UserRowEncoder,
+                                migrate_raw_column)
+
+N_TYPED = len(USER_COLS)
+
+
+def records():
+    pages = synthetic_pages("users", pages=3, page_size=50)
+    return [r for page in pages for r in page["collection"]] + EDGE_CASES
+
+
+def normalize(value):
+    # 编码器输出紧凑 JSON，旧实现是 json.dumps 的默认格式，比较解析后的值
+    if isinstance(value, list):
+        return [normalize(v) for v in value]
+    if isinstance(value, str) and value[:1] in ("{", "[", '"'):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def rows(encoder, recs, **extra):
+    return [list(r) for r in zip(*encoder.encode(recs, **extra))]
+
+
+def expected_raw(mode, legacy, rec):
+    keys, values = legacy[N_TYPED], legacy[N_TYPED + 1]
+    if mode == RAW_FULL:
+        return [keys, values]
+    if mode == RAW_UNCOVERED:
+        kept = [(k, v) for k, v in zip(keys, values) if k not in COVERED_KEYS]
+        return [[k for k, _ in kept], [v for _, v in kept]]
+    if mode == RAW_BLOB:
+        return [json.dumps(rec, ensure_ascii=False)]
+    return []
+
+
+@pytest.mark.parametrize("mode", RAW_MODES)
+def test_rows_match_legacy_transform(mode):
+    encoder = UserRowEncoder(raw_mode=mode)
+    recs = records()
+    got = rows(encoder, recs)
+    assert len(got) == len(recs)
+    assert encoder.column_names == USER_COLS + RAW_COLUMNS[mode]
+    for rec, row in zip(recs, got):
+        legacy = legacy_row(rec)
+        expected = legacy[:N_TYPED] + expected_raw(mode, legacy, rec)
+        assert len(row) == len(expected)
+        for col, want, have in zip(encoder.column_names, expected, row):
+            assert normalize(have) == normalize(want), f"{mode} row {rec.get('id')} column {col}"
+
+
+def test_extra_columns_sit_between_user_columns_and_raw():
+    encoder = UserRowEncoder(extra_cols=["query_keyword"], raw_mode=RAW_UNCOVERED)
+    recs = records()[:3]
+    assert encoder.column_names == USER_COLS + ["query_keyword"] + RAW_NESTED_COLS
+    for rec, row in zip(recs, rows(encoder, recs, query_keyword="lofi")):
+        assert row[N_TYPED] == "lofi"
+        assert normalize(row[:N_TYPED]) == normalize(legacy_row(rec)[:N_TYPED])
+    with pytest.raises(ValueError):
+        encoder.encode(recs)
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        UserRowEncoder(raw_mode="gzip")
+    with pytest.raises(ValueError):
+        migrate_raw_column(None, "users", "gzip")
+
+
+# --- migration ---
+# 以下函数逐条对应 migrate_raw_column 里 ALTER ... UPDATE 的表达式，在 Python 里对 full 模式的行求值
+def mutate_uncovered(keys, values):
+    kept = [(k, v) for k, v in zip(keys, values) if k not in COVERED_KEYS]
+    return [k for k, _ in kept], [v for _, v in kept]
+
+
+def mutate_blob(keys, values):
+    return "{" + ",".join(json.dumps(k, ensure_ascii=False) + ":" + v for k, v in zip(keys, values)) + "}"
+
+
+class RecordingClient:
+    def __init__(self):
+        self.commands = []
+
+    def command(self, sql, settings=None):
+        self.commands.append((sql, settings))
+
+
+@pytest.mark.parametrize("mode", [RAW_UNCOVERED, RAW_BLOB])
+def test_migrated_full_rows_match_rows_encoded_in_target_mode(mode):
+    recs = records()
+    full = rows(UserRowEncoder(raw_mode=RAW_FULL), recs)
+    target = rows(UserRowEncoder(raw_mode=mode), recs)
+    for before, after in zip(full, target):
+        keys, values = before[N_TYPED], before[N_TYPED + 1]
+        assert before[:N_TYPED] == after[:N_TYPED]
+        if mode == RAW_UNCOVERED:
+            assert list(mutate_uncovered(keys, values)) == after[N_TYPED:]
+        else:
+            assert json.loads(mutate_blob(keys, values)) == json.loads(after[N_TYPED])
+
+
+@pytest.mark.parametrize("mode, drop_nested, statements", [
+    (RAW_FULL, False, 0),
+    (RAW_UNCOVERED, False, 1),
+    (RAW_BLOB, False, 2),
+    (RAW_BLOB, True, 3),
+    (RAW_OFF, False, 1),
+])
+def test_migration_statements(mode, drop_nested, statements):
+    client = RecordingClient()
+    migrate_raw_column(client, "users", mode, drop_nested=drop_nested)
+    assert len(client.commands) == statements
+    mutations = [sql for sql, settings in client.commands if " UPDATE " in sql or " DROP " in sql]
+    assert all(settings == {"mutations_sync": 2} for sql, settings in client.commands if sql in mutations)
+    if mode == RAW_BLOB:
+        assert f"WHERE {RAW_BLOB_COL} = ''" in client.commands[1][0]
+    dropped = any("DROP COLUMN" in sql for sql, _ in client.commands)
+    assert dropped == (mode == RAW_OFF or drop_nested)
+
+
+# 需要一个可写的 ClickHouse（CLICKHOUSE_TEST_HOST）才会运行：真实地建表、迁移、读回
+@pytest.mark.skipif(not os.getenv("CLICKHOUSE_TEST_HOST"), reason="CLICKHOUSE_TEST_HOST not set")
+@pytest.mark.parametrize("mode", [RAW_UNCOVERED, RAW_BLOB, RAW_OFF])
+def test_migration_round_trip_on_clickhouse(mode, monkeypatch):
+    import clickhouse_connect
+    import src.crawler.soundcloud_user_snowball as snowball
+
+    client = clickhouse_connect.get_client(host=os.getenv("CLICKHOUSE_TEST_HOST"),
+                                           port=int(os.getenv("CLICKHOUSE_TEST_PORT", 8123)),
+                                           username=os.getenv("CLICKHOUSE_TEST_USER", "default"),
+                                           password=os.getenv("CLICKHOUSE_TEST_PASSWORD", ""))
+    name = f"users_migration_{uuid.uuid4().hex[:8]}"
+    table = f"{snowball.CLICKHOUSE_DATABASE}.{name}"
+    full = UserRowEncoder(raw_mode=RAW_FULL)
+    target = UserRowEncoder(raw_mode=mode)
+    recs = [r for r in records() if isinstance(r.get("id"), int)]
+    monkeypatch.setattr(snowball, "clickhouse_client", client)
+    monkeypatch.setattr(snowball, "user_rows", full)
+    try:
+        snowball.create_table(name)
+        full.insert(client, table, recs)
+        migrate_raw_column(client, table, mode, drop_nested=True)
+        columns = ", ".join(f"`{c}`" for c in ["id"] + RAW_COLUMNS[mode])
+        stored = {row[0]: list(row[1:]) for row in client.query(f"SELECT {columns} FROM {table}").result_rows}
+        for rec, row in zip(recs, rows(target, recs)):
+            have = stored[rec["id"]]
+            want = row[N_TYPED:]
+            assert normalize(have) == normalize(want)
+    finally:
+        client.command(f"DROP TABLE IF EXISTS {table}")
@@ -0,0 +1,184 @@
+import asyncio
+from contextlib import contextmanager
+
+import fakeredis
+import pytest
+
+from src.util import work_queue
+from src.util.seed_iterator import SeedIterator
+from src.util.work_queue import WorkQueue
+
+LEASE_SECONDS = 300
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class SeedClickHouse:
+    """Answers the seed window queries from ``ids``; ``fail`` makes the next stream raise before any row."""
+
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        self.fail = False
+
+    @contextmanager
+    def query_row_block_stream(self, sql):
+        if self.fail:
+            raise ConnectionError("ClickHouse went away")
+        after = int(sql.split("id > ")[1].split()[0])
+        limit = int(sql.rsplit("LIMIT ", 1)[1])
+        rows = [(i,) for i in self.ids if i > after][:limit]
+        yield iter([rows])
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(work_queue, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(redis_client, clock):
+    return WorkQueue(redis_client, "test:queue", lease_seconds=LEASE_SECONDS, max_attempts=3)
+
+
+def test_lease_hands_out_batches_in_order(queue, redis_client):
+    queue.enqueue([1, 2, 3])
+    queue.enqueue([4, 5])
+
+    first = queue.lease()
+    second = queue.lease()
+    assert (first.batch_id, first.user_ids, first.attempt) == ("1-3", [1, 2, 3], 1)
+    assert (second.batch_id, second.user_ids) == ("4-5", [4, 5])
+    assert queue.lease() is None
+    assert queue.stats() == {"pending": 0, "leased": 2, "dead": 0}
+    assert redis_client.hget(queue.owners_key, "1-3").decode() == first.token
+
+    assert queue.ack(first)
+    assert not redis_client.hexists(queue.items_key, "1-3")
+    assert not redis_client.hexists(queue.attempts_key, "1-3")
+    assert queue.stats() == {"pending": 0, "leased": 1, "dead": 0}
+
+
+def test_heartbeat_extends_the_lease(queue, redis_client, clock):
+    queue.enqueue([1, 2])
+    lease = queue.lease()
+    assert redis_client.zscore(queue.leases_key, "1-2") == clock.now + LEASE_SECONDS
+
+    clock.now += LEASE_SECONDS - 1
+    assert queue.heartbeat(lease)
+    assert redis_client.zscore(queue.leases_key, "1-2") == clock.now + LEASE_SECONDS
+
+    # 心跳续上后，原来的到期时间过了也不会被收回
+    clock.now += 2
+    assert queue.lease() is None
+    assert queue.ack(lease)
+
+
+def test_expired_lease_is_reclaimed_and_old_holder_is_fenced(queue, clock):
+    queue.enqueue([1, 2])
+    stale = queue.lease()
+
+    clock.now += LEASE_SECONDS + 1
+    fresh = queue.lease()
+    assert fresh.batch_id == stale.batch_id
+    assert fresh.attempt == 2
+    assert fresh.token != stale.token
+
+    # 旧持有者的心跳和确认都不再生效，也不会把别人的租约退回
+    assert not queue.heartbeat(stale)
+    assert stale.lost
+    assert not queue.ack(stale)
+    assert not queue.release(stale)
+    assert queue.stats() == {"pending": 0, "leased": 1, "dead": 0}
+    assert queue.ack(fresh)
+
+
+def test_batch_goes_dead_after_max_attempts(queue, redis_client, clock):
+    queue.enqueue([7])
+    for attempt in range(1, 4):
+        lease = queue.lease()
+        assert lease.attempt == attempt
+        clock.now += LEASE_SECONDS + 1
+
+    assert queue.lease() is None
+    assert queue.stats() == {"pending": 0, "leased": 0, "dead": 1}
+    assert redis_client.lrange(queue.dead_key, 0, -1) == [b"7-7"]
+
+
+def test_release_requeues_at_the_head_and_bury_parks_it(queue, redis_client):
+    queue.enqueue([1])
+    queue.enqueue([2])
+    lease = queue.lease()
+    assert queue.release(lease)
+    again = queue.lease()
+    assert again.batch_id == lease.batch_id
+    assert again.attempt == 2
+
+    assert queue.bury(again)
+    assert redis_client.lrange(queue.dead_key, 0, -1) == [b"1-1"]
+    # 进 dead 的批次保留内容，便于人工处理
+    assert redis_client.hexists(queue.items_key, "1-1")
+    assert queue.lease().batch_id == "2-2"
+
+
+def create_seeds(redis_client, ch_client, **kwargs):
+    return SeedIterator(ch_client, redis_client, "test:cursor", batch_size=2, window_size=4, **kwargs)
+
+
+def test_fill_does_not_mark_exhausted_on_clickhouse_error(queue, redis_client):
+    ch_client = SeedClickHouse(range(1, 6))
+    seeds = create_seeds(redis_client, ch_client)
+    ch_client.fail = True
+    assert queue.fill(seeds) == 0
+    assert not queue.is_exhausted(seeds)
+
+    ch_client.fail = False
+    assert queue.fill(seeds) == 3
+    assert queue.is_exhausted(seeds)
+    assert seeds.get_cursor() == 5
+    assert queue.fill(seeds) == 0
+
+
+def test_exhausted_flag_is_cleared_when_cursor_or_range_changes(queue, redis_client):
+    ch_client = SeedClickHouse(range(1, 6))
+    seeds = create_seeds(redis_client, ch_client)
+    queue.fill(seeds)
+    assert queue.is_exhausted(seeds)
+
+    # 游标被重置：重新入队
+    seeds.commit(2)
+    assert not queue.is_exhausted(seeds)
+    assert queue.fill(seeds) == 2
+
+    # 区间上限变了：同一个游标也要重新判断
+    ch_client.ids += [6, 7]
+    wider = create_seeds(redis_client, ch_client, stop_at=7)
+    assert not queue.is_exhausted(wider)
+    assert queue.fill(wider) == 1
+    assert queue.is_exhausted(wider)
+
+
+def test_leases_until_drained(queue, redis_client):
+    seeds = create_seeds(redis_client, SeedClickHouse(range(1, 6)))
+
+    async def crawl():
+        seen = []
+        async for lease in queue.leases(seeds, idle_sleep=0):
+            seen.extend(lease.user_ids)
+            queue.ack(lease)
+        return seen
+
+    assert asyncio.run(crawl()) == [1, 2, 3, 4, 5]
+    assert queue.drained(seeds)